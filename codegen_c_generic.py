@@ -61,9 +61,12 @@ import time
 import types
 import os
 import tempfile
+import stat
+import glob
 from ncptl_ast import AST
 from ncptl_error import NCPTL_Error
 from ncptl_variables import Variables
+from ncptl_cache import NCPTL_Cache, md5
 from ncptl_config import ncptl_config
 
 
@@ -138,6 +141,11 @@ class NCPTL_CodeGen:
         # array should be defined in the generated code.
         self.define_eventnames = 0
 
+        # Enable a derived backend to indicate that the event list
+        # must not be compacted (i.e., that every allocated event must
+        # be processed exactly as allocated).
+        self.compact_events = 1
+
         # Set some default compilation parameters.
         self.compilation_parameters = {}
         exec_prefix = self.get_param("exec_prefix", "")
@@ -153,6 +161,15 @@ class NCPTL_CodeGen:
         if libdir:
             self.set_param("LDFLAGS", "prepend", "-L%s" % libdir)
         self.set_param("LIBS", "prepend", "-lncptl")
+        self.runtime_files = []
+        if includedir:
+            self.runtime_files.extend(glob.glob(os.path.join(includedir, "ncptl", "*.h")))
+        if libdir:
+            self.runtime_files.extend(glob.glob(os.path.join(libdir, "libncptl*")))
+
+        # Reuse previously compiled object files and executables
+        # unless told otherwise.
+        self.use_cache = 1
 
         # Point each method name in the trivial_nodes list to the
         # n_trivial_node method.
@@ -163,6 +180,7 @@ class NCPTL_CodeGen:
         "Compile an AST into a list of lines of C code."
         self.filesource = filesource       # Input file
         self.sourcecode = sourcecode       # coNCePTuaL source code
+        self.generation_time = time.asctime(time.localtime(time.time()))   # Time stamp for the header comment
         self.codestack = []                # Stack of unprocessed metadata
         self.global_declarations = []      # Extra global variable declarations
         self.backend_declarations = []     # Declarations from BACKEND DECLARES statements
@@ -364,10 +382,42 @@ class NCPTL_CodeGen:
         else:
             return alternate
 
+    def intercept_node_funcs(self, someclass):
+        """
+           Modify all of the n_* methods (except hooks) in a class
+           and all its parent classes so as to store the node being
+           processed in self.current_node before doing anything
+           else.  Backends that stack atop another backend (e.g.,
+           c_trace and c_profile) use this to learn which source
+           lines produced each event.  n_* methods defined by the
+           object's own class are left alone; they are expected to
+           set current_node themselves.
+        """
+        for baseclass in someclass.__bases__:
+            self.intercept_node_funcs(baseclass)
+        for method_name, method_body in someclass.__dict__.items():
+            if self.__class__.__dict__.has_key(method_name):
+                continue
+            if type(method_body)==types.FunctionType and re.match(r'n_[a-z_]+$', method_name):
+                # Closure kludge -- work around Python's lack of true
+                # closures (and lack of anything even remotely like a
+                # closure in Python 1.5).
+                class CloKlu:
+                    def __init__(self, trueself, method_name, method_body):
+                        self.trueself = trueself
+                        self.method_name = method_name
+                        self.method_body = method_body
+                        setattr(trueself, method_name, self.store_node)
+
+                    def store_node(self, node):
+                        self.trueself.current_node = node
+                        return self.method_body(self.trueself, node)
+                CloKlu(self, method_name, method_body)
+
     def do_compile(self, progfilename, codelines, outfilename, verbose=0, keepints=0, link=1):
         """
-            Compile and optionally link a list of lines of C code into
-            an object file or executable file.
+            Compile and optionally link a list (or other iterable) of
+            lines of C code into an object file or executable file.
         """
         exe_ext = self.get_param("EXEEXT", "")
         if exe_ext:
@@ -425,10 +475,35 @@ class NCPTL_CodeGen:
             compile_string = ("%s %s %s -c %s -o %s" %
                               (CC, CPPFLAGS, CFLAGS, infilename, outfilename))
 
+        # We don't bother with the build cache if the user wants to
+        # see the intermediate files.  Otherwise, hash the code as we
+        # write it so CODELINES needs to be traversed only once.  The
+        # time stamp in the header comment is not considered part of
+        # the code.
+        cache = None
+        codehasher = None
+        if self.use_cache and not keepints:
+            cache = NCPTL_Cache()
+            codehasher = md5()
+        try:
+            timestamp = self.generation_time
+        except AttributeError:
+            timestamp = None
+
         # Copy CODELINES to a .c file.
         try:
             infile = open(infilename, "w")
+            firstline = 1
             for oneline in codelines:
+                if codehasher:
+                    hashline = oneline
+                    if timestamp and string.find(oneline, timestamp) != -1:
+                        hashline = string.replace(oneline, timestamp, "", 1)
+                        timestamp = None
+                    if not firstline:
+                        codehasher.update("\n")
+                    codehasher.update(hashline)
+                    firstline = 0
                 if string.find(oneline, "ncptl_log_open") != -1:
                     # Add an extra log-file prologue comment showing
                     # the ncptl command line.
@@ -455,6 +530,24 @@ class NCPTL_CodeGen:
             self.errmsg.error_fatal("Unable to produce %s (%s)" % (infilename, strerror),
                                     filename=self.backend_name)
 
+        # If we've already compiled exactly the same code with exactly
+        # the same tools then simply reuse the result.
+        if cache:
+            cachekey = cache.make_build_key([self.backend_name, str(link),
+                                             CC, CPPFLAGS, CFLAGS, LDFLAGS, LIBS,
+                                             string.join(sys.argv, "\0")] +
+                                            self.toolchain_signature(CC) +
+                                            [codehasher.hexdigest()])
+            if cache.load_file(cachekey, outfilename):
+                try:
+                    os.unlink(infilename)
+                except OSError:
+                    pass
+                if verbose:
+                    sys.stderr.write("# Reusing the cached build of %s ...\n" % outfilename)
+                    sys.stderr.write("# Files generated: %s\n" % outfilename)
+                return outfilename
+
         # Indent the .c file for aesthetic purposes.
         indentcmd = self.get_param("INDENT", "no")
         if indentcmd != "no" and keepints:
@@ -477,6 +570,8 @@ class NCPTL_CodeGen:
             sys.stderr.write("%s\n" % compile_string)
         if os.system(compile_string) != 0:
             self.errmsg.error_fatal("The C compiler exited abnormally; aborting coNCePTuaL")
+        if cache:
+            cache.store_file(cachekey, outfilename)
         for deletable in intermediates:
             if os.path.isfile(deletable):
                 if keepints:
@@ -493,6 +588,28 @@ class NCPTL_CodeGen:
             sys.stderr.write("# Files generated: %s\n" % outfilename)
         return outfilename
 
+    def toolchain_signature(self, CC):
+        """
+             Return a list of strings that change whenever the C
+             compiler or the installed run-time library changes.
+        """
+        signature = []
+        compiler = string.split(CC + " cc")[0]
+        if os.path.dirname(compiler) == "":
+            for pathdir in string.split(os.environ.get("PATH", ""), os.pathsep):
+                if os.path.isfile(os.path.join(pathdir, compiler)):
+                    compiler = os.path.join(pathdir, compiler)
+                    break
+        for filename in [compiler] + self.runtime_files:
+            try:
+                statinfo = os.stat(filename)
+                signature.append("%s:%d:%d" % (filename,
+                                               statinfo[stat.ST_SIZE],
+                                               statinfo[stat.ST_MTIME]))
+            except OSError:
+                signature.append(filename)
+        return signature
+
     def postorder_traversal(self, node):
         "Perform a postorder traversal of an abstract syntax tree."
         for kid in node.kids:
@@ -2020,7 +2137,7 @@ class NCPTL_CodeGen:
         self.pushmany([
             "/" + "*" * 70,
             " * This file was generated by coNCePTuaL on %s" %
-            time.asctime(time.localtime(time.time())),
+            self.generation_time,
             " * using the %s backend (%s)." %
             (self.backend_name, self.backend_desc),
             " * Do not modify this file; modify %s instead." % inputfile] +
@@ -2638,11 +2755,125 @@ class NCPTL_CodeGen:
         self.pushmany(self.invoke_hook("code_def_alloc_event_DECLS", locals()))
         self.push("")
         self.pushmany(self.invoke_hook("code_def_alloc_event_PRE", locals()))
+        if self.compact_events:
+            # conc_compact_events() compares entire events.
+            self.push("memset ((void *) newevent, 0, sizeof (CONC_EVENT));")
         self.push("newevent->type = type;")
         self.pushmany(self.invoke_hook("code_def_alloc_event_POST", locals()))
         self.push("return newevent;")
         self.push("}")
 
+    def code_def_compact_events(self, node):
+        "Declare a function to compact the event list."
+        self.pushmany([
+            "/* Compact the event list by removing events that cannot affect any",
+            " * task and by replacing long runs of identical send or receive",
+            " * events with a single, repeated event. */",
+            "static void conc_compact_events (void)",
+            "{",
+            "CONC_EVENT *eventlist = (CONC_EVENT *) ncptl_queue_contents (eventqueue, 0);   /* List of events to compact */",
+            "ncptl_int numevents = ncptl_queue_length (eventqueue);   /* Number of entries in eventlist[] */",
+            "ncptl_int *newindex;   /* Map from an old event index to a new one */",
+            "char *endsrepeat;      /* 1=event is the last in a REPEAT event's range */",
+            "CONC_EVENT runev;      /* Copy of the event being repeated */",
+            "ncptl_int i, j, k;",
+            "",
+            "if (numevents == 0)",
+            "return;",
+            "newindex = (ncptl_int *) ncptl_malloc (numevents*sizeof(ncptl_int), 0);",
+            "endsrepeat = (char *) ncptl_malloc (numevents, 0);",
+            "memset ((void *) endsrepeat, 0, numevents);",
+            "for (i=0; i<numevents; i++)",
+            "if (eventlist[i].type == EV_REPEAT)",
+            "endsrepeat[eventlist[i].s.rep.end_event] = 1;",
+            "",
+            " /* Move every event we keep to its new position.  An event that",
+            "  * we drop maps to the new position of the preceding event so",
+            "  * that a range of events ending with it remains valid. */",
+            "for (i=0, j=0; i<numevents; i=k) {",
+            "k = i + 1;",
+            "switch (eventlist[i].type) {",
+            "case EV_NEWSTMT:",
+            " /* A new statement that immediately follows another new",
+            "  * statement has no table to begin. */",
+            "if (i > 0 && eventlist[i-1].type == EV_NEWSTMT) {",
+            "newindex[i] = j - 1;",
+            "continue;",
+            "}",
+            "break;",
+            "",
+            "case EV_DELAY:",
+            " /* Spinning for zero microseconds does nothing. */",
+            "if (eventlist[i].s.delay.microseconds == 0 && eventlist[i].s.delay.spin0sleep1 == 0) {",
+            "newindex[i] = j - 1;",
+            "continue;",
+            "}",
+            "break;",
+            "",
+            "case EV_SEND:",
+            "case EV_RECV:",
+            " /* Replace a run of identical events that is too long to have",
+            "  * been unrolled deliberately with a REPEAT event.  The run may",
+            "  * not extend past the end of another REPEAT event's range. */",
+            "while (k < numevents && !endsrepeat[k-1]",
+            "&& !memcmp ((void *) &eventlist[i], (void *) &eventlist[k], sizeof (CONC_EVENT)))",
+            "k++;",
+            "if (k - i > CONC_MAX_UNROLL) {",
+            "runev = eventlist[i];",
+            "eventlist[j] = runev;",
+            "eventlist[j].type = EV_REPEAT;",
+            "eventlist[j].s.rep.end_event = k - 1;   /* Old index; remapped below */",
+            "eventlist[j].s.rep.numreps = k - i;",
+            "eventlist[j+1] = runev;",
+            "for (; i<k; i++)",
+            "newindex[i] = j + 1;",
+            "j += 2;",
+            "continue;",
+            "}",
+            "k = i + 1;",
+            "break;",
+            "",
+            "default:",
+            "break;",
+            "}",
+            "newindex[i] = j;",
+            "if (j != i)",
+            "eventlist[j] = eventlist[i];",
+            "j++;",
+            "}",
+            "",
+            " /* Update every reference from one event to another. */",
+            "for (i=0; i<j; i++)",
+            "switch (eventlist[i].type) {",
+            "case EV_REPEAT:",
+            "eventlist[i].s.rep.end_event = newindex[eventlist[i].s.rep.end_event];",
+            "break;",
+            "",
+            "case EV_ETIME:",
+            "eventlist[i].s.etime.begin_event = newindex[eventlist[i].s.etime.begin_event];",
+            "break;",
+            "",
+            "case EV_SUPPRESS:",
+            "if (!eventlist[i].s.suppress.quiet)",
+            "eventlist[i].s.suppress.matching_event = newindex[eventlist[i].s.suppress.matching_event];",
+            "break;",
+            "",
+            "case EV_WAIT:",
+            "for (k=0; k<eventlist[i].s.wait.numtouches; k++)",
+            "eventlist[i].s.wait.touchedlist[k] = newindex[eventlist[i].s.wait.touchedlist[k]];",
+            "break;",
+            "",
+            "default:",
+            "break;",
+            "}",
+            "",
+            " /* Discard the now-unused events at the end of the list. */",
+            "while (ncptl_queue_length (eventqueue) > j)",
+            "(void) ncptl_queue_pop_tail (eventqueue);",
+            "ncptl_free (endsrepeat);",
+            "ncptl_free (newindex);",
+            "}"])
+
     def code_def_exit_handler(self, node):
         "Declare an exit handler that gets called by exit()."
         self.pushmany([
@@ -2944,6 +3175,11 @@ class NCPTL_CodeGen:
                       "EV_ARECV":  "recv",
                       "EV_MCAST":  "mcast",
                       "EV_REDUCE": "reduce"}
+        if self.compact_events:
+            self.pushmany([
+                " /* Compact the event list before we process it. */",
+                "conc_compact_events ();",
+                ""])
         self.pushmany([
             " /* Allocate memory for non-unique messages and asynchronous",
             "  * message handles now that we know how much memory we need",
@@ -3129,6 +3365,9 @@ class NCPTL_CodeGen:
         self.push("")
         self.code_def_alloc_event(node)
         self.push("")
+        if self.compact_events:
+            self.code_def_compact_events(node)
+            self.push("")
         self.code_def_exit_handler(node)
         self.push("")
 
@@ -3804,6 +4043,11 @@ class NCPTL_CodeGen:
                 self.errmsg.error_fatal("The --%s option is predefined and therefore not available to programs" % longname)
             longname_list[longname] = 1
 
+        # Compacting the event list may introduce REPEAT events.
+        if self.compact_events and (self.events_used.has_key("EV_SEND") or
+                                    self.events_used.has_key("EV_RECV")):
+            self.events_used["EV_REPEAT"] = 1
+
         # Output some boilerplate header text.
         self.code_output_header_comments(node)
         self.push("")
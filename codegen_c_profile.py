@@ -56,8 +56,7 @@
 
 import sys
 import re
-import types
-import new
+import string
 from ncptl_error import NCPTL_Error
 
 class NCPTL_CodeGen:
@@ -106,16 +105,136 @@ class NCPTL_CodeGen:
             self.name2class["c_profile"] = self.__class__
         self.c_profile_parent = self.name2class["c_profile"].__bases__[0]
         immediate_ancestor.__init__(self, leftover_opts)
+        self.intercept_node_funcs(self.name2class["c_profile"])
         self.define_eventnames = 1
+        self.compact_events = 0      # We profile every event as allocated.
         self.backend_name = "c_profile + " + self.backend_name
         self.backend_desc = "event profiler atop " + self.backend_desc
 
+        # Assign each combination of event type and source-code lines
+        # its own latency histogram.
+        self.profslots = {}
+        self.profslotlist = []
+
 
     # ---------------------- #
     # (Re)implementation of  #
     # hook and other methods #
     # ---------------------- #
 
+    def code_allocate_event(self, event_type, stack=None,
+                            declare="CONC_EVENT *thisev ="):
+        "Allocate an event and note the latency histogram it belongs to."
+        node = self.current_node
+        slotkey = (event_type, node.lineno0, node.lineno1)
+        try:
+            slot = self.profslots[slotkey]
+        except KeyError:
+            slot = len(self.profslotlist)
+            self.profslots[slotkey] = slot
+            self.profslotlist.append(slotkey)
+        allocation = []
+        self.c_profile_parent.code_allocate_event(self, event_type, allocation, declare)
+        for oneline in allocation:
+            self.push(string.replace(oneline,
+                                     "conc_allocate_event (%s)" % event_type,
+                                     "(profslot=%d, conc_allocate_event (%s))" % (slot, event_type)),
+                      stack)
+
+    def code_define_macros_POST(self, localvars):
+        "Define the shape of the latency histograms."
+        newcode = self.invoke_hook("code_define_macros_POST", localvars,
+                                   invoke_on=self.c_profile_parent)
+        self.pushmany([
+            "/* Define the number of latency histograms and the number of buckets",
+            " * in each.  Buckets are logarithmic with four buckets per power of",
+            " * two, which is enough to represent any uint64_t. */",
+            "#define PROF_SLOTS %d" % max(len(self.profslotlist), 1),
+            "#define PROF_BUCKETS 252"],
+                      stack=newcode)
+        return newcode
+
+    def code_declare_datatypes_EXTRA_EVENT_STATE(self, localvars):
+        "Associate a latency histogram with every event."
+        newdecls = []
+        self.code_declare_var(type="int", name="profslot",
+                              comment="Index into profhistograms[] for this event",
+                              stack=newdecls)
+        return newdecls + self.invoke_hook("code_declare_datatypes_EXTRA_EVENT_STATE",
+                                           localvars, invoke_on=self.c_profile_parent)
+
+    def code_def_alloc_event_POST(self, localvars):
+        "Store the current histogram index in every event."
+        return (["newevent->profslot = profslot;"] +
+                self.invoke_hook("code_def_alloc_event_POST", localvars,
+                                 invoke_on=self.c_profile_parent))
+
+    def code_define_functions_PRE(self, localvars):
+        "Define functions for manipulating latency histograms."
+        newcode = self.invoke_hook("code_define_functions_PRE", localvars,
+                                   invoke_on=self.c_profile_parent)
+        self.pushmany([
+            "/* Map a latency to a histogram bucket. */",
+            "static int conc_prof_bucket (uint64_t usecs)",
+            "{",
+            "int msb;   /* Position of the most significant 1 bit in usecs */",
+            "",
+            "if (usecs < 4)",
+            "return (int) usecs;",
+            "#ifdef __GNUC__",
+            "msb = 63 - __builtin_clzll ((unsigned long long) usecs);",
+            "#else",
+            "for (msb=2; usecs>>(msb+1); msb++)",
+            ";",
+            "#endif",
+            "return 4*(msb-1) + (int)((usecs>>(msb-2)) & 3);",
+            "}",
+            "",
+            "/* Return the largest latency that maps to a given histogram bucket. */",
+            "static ncptl_int conc_prof_bucket_max (int bucket)",
+            "{",
+            "int msb = bucket/4 + 1;   /* Position of the most significant 1 bit */",
+            "",
+            "if (bucket < 4)",
+            "return (ncptl_int) bucket;",
+            "return (ncptl_int) ((((uint64_t)(4 + bucket%4 + 1)) << (msb-2)) - 1);",
+            "}",
+            "",
+            "/* Return a given percentile (expressed in tenths of a percent) of",
+            " * a latency histogram containing a given number of entries. */",
+            "static ncptl_int conc_prof_percentile (ncptl_int *histogram, ncptl_int tally, ncptl_int permille)",
+            "{",
+            "ncptl_int target = (tally*permille + 999) / 1000;   /* Number of entries at or below the percentile */",
+            "ncptl_int seen = 0;   /* Number of entries in all buckets so far */",
+            "int bucket;",
+            "",
+            "if (target < 1)",
+            "target = 1;",
+            "for (bucket=0; bucket<PROF_BUCKETS-1; bucket++) {",
+            "seen += histogram[bucket];",
+            "if (seen >= target)",
+            "break;",
+            "}",
+            "return conc_prof_bucket_max (bucket);",
+            "}",
+            "",
+            "/* Measure the overhead of reading the timer, which we subtract from",
+            " * every latency we record. */",
+            "static void conc_prof_calibrate (void)",
+            "{",
+            "uint64_t starttime, stoptime;",
+            "int trial;",
+            "",
+            "starttime = ncptl_time();",
+            "for (trial=0; trial<1000; trial++)",
+            "(void) ncptl_time();",
+            "stoptime = ncptl_time();",
+            "proftimeroverhead = (stoptime - starttime + 500) / 1000;",
+            "}",
+            ""],
+                      stack=newcode)
+        return newcode
+
     def code_declare_globals_EXTRA(self, localvars):
         "Declare a few arrays to store profile data."
         newcode = self.invoke_hook("code_declare_globals_EXTRA", localvars,
@@ -128,14 +247,45 @@ class NCPTL_CodeGen:
                               type="static ncptl_int",
                               comment="Number of times each event was executed",
                               stack=newcode)
+        self.code_declare_var(name="profhistograms", arraysize="PROF_SLOTS][PROF_BUCKETS",
+                              type="static ncptl_int",
+                              comment="Latency histogram for each event type and source line",
+                              stack=newcode)
+        self.code_declare_var(name="proftimeroverhead", type="static uint64_t",
+                              comment="Microseconds to subtract from each latency",
+                              stack=newcode)
+        self.code_declare_var(name="profslot", type="static int",
+                              comment="Histogram to associate with the next event allocated",
+                              stack=newcode)
+        slotlist = self.profslotlist or [("EV_CODE", 0, 0)]
+        self.code_declare_var(name="profslottypes", arraysize="PROF_SLOTS",
+                              type="static const int",
+                              rhs="{%s}" % string.join(map(lambda s: s[0], slotlist), ", "),
+                              comment="Event type associated with each histogram",
+                              stack=newcode)
+        self.code_declare_var(name="profslotlines", arraysize="PROF_SLOTS",
+                              type="static const char *",
+                              rhs="{%s}" % string.join(map(self.profile_line_range, slotlist), ", "),
+                              comment="Source lines associated with each histogram",
+                              stack=newcode)
         return newcode
 
+    def profile_line_range(self, slotkey):
+        "Return a C string describing the source lines associated with a histogram."
+        event_type, lineno0, lineno1 = slotkey
+        if lineno0 == lineno1:
+            return '"%d"' % lineno0
+        else:
+            return '"%d-%d"' % (lineno0, lineno1)
+
     def code_define_main_POST_INIT(self, localvars):
         "Initialize the profile data."
         newcode = self.invoke_hook("code_define_main_POST_INIT", localvars,
                                    invoke_on=self.c_profile_parent)
         self.push("memset ((void *)profeventtimings, 0, sizeof(ncptl_int)*(EV_CODE+1));", newcode);
         self.push("memset ((void *)profeventtallies, 0, sizeof(ncptl_int)*(EV_CODE+1));", newcode);
+        self.push("memset ((void *)profhistograms, 0, sizeof(ncptl_int)*PROF_SLOTS*PROF_BUCKETS);", newcode);
+        self.push("conc_prof_calibrate();", newcode);
         return newcode
 
     def code_def_procev_EVENTS_DECL(self, localvars):
@@ -145,6 +295,12 @@ class NCPTL_CodeGen:
         self.code_declare_var(name="eventtype", rhs="thisev->type",
                               comment="Preserved copy of thisev->type in case EV_REPEAT alters thisev",
                               stack=newcode)
+        self.code_declare_var(name="eventslot", type="int", rhs="thisev->profslot",
+                              comment="Preserved copy of thisev->profslot in case EV_REPEAT alters thisev",
+                              stack=newcode)
+        self.code_declare_var(name="eventlatency", type="uint64_t",
+                              comment="Time taken by the current event",
+                              stack=newcode)
         self.code_declare_var(name="eventstarttime", rhs="ncptl_time()",
                               comment="Time at which the current event began executing",
                               stack=newcode)
@@ -154,9 +310,16 @@ class NCPTL_CodeGen:
         "Accumulate the time taken by the current event."
         newcode = self.invoke_hook("code_def_procev_POST_SWITCH", localvars,
                                    invoke_on=self.c_profile_parent)
-        self.push("profeventtimings[eventtype] += ncptl_time() - eventstarttime;",
-                  stack=newcode)
-        self.push("profeventtallies[eventtype]++;", stack=newcode)
+        self.pushmany([
+            "eventlatency = ncptl_time() - eventstarttime;",
+            "profeventtimings[eventtype] += eventlatency;",
+            "profeventtallies[eventtype]++;",
+            "if (profslottypes[eventslot] == eventtype) {",
+            " /* Events synthesized at run time don't have a histogram. */",
+            "eventlatency = eventlatency > proftimeroverhead ? eventlatency - proftimeroverhead : 0;",
+            "profhistograms[eventslot][conc_prof_bucket(eventlatency)]++;",
+            "}"],
+                      stack=newcode)
         return newcode
 
     def code_def_finalize_DECL(self, localvars):
@@ -173,6 +336,15 @@ class NCPTL_CodeGen:
         self.profloopvar = self.code_declare_var(type="int", suffix="ev",
                                                  comment="Loop over event types",
                                                  stack=newcode)
+        self.profslotvar = self.code_declare_var(type="int", suffix="slot",
+                                                 comment="Loop over latency histograms",
+                                                 stack=newcode)
+        self.code_declare_var(name="slottally",
+                              comment="Number of entries in the current latency histogram",
+                              stack=newcode)
+        self.code_declare_var(name="bucket", type="int",
+                              comment="Loop over histogram buckets",
+                              stack=newcode)
         self.code_declare_var(name="numevents",
                               rhs="ncptl_queue_length (eventqueue)",
                               comment="Total number of events processed",
@@ -184,6 +356,30 @@ class NCPTL_CodeGen:
         newcode = self.invoke_hook("code_def_finalize_PRE", localvars,
                                    invoke_on=self.c_profile_parent)
         profloopvar = self.profloopvar
+        profslotvar = self.profslotvar
+        self.pushmany([
+            "for (%s=0; %s<PROF_SLOTS; %s++) {" % ((profslotvar,) * 3),
+            "slottally = 0;",
+            "for (bucket=0; bucket<PROF_BUCKETS; bucket++)",
+            "slottally += profhistograms[%s][bucket];" % profslotvar,
+            "if (!slottally)",
+            "continue;"],
+                      stack=newcode)
+        histargs = (("profhistograms[%s], slottally" % profslotvar,) * 3)
+        if self.program_uses_log_file:
+            self.pushmany([
+                'sprintf (profilekey, "Profile of %%s latency at line %%s (p50, p99, p99.9 microseconds, count)", eventnames[profslottypes[%s]], profslotlines[%s]);' %
+                (profslotvar, profslotvar),
+                'sprintf (profilevalue, "%%" NICS " %%" NICS " %%" NICS " %%" NICS, conc_prof_percentile (%s, 500), conc_prof_percentile (%s, 990), conc_prof_percentile (%s, 999), slottally);' %
+                histargs,
+                "ncptl_log_add_comment (profilekey, profilevalue);"],
+                          stack=newcode)
+        else:
+            self.pushmany([
+                'fprintf (stderr, "%%d latency %%s %%s %%" NICS " %%" NICS " %%" NICS " %%" NICS "\\n", physrank, eventnames[profslottypes[%s]], profslotlines[%s], conc_prof_percentile (%s, 500), conc_prof_percentile (%s, 990), conc_prof_percentile (%s, 999), slottally);' %
+                ((profslotvar, profslotvar) + histargs)],
+                          stack=newcode)
+        self.push("}", stack=newcode)
         if self.program_uses_log_file:
             # Write to the log file.
             self.pushmany([
@@ -207,7 +403,7 @@ class NCPTL_CodeGen:
                 'fprintf (stderr, "%%d %%s %%" NICS " %%" NICS " %%.1f\\n", physrank, eventnames[%s], profeventtimings[%s], profeventtallies[%s], (double)profeventtimings[%s]/(double)profeventtallies[%s]);' %
                 (profloopvar, profloopvar, profloopvar, profloopvar, profloopvar),
                 "}",
-                'fprintf (stderr, "%d event-memory %" NICS " %" NICS " %" NICS "\n",',
+                'fprintf (stderr, "%d event-memory %" NICS " %" NICS " %" NICS "\\n",',
                 "physrank, numevents*sizeof(CONC_EVENT), numevents, (ncptl_int)sizeof(CONC_EVENT));"],
                           stack=newcode)
         return newcode
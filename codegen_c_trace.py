@@ -56,7 +56,6 @@
 
 import sys
 import re
-import types
 import new
 from ncptl_error import NCPTL_Error
 
@@ -70,10 +69,14 @@ class NCPTL_CodeGen:
         leftover_opts = []
         target_backend = ""
         self.use_curses = 0
+        self.trace_format = "text"
         for arg in range(0, len(options)):
             trace_match = re.match(r'--trace=(.*)', options[arg])
+            format_match = re.match(r'--trace-format=(.*)', options[arg])
             if trace_match:
                 target_backend = trace_match.group(1)
+            elif format_match:
+                self.trace_format = format_match.group(1)
             elif options[arg] == "--curses":
                 self.use_curses = 1
             elif options[arg] == "--help":
@@ -83,6 +86,9 @@ class NCPTL_CodeGen:
                 generic_self.backend_name = self.backend_name
                 generic_self.cmdline_options.extend([
                     ("--trace=<string>", "Specify a backend to trace"),
+                    ("--trace-format=<string>",
+                     """Write the trace as "text" (default) or
+                                  "binary" records"""),
                     ("--curses",
                      """Display the trace with curses instead of with
                                   fprintf()""")])
@@ -92,6 +98,10 @@ class NCPTL_CodeGen:
                 leftover_opts.append(options[arg])
         if not target_backend:
             self.errmsg.error_fatal("a target backend must be specified using --trace")
+        if self.trace_format not in ["text", "binary"]:
+            self.errmsg.error_fatal('unrecognized trace format "%s"' % self.trace_format)
+        if self.use_curses and self.trace_format == "binary":
+            self.errmsg.error_fatal("--curses and --trace-format=binary are mutually exclusive")
 
         # Reparent ourselves to the traced backend.
         try:
@@ -116,6 +126,7 @@ class NCPTL_CodeGen:
         if self.use_curses:
             self.set_param("LIBS", "prepend", "-lcurses")
         self.define_eventnames = 1
+        self.compact_events = 0      # We trace every event as allocated.
         self.backend_name = "c_trace + " + self.backend_name
         self.backend_desc = "event tracer atop " + self.backend_desc
 
@@ -139,36 +150,19 @@ class NCPTL_CodeGen:
                                                  "B",
                                                  "Source line at which to enter single-stepping mode (-1=none; 0=first event)",
                                                  "-1")])
-
-    def intercept_node_funcs(self, someclass):
-        """
-           Modify all of the n_* methods (except hooks) in a class
-           and all its parent classes so as to invoke store_node
-           before doing anything else.
-        """
-        for baseclass in someclass.__bases__:
-            self.intercept_node_funcs(baseclass)
-        for method_name, method_body in someclass.__dict__.items():
-            if self.__class__.__dict__.has_key(method_name):
-                # The n_* methods defined in this file already do the
-                # equivalent of store_node so there's no need to
-                # modify them.
-                continue
-            if type(method_body)==types.FunctionType and re.match(r'n_[a-z_]+$', method_name):
-                # Closure kludge -- work around Python's lack of true
-                # closures (and lack of anything even remotely like a
-                # closure in Python 1.5).
-                class CloKlu:
-                    def __init__(self, trueself, method_name, method_body):
-                        self.trueself = trueself
-                        self.method_name = method_name
-                        self.method_body = method_body
-                        setattr(trueself, method_name, self.store_node)
-
-                    def store_node(self, node):
-                        self.trueself.current_node = node
-                        return self.method_body(self.trueself, node)
-                CloKlu(self, method_name, method_body)
+        elif self.trace_format == "binary":
+            self.base_global_parameters.extend([("NCPTL_TYPE_STRING",
+                                                 "tracefiletmpl",
+                                                 "tracefile",
+                                                 "F",
+                                                 "Binary trace-file template",
+                                                 "OVERWRITTEN"),
+                                                ("NCPTL_TYPE_INT",
+                                                 "tracebuffer",
+                                                 "tracebuffer",
+                                                 "Z",
+                                                 "Number of trace records to buffer in memory",
+                                                 "65536")])
 
 
     # ---------------------- #
@@ -182,6 +176,8 @@ class NCPTL_CodeGen:
                                         localvars, invoke_on=self.c_trace_parent)
         if self.use_curses:
             self.push("#include <curses.h>", includefiles)
+        if self.trace_format == "binary":
+            self.push("#include <errno.h>", includefiles)
         return includefiles
 
     def code_declare_datatypes_EXTRA_EVENT_STATE(self, localvars):
@@ -200,6 +196,26 @@ class NCPTL_CodeGen:
                                                localvars, invoke_on=self.c_trace_parent)
         return newdecls
 
+    def code_declare_datatypes_POST(self, localvars):
+        "Declare the format of a binary trace record."
+        newdecls = []
+        if self.trace_format == "binary":
+            self.pushmany([
+                "/* Define a fixed-size binary trace record.  All fields are",
+                " * naturally aligned so the structure contains no padding. */",
+                "typedef struct {",
+                "uint64_t timestamp;   /* Time in microseconds at which the event began */",
+                "int64_t eventnum;     /* Index of the event in the event list (1-based) */",
+                "int32_t virtrank;     /* Task's current virtual rank */",
+                "int32_t type;         /* Event type (an index into the file's event names) */",
+                "int32_t firstline;    /* First line of source code corresponding to the event */",
+                "int32_t lastline;     /* Last line of source code corresponding to the event */",
+                "} CONC_TRACE_RECORD;"],
+                          stack=newdecls)
+        return newdecls + self.invoke_hook("code_declare_datatypes_POST",
+                                           localvars, invoke_on=self.c_trace_parent,
+                                           before=[""])
+
     def code_def_alloc_event_POST(self, localvars):
         "Add some tracing data to every event."
         return ([
@@ -225,6 +241,8 @@ class NCPTL_CodeGen:
         newcode = self.invoke_hook("code_define_main_PRE_EVENTS",
                                    localvars, invoke_on=self.c_trace_parent)
         self.push("totalevents = numevents;", newcode);
+        if self.trace_format == "binary":
+            self.push("conc_open_trace();", newcode)
         if self.use_curses:
             self.push("if (physrank == cursestask) {", newcode)
             self.code_declare_var(name="numevs",
@@ -322,6 +340,18 @@ class NCPTL_CodeGen:
                 "}",
                 "}"],
                           stack=newcode)
+        elif self.trace_format == "binary":
+            self.pushmany([
+                "if (tracerecordsused == tracebuffer)",
+                "conc_flush_trace();",
+                "tracerecords[tracerecordsused].timestamp = ncptl_time();",
+                "tracerecords[tracerecordsused].eventnum = (int64_t) (i+1);",
+                "tracerecords[tracerecordsused].virtrank = (int32_t) thisev->virtrank;",
+                "tracerecords[tracerecordsused].type = (int32_t) thisev->type;",
+                "tracerecords[tracerecordsused].firstline = (int32_t) thisev->firstline;",
+                "tracerecords[tracerecordsused].lastline = (int32_t) thisev->lastline;",
+                "tracerecordsused++;"],
+                          stack=newcode)
         else:
             self.pushmany([
                 'fprintf (stderr, "[TRACE] phys: %d | virt: %d | action: %s | event: %" NICS " / %" NICS " | lines: %d - %d\\n",',
@@ -360,6 +390,26 @@ class NCPTL_CodeGen:
                                   comment="Number of digits in var_num_tasks",
                                   stack=newvars)
 
+        if self.trace_format == "binary":
+            self.code_declare_var(type="char *", name="tracefiletmpl",
+                                  comment="Template for the binary trace file's name",
+                                  stack=newvars)
+            self.code_declare_var(type="char *", name="tracefiletmpl_default",
+                                  comment="Default value of the above",
+                                  stack=newvars)
+            self.code_declare_var(name="tracebuffer",
+                                  comment="Number of trace records to buffer in memory",
+                                  stack=newvars)
+            self.code_declare_var(type="CONC_TRACE_RECORD *", name="tracerecords",
+                                  comment="Buffer of trace records not yet written",
+                                  stack=newvars)
+            self.code_declare_var(name="tracerecordsused", rhs="0",
+                                  comment="Number of valid entries in tracerecords[]",
+                                  stack=newvars)
+            self.code_declare_var(type="FILE *", name="tracefile", rhs="NULL",
+                                  comment="Binary trace file",
+                                  stack=newvars)
+
         # Make all declarations static.
         static_newvars = []
         for var in newvars:
@@ -370,6 +420,97 @@ class NCPTL_CodeGen:
                                                            localvars, invoke_on=self.c_trace_parent)
         return static_newvars
 
+    def code_def_init_cmd_line_POST_ARGS(self, localvars):
+        "Name the binary trace file after the executable by default."
+        newcode = self.invoke_hook("code_def_init_cmd_line_POST_ARGS", localvars,
+                                   invoke_on=self.c_trace_parent)
+        if self.trace_format == "binary":
+            self.pushmany([
+                "tracefiletmpl_default = (char *) ncptl_malloc (strlen(argv0) + 15, 0);",
+                'sprintf (tracefiletmpl_default, "%s-%%p.trace", argv0);',
+                "arguments[%d].defaultvalue.stringval = tracefiletmpl_default;" %
+                localvars["short2index"]["F"]],
+                          stack=newcode)
+        return newcode
+
+    def code_define_functions_PRE(self, localvars):
+        "Define functions for writing binary trace files."
+        newcode = self.invoke_hook("code_define_functions_PRE", localvars,
+                                   invoke_on=self.c_trace_parent)
+        if self.trace_format != "binary":
+            return newcode
+        self.pushmany([
+            "/* Write all buffered trace records to the binary trace file. */",
+            "static void conc_flush_trace (void)",
+            "{",
+            "if (!tracefile || !tracerecordsused)",
+            "return;",
+            "if (fwrite ((void *)tracerecords, sizeof(CONC_TRACE_RECORD), (size_t)tracerecordsused, tracefile)",
+            "!= (size_t)tracerecordsused)",
+            'ncptl_fatal ("Failed to write to trace file \\"%s\\" (%s)", tracefiletmpl, strerror(errno));',
+            "tracerecordsused = 0;",
+            "}",
+            "",
+            "/* Open the binary trace file and write its header: a magic string,",
+            " * a format version, the size of a trace record, the physical rank",
+            " * and the number of events, and the names of all event types. */",
+            "static void conc_open_trace (void)",
+            "{",
+            "char *filename;   /* Name of the trace file */",
+            "char *tp, *fp;    /* Pointers into tracefiletmpl and filename */",
+            "int numprocnums = 0;   /* Number of %p's in the template */",
+            "uint32_t version = 1;   /* Format version */",
+            "uint32_t recordsize = (uint32_t) sizeof(CONC_TRACE_RECORD);   /* Bytes per record */",
+            "int64_t header[2];   /* Physical rank and number of events */",
+            "int32_t numevtypes = (int32_t) NUM_EVS;   /* Number of event names */",
+            "int evnum;",
+            "",
+            ' /* Replace each "%p" in the template with the processor number,',
+            "  * leaving room for a full-width number in each one. */",
+            "for (tp=tracefiletmpl; *tp; tp++)",
+            "if (tp[0] == '%' && tp[1] == 'p') {",
+            "numprocnums++;",
+            "tp++;",
+            "}",
+            "if (!numprocnums)",
+            'ncptl_fatal ("The trace-file template must contain a \\"%%p\\" (for processor number)");',
+            "filename = (char *) ncptl_malloc (strlen(tracefiletmpl) + numprocnums*25 + 1, 0);",
+            "for (tp=tracefiletmpl, fp=filename; *tp; tp++)",
+            "if (tp[0] == '%' && tp[1] == 'p') {",
+            'sprintf (fp, "%d", physrank);',
+            "fp += strlen(fp);",
+            "tp++;",
+            "}",
+            "else",
+            "*fp++ = *tp;",
+            "*fp = '\\0';",
+            "",
+            " /* Write the trace-file header. */",
+            'if (!(tracefile=fopen (filename, "wb")))',
+            'ncptl_fatal ("Unable to create trace file \\"%s\\" (%s)", filename, strerror(errno));',
+            "header[0] = (int64_t) physrank;",
+            "header[1] = (int64_t) totalevents;",
+            'if (fwrite ((void *)"NCPTLTRC", 1, 8, tracefile) != 8',
+            "|| fwrite ((void *)&version, sizeof(uint32_t), 1, tracefile) != 1",
+            "|| fwrite ((void *)&recordsize, sizeof(uint32_t), 1, tracefile) != 1",
+            "|| fwrite ((void *)header, sizeof(int64_t), 2, tracefile) != 2",
+            "|| fwrite ((void *)&numevtypes, sizeof(int32_t), 1, tracefile) != 1)",
+            'ncptl_fatal ("Failed to write to trace file \\"%s\\" (%s)", filename, strerror(errno));',
+            "for (evnum=0; evnum<NUM_EVS; evnum++)",
+            "if (fwrite ((void *)eventnames[evnum], 1, strlen(eventnames[evnum])+1, tracefile)",
+            "!= strlen(eventnames[evnum])+1)",
+            'ncptl_fatal ("Failed to write to trace file \\"%s\\" (%s)", filename, strerror(errno));',
+            "ncptl_free (filename);",
+            "",
+            " /* Allocate a buffer for trace records. */",
+            "if (tracebuffer < 1)",
+            'ncptl_fatal ("The trace buffer must hold at least one record");',
+            "tracerecords = (CONC_TRACE_RECORD *) ncptl_malloc (tracebuffer*sizeof(CONC_TRACE_RECORD), 0);",
+            "}",
+            ""],
+                      stack=newcode)
+        return newcode
+
     def code_def_init_decls_POST(self, localvars):
         "Declare extra variables needed within conc_initialize()."
         newdecls = self.invoke_hook("code_def_init_decls_POST", localvars,
@@ -427,10 +568,16 @@ class NCPTL_CodeGen:
         self.events_used[event_type] = 1
 
     def code_def_exit_handler_BODY(self, localvars):
-        "Shut down curses if necessary."
+        "Shut down curses or flush the binary trace if necessary."
         if self.use_curses:
             exitcode = ["if (physrank == cursestask)",
                         "(void) endwin();"]
+        elif self.trace_format == "binary":
+            exitcode = ["if (tracefile) {",
+                        "conc_flush_trace();",
+                        "(void) fclose (tracefile);",
+                        "tracefile = NULL;",
+                        "}"]
         else:
             exitcode = []
         exitcode = exitcode + self.invoke_hook("code_def_exit_handler_BODY",
@@ -63,7 +63,6 @@ import re
 import math
 import types
 import random
-import copy
 from ncptl_ast import AST
 from ncptl_error import NCPTL_Error
 from ncptl_variables import Variables
@@ -74,6 +73,20 @@ except ImportError:
     # Because we need it only to acquire the OS page size, it's not
     # critical; we can safely utilize a default page size.
     pass
+try:
+    import numpy
+except ImportError:
+    # NumPy is used only to evaluate SUCH THAT expressions over all
+    # tasks at once.  Without it we evaluate them one task at a time.
+    numpy = None
+try:
+    from collections import deque
+except ImportError:
+    # Jython 2.2 (used by the coNCePTuaL GUI) lacks collections.deque.
+    # Provide the subset of its functionality that we need.
+    class deque(list):
+        def popleft(self):
+            return self.pop(0)
 
 # To support the coNCePTuaL GUI (built using Jython) we need to make
 # some packages optional.
@@ -106,6 +119,11 @@ def ncptl_func_task_of(procmap, ptask, num_tasks):
 def ncptl_dfunc_task_of(procmap, ptask, num_tasks):
     return ncptl_func_task_of(procmap, int(ptask), num_tasks)
 
+# Indicate that a SUCH THAT expression can't be evaluated exactly over
+# a vector of tasks and must instead be evaluated one task at a time.
+class VectorizationError(Exception):
+    pass
+
 class NCPTL_CodeGen:
     thisfile = globals()["__file__"]
     bytes_per_int = long(1.0+math.log(sys.maxint+1.0)/math.log(2.0)) / 8L
@@ -121,7 +139,6 @@ class NCPTL_CodeGen:
         "header_decl",
         "version_decl",
         "simple_stmt_list",
-        "simple_stmt",
         "let_binding_list",
         "source_task",
         "target_tasks",
@@ -178,6 +195,57 @@ class NCPTL_CodeGen:
                 "recv_buffer_number",
                 "send_attrs",
                 "receive_attrs"]])
+    repeatable_operations = \
+        dict([(op, 1) for op in [
+                "SEND",
+                "RECEIVE",
+                "WAIT_ALL",
+                "SYNC",
+                "MCAST",
+                "REDUCE",
+                "SLEEP",
+                "COMPUTE",
+                "TOUCH"]])
+    vector_node_types = {
+        "rel_expr":         None,
+        "rel_primary_expr": None,
+        "rel_disj_expr":    None,
+        "rel_conj_expr":    None,
+        "expr":             None,
+        "expr_list":        None,
+        "primary_expr":     None,
+        "ifelse_expr":      None,
+        "power_expr":       None,
+        "eq_expr":          ["op_eq", "op_ne", "op_gt", "op_lt", "op_ge", "op_le",
+                             "op_divides", "op_odd", "op_even",
+                             "op_in_range", "op_not_in_range"],
+        "add_expr":         [None, "op_plus", "op_minus", "op_xor", "op_or"],
+        "mult_expr":        [None, "op_mult", "op_div", "op_mod",
+                             "op_shr", "op_shl", "op_and"],
+        "unary_expr":       [None, "op_pos", "op_neg", "op_not"],
+        "func_call":        ["ABS", "MIN", "MAX",
+                             "MESH_COORDINATE", "MESH_DISTANCE", "MESH_NEIGHBOR",
+                             "TREE_CHILD", "TREE_PARENT",
+                             "KNOMIAL_CHILD", "KNOMIAL_CHILDREN", "KNOMIAL_PARENT"]}
+    vector_limit = 2L**62     # Keep 64-bit vector arithmetic from overflowing.
+    compiled_node_types = [
+        "rel_expr",
+        "rel_primary_expr",
+        "rel_disj_expr",
+        "rel_conj_expr",
+        "eq_expr",
+        "where_expr",
+        "expr",
+        "primary_expr",
+        "ifelse_expr",
+        "add_expr",
+        "mult_expr",
+        "unary_expr",
+        "power_expr",
+        "integer",
+        "ident",
+        "my_task",
+        "real"]
 
 
     #---------------------#
@@ -185,29 +253,101 @@ class NCPTL_CodeGen:
     # represents an event #
     #---------------------#
 
-    class Event:
+    class Event(object):
+        # Events are numerous so we avoid a per-instance dictionary.
+        # Derived backends that annotate events with additional
+        # fields should derive a class from Event that lists those
+        # fields in its own __slots__.
+        __slots__ = ["operation", "task", "srclines", "peers", "msgsize",
+                     "tag", "blocking", "attributes", "collective_id",
+                     "latency", "posttime", "completetime", "found_match",
+                     "suppressed", "reduce_send_events"]
+        shared_tuples = {}      # Map from a tuple to a canonical copy of itself (replaced on every run)
+
         def __init__(self, operation, task, srclines, peers=None, msgsize=None,
                      tag=None, blocking=1, attributes=None, collective_id=None):
             "Define a new event, initially with no timing information."
-            self.operation = operation
+            self.operation = intern(operation)
             self.task = task
             self.srclines = srclines
-            if peers == None:
-                self.peers = []
-            else:
-                self.peers = peers
+            self.peers = self.share(peers)
             self.msgsize = msgsize
             self.tag = tag
             self.blocking = blocking
             if attributes == None:
-                self.attributes = []
+                self.attributes = ()
+            elif filter(lambda a: type(a) != types.StringType, attributes) == []:
+                # Message attributes are drawn from a small set of strings.
+                self.attributes = self.share(attributes)
             else:
-                self.attributes = attributes
+                self.attributes = tuple(attributes)
             self.collective_id = collective_id
+            self.latency = None         # Latency shared by a collective's participants
             self.posttime = None        # We don't know when we were posted.
             self.completetime = None    # We don't know when we completed.
             self.found_match = 0        # We haven't processed a matching event
 
+        def share(self, items):
+            """
+                 Convert a list of items -- or a list of lists of
+                 items -- to a tuple and return the canonical copy of
+                 that tuple so that identical peer lists are stored
+                 only once across all events.
+            """
+            if items == None:
+                return ()
+            shared_items = []
+            for item in items:
+                if type(item) in (types.ListType, types.TupleType):
+                    item = self.share(item)
+                shared_items.append(item)
+            shared_items = tuple(shared_items)
+            try:
+                return self.shared_tuples.setdefault(shared_items, shared_items)
+            except TypeError:
+                # Unhashable items can't be shared.
+                return shared_items
+
+        def peer_span(self):
+            """
+                 Return the lowest and highest task in the event's
+                 peer list -- or in either of its peer lists, for
+                 REDUCE events -- or None if the list is empty.
+            """
+            tasks = []
+            for item in self.peers:
+                if type(item) == types.TupleType:
+                    tasks.extend(item)
+                else:
+                    tasks.append(item)
+            if tasks == []:
+                return None
+            return (min(tasks), max(tasks))
+
+        def instantiate(self):
+            """
+                 Treat the current event as a template and return a
+                 new, not-yet-posted event with the same parameters.
+                 This is much faster than copy.deepcopy because the
+                 peer and attribute tuples are immutable and can be
+                 shared with the template.
+            """
+            event = self.__class__.__new__(self.__class__)
+            event.operation = self.operation
+            event.task = self.task
+            event.srclines = self.srclines
+            event.peers = self.peers
+            event.msgsize = self.msgsize
+            event.tag = self.tag
+            event.blocking = self.blocking
+            event.attributes = self.attributes
+            event.collective_id = self.collective_id
+            event.latency = self.latency
+            event.posttime = None
+            event.completetime = None
+            event.found_match = 0
+            return event
+
         def contents(self):
             "Return a tuple representing our internal state."
             return [self.operation, self.task, self.peers, self.msgsize,
@@ -230,6 +370,8 @@ class NCPTL_CodeGen:
             self.first_incomplete = 0   # Index of first incomplete event
             self.first_unposted = 0     # Index of first unposted event
             self.length = 0             # Number of entries in events[]
+            self.retired_tail = None    # Most recently retired event
+            self.retired_unmatched = [] # Retired SEND events not yet matched
 
         def all_complete(self):
             "Return 1 if all events have completed, 0 otherwise."
@@ -253,19 +395,22 @@ class NCPTL_CodeGen:
             while self.first_unposted < self.length:
                 event = self.events[self.first_unposted]
                 if self.first_unposted == 0:
+                    prev_event = self.retired_tail
+                else:
+                    prev_event = self.events[self.first_unposted-1]
+                if prev_event == None:
                     # First event posts immediately.
                     event.posttime = 0
                     self.first_unposted = self.first_unposted + 1
-                elif self.events[self.first_unposted-1].completetime != None:
+                elif prev_event.completetime != None:
                     # Post only after the previous event completes.
-                    prev_event = self.events[self.first_unposted-1]
                     event.posttime = prev_event.completetime + self.complete_post_overhead(prev_event, event)
                     self.first_unposted = self.first_unposted + 1
                 else:
                     # We can't complete anything else.
                     break
 
-        def complete(self, peerlist=None, nolat_peerlist=None):
+        def complete(self, peerlist=None, nolat_peerlist=None, peertime=None):
             '''
                  Mark the first incomplete event as completed and
                  return the completion time.  If a list of peer events
@@ -274,7 +419,10 @@ class NCPTL_CodeGen:
                  message latency of each of the peer events.  If a
                  list of "no latency" peer events is specified, do the
                  same thing but using the maximum of the completion
-                 times.
+                 times.  If the maximum time imposed by both lists is
+                 already known (as for collectives, which complete
+                 every participant with the same peer events), it can
+                 be passed as PEERTIME to avoid recomputing it.
             '''
             self.try_posting_all()
             this_ev = self.events[self.first_incomplete]
@@ -282,6 +430,11 @@ class NCPTL_CodeGen:
                 self.errmsg.error_internal("Task %d, event %d completed before being posted" %
                                            (this_ev.task, self.first_incomplete))
             newtime = this_ev.posttime + self.post_complete_overhead(this_ev)
+            if peertime != None:
+                # The caller already accounted for all peer events.
+                newtime = max(newtime, peertime)
+                peerlist = None
+                nolat_peerlist = None
             if peerlist != None:
                 # PEERLIST represents senders.
                 for peer_ev in peerlist:
@@ -296,6 +449,7 @@ class NCPTL_CodeGen:
                     newtime = max(newtime, peer_ev.posttime + self.post_complete_overhead(peer_ev))
             this_ev.completetime = newtime
             self.first_incomplete = self.first_incomplete + 1
+            self.parent.progressed_tasks[this_ev.task] = 1
             return newtime
 
         def post_complete_overhead(self, event):
@@ -314,38 +468,41 @@ class NCPTL_CodeGen:
 
         def message_latency(self, event):
             "Return the message latency for a given event."
-            # Determine the set of source tasks and the set of target tasks.
-            if event.operation == "REDUCE":
-                # REDUCE events -- peer list contains the source and
-                # target lists
-                source_tasks, target_tasks = event.peers
-            else:
-                # Other communication events -- peer list contains
-                # only the targets.
-                source_tasks = [event.task]
-                target_tasks = event.peers
-
-            # Compute the maximum latency from any source to any
-            # target and return that.
-            latency = -1
-            latency_list = self.parent.latency_list
-            for source in source_tasks:
-                for target in target_tasks:
-                    if source == target:
-                        latency = max(latency, latency_list[0][1])
-                    else:
-                        for taskcount, newlatency in latency_list:
-                            if source/taskcount == target/taskcount:
-                                # We're guaranteed to reach this point
-                                # because we added (numtasks, _) to the
-                                # end of latency_list.
-                                latency = max(latency, newlatency)
-                                break
+            latency = event.latency
+            if latency == None:
+                # Only point-to-point events compute their own latency.
+                latency = self.parent.event_latency(event)
             return latency
 
         def find_unmatched(self):
             "Return a list of events with no matching event."
-            return filter(lambda ev: not ev.found_match, self.events)
+            return filter(lambda ev: not ev.found_match,
+                          self.retired_unmatched + self.events)
+
+        def retire_completed(self):
+            """
+                 Discard all completed events (invoked when events are
+                 simulated incrementally).  The most recently completed
+                 event is remembered so the next event can be posted
+                 relative to it, and SEND events that no receive has
+                 yet matched are remembered so find_unmatched can
+                 still report them.  Return the number of events
+                 discarded.
+            """
+            numretired = self.first_incomplete
+            if numretired == 0:
+                return 0
+            self.retired_unmatched = filter(lambda ev: not ev.found_match,
+                                            self.retired_unmatched)
+            for event in self.events[:numretired]:
+                if event.operation == "SEND" and not event.found_match:
+                    self.retired_unmatched.append(event)
+            self.retired_tail = self.events[numretired-1]
+            del self.events[:numretired]
+            self.first_incomplete = 0
+            self.first_unposted = self.first_unposted - numretired
+            self.length = self.length - numretired
+            return numretired
 
         def delete_unposted(self):
             """
@@ -366,7 +523,7 @@ class NCPTL_CodeGen:
         def __init__(self, errmsg):
             "Initialize a message queue."
             self.errmsg = errmsg        # Error-message object
-            self.queues = {}            # Map from source task to tag to message size to an event queue
+            self.queues = {}            # Map from source task to tag to message size to an event deque
 
         def push(self, event):
             "Push a new event onto a message queue."
@@ -378,7 +535,7 @@ class NCPTL_CodeGen:
             if not self.queues[source_task].has_key(tag):
                 self.queues[source_task][tag] = {}
             if not self.queues[source_task][tag].has_key(message_size):
-                self.queues[source_task][tag][message_size] = []
+                self.queues[source_task][tag][message_size] = deque()
             self.queues[source_task][tag][message_size].append(event)
 
         def pop_match(self, event):
@@ -388,16 +545,25 @@ class NCPTL_CodeGen:
             tag = event.tag
             message_size = event.msgsize
             if result != None:
-                self.queues[source_task][tag][message_size].pop(0)
+                self.queues[source_task][tag][message_size].popleft()
                 result.found_match = 1
             return result
 
-        def unpop_match(self, event, matched_event):
-            "Reinsert a previously popped event into the queue."
-            source_task = event.peers[0]
-            tag = event.tag
-            message_size = event.msgsize
-            self.queues[source_task][tag][message_size].insert(0, matched_event)
+        def count_matches(self, event):
+            "Return the number of queued events that match a given event."
+            try:
+                return len(self.queues[event.peers[0]][event.tag][event.msgsize])
+            except KeyError:
+                return 0
+
+        def is_empty(self):
+            "Return 1 if no events are queued, 0 otherwise."
+            for tag2size in self.queues.values():
+                for size2queue in tag2size.values():
+                    for queue in size2queue.values():
+                        if len(queue) > 0:
+                            return 0
+            return 1
 
         def peek_match(self, event):
             "Return the first matching event from the queue or None."
@@ -412,6 +578,46 @@ class NCPTL_CodeGen:
                 return None
 
 
+    #----------------------#
+    # Helper class that    #
+    # represents a         #
+    # collective operation #
+    #----------------------#
+
+    class Collective:
+        def __init__(self, peers):
+            "Keep track of the participants that reached a collective operation."
+            self.peers = peers          # List of participating tasks
+            self.arrived = {}           # Map from an arrived task to its event
+            self.first_missing = 0      # Index into peers[] of the first participant that may not have arrived
+            self.peertime = None        # Maximum post time + latency of any arrived event
+
+        def arrive(self, event, peertime):
+            """
+                 Record that a participant's event was posted and
+                 contributes a given time to the completion time of
+                 every participant's event.
+            """
+            self.arrived[event.task] = event
+            self.peertime = max(self.peertime, peertime)
+
+        def find_missing(self):
+            """
+                 Return the first participant that has not yet
+                 arrived or None if every participant has arrived.
+            """
+            while self.first_missing < len(self.peers):
+                peer = self.peers[self.first_missing]
+                if not self.arrived.has_key(peer):
+                    return peer
+                self.first_missing = self.first_missing + 1
+            return None
+
+        def get_events(self):
+            "Return all participants' events in the order of the peer list."
+            return map(lambda peer, arrived=self.arrived: arrived[peer], self.peers)
+
+
     #---------------------#
     # Exported functions  #
     # (called from the    #
@@ -436,12 +642,20 @@ class NCPTL_CodeGen:
         self.random_seed = ncptl_seed_random_task(0L, 0L)   # Seed for the RNG
         self.mcastsync = 0L             # 1=synchronize after a multicast
         self.latency_list = [(1,1)]     # Hierarchy of message latencies
+        self.latency_groups = None      # Task-to-group maps for each latency level
         self.kill_reps = 0L             # 1=FOR...REPETITIONS limited to one iteration
         self.timing_flag = ncptl_allocate_timing_flag()  # Used by FOR <time>
         self.type2method = {}           # Map from a node type to a method that can handle it
         self.stuck_tasks = {}           # Set of deadlocked tasks
+        self.waiting_on = []            # Map from a blocked task to the task blocking it
+        self.progressed_tasks = {}      # Set of tasks that completed an event or reached a collective since last checked
+        self.collectives = {}           # Map from a collective ID to a Collective object
         self.applicable_tasks = {}      # Set of tasks that should execute the current statement
         self.unique_id = 0L             # Unique identifier for a collective operation
+        self.event_window = 0L          # Number of new events that triggers an incremental simulation (0=none)
+        self.events_buffered = 0L       # Number of events pushed since the last incremental simulation
+        self.retain_events = 0          # 1=keep every event until the end of the program
+        self.max_unroll = 5L            # Maximum trip count we're willing to simulate fully (cf. CONC_MAX_UNROLL)
         self.backend_name = "interpret"
         self.backend_desc = "coNCePTuaL interpreter"
 
@@ -481,6 +695,15 @@ class NCPTL_CodeGen:
         for mname in self.trivial_nodes:
             setattr(self, "n_" + mname, self.n_trivial_node)
 
+        # Point each node type we know how to compile to its c_*
+        # method unless a derived backend overrides the n_* method
+        # that would otherwise evaluate it.
+        self.expr_compilers = {}
+        for ntype in self.compiled_node_types:
+            method = getattr(self.__class__, "n_" + ntype, None)
+            if getattr(method, "im_func", None) is NCPTL_CodeGen.__dict__.get("n_" + ntype):
+                self.expr_compilers[ntype] = getattr(self, "c_" + ntype)
+
         # By default, all tasks perform every statement.
         for task in range(0, self.numtasks):
             self.applicable_tasks[task] = 1
@@ -495,6 +718,7 @@ class NCPTL_CodeGen:
         self.timer_start = [0] * int(self.numtasks)
         self.counters = []
         self.counter_stack = map(lambda t: [], range(0, self.numtasks))
+        self.latency_groups = None
 
     def fake_semantic_analysis(self, node):
         "Pretend we ran the semantic analyzer (needed by the coNCePTuaL GUI)."
@@ -554,6 +778,131 @@ class NCPTL_CodeGen:
             return False
         return event1.collective_id == event2.collective_id
 
+    def statement_is_repeatable(self, node):
+        """
+             Return 1 if every iteration of a loop node's body
+             generates the same events or 0 if not.  As in the C
+             backends, a body that uses the UNIQUE keyword or any form
+             of randomness is ineligible for repetition.  Because the
+             result depends only on the AST, we cache it in the node.
+        """
+        try:
+            return node.repeatable
+        except AttributeError:
+            pass
+        node.repeatable = not (hasattr(node, "sem_up_unique_messages")
+                               or hasattr(node, "sem_up_random_calls")
+                               or hasattr(node, "sem_up_random_task"))
+        nodestack = [node.kids[-1]]
+        while node.repeatable and nodestack != []:
+            subnode = nodestack.pop()
+            if subnode.sem.get("random_func_nodes"):
+                node.repeatable = 0
+            elif subnode.type == "let_binding" and subnode.attr != None:
+                node.repeatable = 0    # A RANDOM TASK
+            elif subnode.type == "stride" and subnode.attr == "random":
+                node.repeatable = 0
+            elif subnode.type in ["processor_stmt", "backend_stmt"]:
+                node.repeatable = 0
+            nodestack.extend(subnode.kids)
+        return node.repeatable
+
+    def capture_event_state(self):
+        """
+             If every event has completed and no message or
+             asynchronous operation is outstanding, return a list of
+             {most recently completed event, counters} pairs, one per
+             task.  Otherwise, return None.
+        """
+        state = []
+        for task in range(0, self.numtasks):
+            eventlist = self.eventlist[task]
+            if not eventlist.all_complete() or self.pendingevents[task] != [] \
+                   or not self.msgqueue[task].is_empty():
+                return None
+            state.append((eventlist.retired_tail, self.counters[task].copy()))
+        return state
+
+    def extrapolate_event_state(self, prev_state, state, numreps):
+        """
+             Given the state before and after a single repetition of a
+             loop body, advance time and counters as if NUMREPS more
+             repetitions were performed.  This is valid only if every
+             task that participated in the repetition advanced by the
+             same amount of time; event times are then shifted
+             uniformly from one repetition to the next.  Return 1 on
+             success or 0 if the repetitions must be performed
+             explicitly.
+        """
+        # Ensure that all participating tasks advanced in lockstep.
+        delta = None
+        for task in range(0, self.numtasks):
+            prev_tail, prev_counters = prev_state[task]
+            tail, counters = state[task]
+            if tail is prev_tail:
+                continue
+            if prev_tail == None:
+                return 0
+            task_delta = tail.completetime - prev_tail.completetime
+            if delta == None:
+                delta = task_delta
+            elif delta != task_delta:
+                return 0
+        if delta == None:
+            # The loop body doesn't generate any events.
+            return 1
+
+        # Shift the last event of each participating task forward in
+        # time and update all of the task's counters.
+        for task in range(0, self.numtasks):
+            prev_tail, prev_counters = prev_state[task]
+            tail, counters = state[task]
+            if tail is prev_tail:
+                continue
+            new_tail = tail.instantiate()
+            new_tail.posttime = tail.posttime + numreps*delta
+            new_tail.completetime = tail.completetime + numreps*delta
+            new_tail.found_match = tail.found_match
+            self.eventlist[task].retired_tail = new_tail
+            for varname, value in counters.items():
+                self.counters[task][varname] = value + numreps*(value - prev_counters[varname])
+        return 1
+
+    def repeat_statement(self, node, statement_node, numreps):
+        """
+             Execute a loop body a given number of times.  If the
+             body is eligible and executes many times, simulate two
+             repetitions then, if the second advanced time and
+             counters in a repeatable way, extrapolate the remaining
+             repetitions instead of generating their events.
+        """
+        repnum = 0L
+        if numreps > self.max_unroll and not self.retain_events \
+               and self.statement_is_repeatable(node):
+            self.process_available_events()
+            prev_state = None
+            state = self.capture_event_state()
+            event_window = self.event_window
+            self.event_window = 0L    # Keep every event until we've checked it.
+            while repnum < 2L and state != None:
+                self.process_node(statement_node)
+                repnum = repnum + 1L
+                for eventlist in self.eventlist:
+                    for event in eventlist.events:
+                        if not self.repeatable_operations.has_key(event.operation):
+                            state = None
+                if state != None:
+                    self.process_available_events()
+                    prev_state = state
+                    state = self.capture_event_state()
+            self.event_window = event_window
+            if state != None and \
+                   self.extrapolate_event_state(prev_state, state, numreps-repnum):
+                repnum = numreps
+        while repnum < numreps:
+            self.process_node(statement_node)
+            repnum = repnum + 1L
+
     def set_log_file_status(self, enable):
         "Force log-file usage on or off (intended to be called by derived classes)."
         if enable:
@@ -563,6 +912,17 @@ class NCPTL_CodeGen:
             self.program_can_use_log_file = 0
             self.options = filter(lambda ev: ev[2] != "logfile", self.options)
 
+    def set_event_retention(self, retain):
+        """Force complete event lists to be kept until the end of the
+        program (intended to be called by derived classes that
+        post-process events)."""
+        if retain:
+            self.retain_events = 1
+            self.event_window = 0L
+            self.options = filter(lambda ev: ev[2] != "window", self.options)
+        else:
+            self.retain_events = 0
+
     def dump_event_lists(self, outfilename):
         "Write an easy-to-parse list of events to a file."
         try:
@@ -634,6 +994,52 @@ class NCPTL_CodeGen:
             tasks_cost_list.append((numtasks, tasks_cost_list[-1][1]+1))
         return tasks_cost_list
 
+    def hierarchy_latency(self, lowest, highest):
+        """
+             Return the latency between two tasks, which is that of
+             the first level of the latency hierarchy that places
+             both tasks in the same group.  A level's groups are
+             contiguous ranges of tasks and each level's groups
+             subsume the previous level's, so the result is also the
+             maximum latency between any pair of tasks in the range
+             [lowest, highest].  Each level's map from a task to its
+             group ID is computed on first use.
+        """
+        if self.latency_groups == None:
+            self.latency_groups = []
+            alltasks = range(int(self.numtasks))
+            for taskcount, latency in self.latency_list:
+                groups = map(lambda task, taskcount=taskcount: task/taskcount, alltasks)
+                self.latency_groups.append((groups, latency))
+        for groups, latency in self.latency_groups:
+            if groups[lowest] == groups[highest]:
+                return latency
+        return -1
+
+    def event_latency(self, event):
+        """
+             Return the maximum message latency from any of an
+             event's sources to any of its targets, which is the
+             latency between the two most distant tasks.  REDUCE
+             events' peer list contains the source and target lists;
+             other events' peer list contains only the targets.
+        """
+        if event.operation == "REDUCE":
+            source_tasks, target_tasks = event.peers
+            if source_tasks == () or target_tasks == ():
+                return -1
+            lowest, highest = event.peer_span()
+        else:
+            span = event.peer_span()
+            if span == None:
+                return -1
+            lowest, highest = span
+            if event.task != None:
+                # A collective's template has no task of its own.
+                lowest = min(lowest, event.task)
+                highest = max(highest, event.task)
+        return self.hierarchy_latency(lowest, highest)
+
     def generate_initialize(self, ast, filesource='<stdin>', filetarget="-", sourcecode=None):
         "Perform all of the initialization needed by the generate method."
 
@@ -642,6 +1048,8 @@ class NCPTL_CodeGen:
         self.filesource = filesource           # Input file
         self.sourcecode = sourcecode           # coNCePTuaL source code
         self.errmsg = NCPTL_Error(filesource)  # Error-handling methods
+        self.Event.shared_tuples = {}          # Canonical tuples for this run only
+        self.latency_groups = None             # Task-to-group maps for each latency level
         self.eventlist = map(lambda self: self.EventList(self),    # Map from task to event list
                              [self] * int(self.numtasks))
         self.msgqueue = map(lambda self: self.MessageQueue(self.errmsg),  # Map from source task to message size to event list
@@ -668,6 +1076,9 @@ class NCPTL_CodeGen:
             # If a target filename was specified, derive the log
             # filename template from that.
             filebase = os.path.splitext(filetarget)[0]
+
+            # Dumping event state requires every event to be retained.
+            self.retain_events = 1
         self.logfiletemplate = "%s-%%p.log" % os.path.basename(filebase)
         self.options.extend([
             ["numtasks", "Number of tasks to use", "tasks", "T", 1L],
@@ -682,6 +1093,9 @@ class NCPTL_CodeGen:
             ["kill_reps",
              "If nonzero, perform FOR...REPETITIONS loop bodies exactly once",
              "kill-reps", "K", 0L],
+            ["event_window",
+             "Number of new events after which to simulate incrementally (0=simulate only at program end)",
+             "window", "W", 0L],
             ["logfiletmpl", "Log-file template", "logfile",
              "L", self.logfiletemplate]])
 
@@ -722,6 +1136,14 @@ class NCPTL_CodeGen:
 
     def process_node(self, node):
         "Given a node, invoke a method that knows how to process it."
+        # Evaluate expressions using their compiled form.
+        try:
+            compiled = node.compiled_expr
+        except AttributeError:
+            compiled = self.compile_expr(node)
+        if compiled != None:
+            return compiled[self.context](self)
+
         # If the node has a constant value and is an expression (as
         # opposed to a statement), reuse its previously calculated
         # value.
@@ -800,6 +1222,20 @@ class NCPTL_CodeGen:
             pass
         self.errmsg.error_internal('Unknown expression type %s for expression "%s"' % (str(type(frag)), frag))
 
+    def safe_divide(self, node, value1, value2):
+        "Divide two numbers but report divide-by-zero errors."
+        if self.context == "int":
+            numerator = self.eval_lazy_expr(value1)
+            denominator = self.eval_lazy_expr(value2)
+        else:
+            numerator = self.eval_lazy_expr(value1, types.FloatType)
+            denominator = self.eval_lazy_expr(value2, types.FloatType)
+        try:
+            return numerator / denominator
+        except ZeroDivisionError:
+            self.errmsg.error_fatal("Divide-by-zero error (%s/%s)" % (`numerator`, `denominator`),
+                                    lineno0=node.lineno0, lineno1=node.lineno1)
+
     def initialize_log_file(self, physrank):
         """Create a set of log files and write a prologue to each of.
         Note that repeated calls will have no adverse effect."""
@@ -875,7 +1311,7 @@ class NCPTL_CodeGen:
                 ptasks = tuple(ptasks)
             return ptasks
 
-    def push_event(self, event):
+    def push_event(self, event, peers_are_physical=0):
             """
                  Modify an event to use physical instead of virtual
                  ranks and introduce a suppression flag then push the
@@ -883,9 +1319,27 @@ class NCPTL_CodeGen:
             """
             physrank = self._virtual_to_physical(event.task)
             event.task = physrank
-            event.peers = self._virtual_to_physical(event.peers)
+            if not peers_are_physical:
+                event.peers = event.share(self._virtual_to_physical(event.peers))
             event.suppressed = self.suppress_output
             self.eventlist[physrank].push(event)
+            self.events_buffered = self.events_buffered + 1
+
+    def push_collective_event(self, event, tasklist):
+        """
+             Push a copy of a collective event onto the event list of
+             every task in a list.  Because all participants share the
+             event's peer list, the list is converted to physical
+             ranks and the collective's latency is computed only once
+             rather than once per task.  (Every participant appears
+             in the peer list so its own rank can't widen the span.)
+        """
+        event.peers = event.share(self._virtual_to_physical(event.peers))
+        event.latency = self.event_latency(event)
+        for task in tasklist:
+            task_event = event.instantiate()
+            task_event.task = task
+            self.push_event(task_event, 1)
 
     def evaluate_for_each(self, for_each_node, expr_node):
         "Evaluate an expression for each element in a list of ranges."
@@ -911,6 +1365,333 @@ class NCPTL_CodeGen:
         return resulting_list
 
 
+    #---------------------------------#
+    # AST compilation: expressions    #
+    # (return closures that take the  #
+    # interpreter and return a value) #
+    #---------------------------------#
+
+    def compile_expr(self, node):
+        """
+             Compile an expression into a map from each evaluation
+             context ("int" or "float") to a function that takes an
+             interpreter object and returns the expression's value in
+             that context.  Cache the map in the node and return it.
+             Return None for nodes we don't know how to compile.
+        """
+        try:
+            compiler = self.expr_compilers[node.type]
+        except KeyError:
+            node.compiled_expr = None
+            return None
+        compiled = {}
+        for context in ["int", "float"]:
+            evaluate = compiler(node, context)
+            if node.sem["is_constant"] and self.sub_statement_nodes.has_key(node.type):
+                # Like process_node, evaluate constant nodes only once.
+                def evaluate_once(interp, node=node, evaluate=evaluate):
+                    try:
+                        return node.previous_value
+                    except AttributeError:
+                        node.previous_value = evaluate(interp)
+                        return node.previous_value
+                compiled[context] = evaluate_once
+            else:
+                compiled[context] = evaluate
+        node.compiled_expr = compiled
+        return compiled
+
+    def compile_kid(self, node, context):
+        """
+             Return a function that evaluates a node in a given
+             context, falling back to process_node if the node can't
+             be compiled.
+        """
+        try:
+            compiled = node.compiled_expr
+        except AttributeError:
+            compiled = self.compile_expr(node)
+        if compiled == None:
+            return lambda interp, node=node: interp.process_node(node)
+        return compiled[context]
+
+    def compile_binary_function(self, node, context, ffunc, ifunc=None):
+        """
+             Compile the application of a binary function to a
+             node's two children.  The resulting function behaves
+             like apply_binary_function.
+        """
+        if len(node.kids) != 2:
+            self.errmsg.error_internal("Node %s has %d children, not 2" %
+                                       (node.type, len(node.kids)))
+        kid0 = self.compile_kid(node.kids[0], context)
+        kid1 = self.compile_kid(node.kids[1], context)
+        if context == "int":
+            if ifunc == None:
+                ifunc = ffunc
+            def evaluate(interp, kid0=kid0, kid1=kid1, ifunc=ifunc):
+                value1 = long(kid0(interp))
+                return ifunc(value1, long(kid1(interp)))
+        else:
+            def evaluate(interp, kid0=kid0, kid1=kid1, ffunc=ffunc):
+                value1 = kid0(interp)
+                value2 = kid1(interp)
+                try:
+                    return ffunc(float(value1), float(value2))
+                except TypeError:
+                    return (ffunc, value1, value2)
+        return evaluate
+
+    def c_trivial_node(self, node, context):
+        "Compile a node that returns its last child's value."
+        if len(node.kids) == 1:
+            return self.compile_kid(node.kids[0], context)
+        kidfuncs = map(lambda kid, self=self, context=context: self.compile_kid(kid, context),
+                       node.kids)
+        def evaluate(interp, kidfuncs=kidfuncs):
+            result = None
+            for kidfunc in kidfuncs:
+                result = kidfunc(interp)
+            return result
+        return evaluate
+
+    c_rel_expr = c_trivial_node
+    c_rel_primary_expr = c_trivial_node
+    c_expr = c_trivial_node
+    c_primary_expr = c_trivial_node
+
+    def c_rel_disj_expr(self, node, context):
+        "Compile a logical OR."
+        if len(node.kids) == 1:
+            return self.c_trivial_node(node, context)
+        def evaluate(interp, kid0=self.compile_kid(node.kids[0], context),
+                     kid1=self.compile_kid(node.kids[1], context)):
+            if long(kid0(interp)):
+                return 1L
+            else:
+                return long(kid1(interp))
+        return evaluate
+
+    def c_rel_conj_expr(self, node, context):
+        "Compile a logical AND."
+        if len(node.kids) == 1:
+            return self.c_trivial_node(node, context)
+        def evaluate(interp, kid0=self.compile_kid(node.kids[0], context),
+                     kid1=self.compile_kid(node.kids[1], context)):
+            if long(kid0(interp)):
+                return long(kid1(interp))
+            else:
+                return 0L
+        return evaluate
+
+    def c_eq_expr(self, node, context):
+        "Compile a comparison of our children's values."
+        attr2func = {
+            "op_eq": lambda a, b: a==b,
+            "op_ne": lambda a, b: a!=b,
+            "op_gt": lambda a, b: a>b,
+            "op_lt": lambda a, b: a<b,
+            "op_ge": lambda a, b: a>=b,
+            "op_le": lambda a, b: a<=b}
+        try:
+            return self.compile_binary_function(node, context, attr2func[node.attr])
+        except KeyError:
+            pass
+        kid0 = self.compile_kid(node.kids[0], context)
+        if node.attr == "op_divides":
+            ifunc = lambda a, b: ncptl_func_modulo(b, a) == 0L
+            ffunc = lambda a, b: long(ncptl_dfunc_modulo(b, a)) == 0L
+            return self.compile_binary_function(node, context, ffunc, ifunc)
+        elif node.attr == "op_odd":
+            return lambda interp, kid0=kid0: long(kid0(interp)) % 2 != 0
+        elif node.attr == "op_even":
+            return lambda interp, kid0=kid0: long(kid0(interp)) % 2 == 0
+        elif node.attr in ["op_in_range", "op_not_in_range"]:
+            def evaluate(interp, kid0=kid0,
+                         kid1=self.compile_kid(node.kids[1], context),
+                         kid2=self.compile_kid(node.kids[2], context),
+                         negate=node.attr == "op_not_in_range"):
+                number = kid0(interp)
+                bounds = [kid1(interp), kid2(interp)]
+                bounds.sort()
+                return (bounds[0] <= number <= bounds[1]) != negate
+            return evaluate
+        elif node.attr in ["op_in_range_list", "op_not_in_range_list"]:
+            def evaluate(interp, kid0=kid0,
+                         kid1=self.compile_kid(node.kids[1], context),
+                         found=int(node.attr == "op_in_range_list")):
+                expression = kid0(interp)
+                for rlist in kid1(interp):
+                    if expression in rlist:
+                        return found
+                return 1 - found
+            return evaluate
+        else:
+            self.errmsg.error_internal('Unknown eq_expr "%s"' % node.attr)
+
+    c_where_expr = c_trivial_node
+
+    def c_ifelse_expr(self, node, context):
+        "Compile a choice between two expressions based on a condition."
+        if len(node.kids) != 3:
+            return self.c_trivial_node(node, context)
+        def evaluate(interp,
+                     kid0=self.compile_kid(node.kids[0], context),
+                     kid1=self.compile_kid(node.kids[1], context),
+                     kid2=self.compile_kid(node.kids[2], context)):
+            value1 = kid0(interp)
+            value2 = kid2(interp)
+            if kid1(interp):
+                return value1
+            else:
+                return value2
+        return evaluate
+
+    def c_add_expr(self, node, context):
+        "Compile the combination of two expressions using an additive operator."
+        if len(node.kids) == 1:
+            return self.c_trivial_node(node, context)
+        elif node.attr == "op_plus":
+            return self.compile_binary_function(node, context, lambda a, b: a+b)
+        elif node.attr == "op_minus":
+            return self.compile_binary_function(node, context, lambda a, b: a-b)
+        elif node.attr == "op_xor":
+            ifunc = lambda a, b: a ^ b
+            ffunc = lambda a, b: float(long(a) ^ long(b))
+            return self.compile_binary_function(node, context, ffunc, ifunc)
+        elif node.attr == "op_or":
+            ifunc = lambda a, b: a | b
+            ffunc = lambda a, b: float(long(a) | long(b))
+            return self.compile_binary_function(node, context, ffunc, ifunc)
+        else:
+            self.errmsg.error_internal('Unknown add_expr "%s"' % node.attr)
+
+    def c_mult_expr(self, node, context):
+        "Compile the combination of two expressions using a multiplicative operator."
+        if len(node.kids) == 1:
+            return self.c_trivial_node(node, context)
+        elif node.attr == "op_mult":
+            return self.compile_binary_function(node, context, lambda a, b: a*b)
+        elif node.attr == "op_div":
+            # The division function needs the interpreter so we can't
+            # build it until we know which interpreter is calling us.
+            def evaluate(interp, node=node, kid0=self.compile_kid(node.kids[0], context),
+                         kid1=self.compile_kid(node.kids[1], context), context=context):
+                if context == "int":
+                    value1 = long(kid0(interp))
+                    return interp.safe_divide(node, value1, long(kid1(interp)))
+                safe_divide = lambda a, b, interp=interp, node=node: interp.safe_divide(node, a, b)
+                value1 = kid0(interp)
+                value2 = kid1(interp)
+                try:
+                    return safe_divide(float(value1), float(value2))
+                except TypeError:
+                    return (safe_divide, value1, value2)
+            return evaluate
+        elif node.attr == "op_mod":
+            return self.compile_binary_function(node, context, ncptl_dfunc_modulo, ncptl_func_modulo)
+        elif node.attr == "op_shr":
+            ffunc = lambda n, b: ncptl_dfunc_shift_left(n, -b)
+            ifunc = lambda n, b: ncptl_func_shift_left(n, -b)
+            return self.compile_binary_function(node, context, ffunc, ifunc)
+        elif node.attr == "op_shl":
+            return self.compile_binary_function(node, context, ncptl_dfunc_shift_left, ncptl_func_shift_left)
+        elif node.attr == "op_and":
+            ifunc = lambda a, b: a & b
+            ffunc = lambda a, b: float(long(a) & long(b))
+            return self.compile_binary_function(node, context, ffunc, ifunc)
+        else:
+            self.errmsg.error_internal('Unknown mult_expr "%s"' % node.attr)
+
+    def c_unary_expr(self, node, context):
+        "Compile the application of a unary operator to an expression."
+        if node.attr not in [None, "op_pos", "op_neg", "op_not"]:
+            self.errmsg.error_internal('Unknown unary_expr "%s"' % node.attr)
+        kidfunc = self.c_trivial_node(node, context)
+        if context == "int":
+            if node.attr == "op_neg":
+                return lambda interp, kidfunc=kidfunc: -long(kidfunc(interp))
+            elif node.attr == "op_not":
+                return lambda interp, kidfunc=kidfunc: ~long(kidfunc(interp))
+            else:
+                return lambda interp, kidfunc=kidfunc: long(kidfunc(interp))
+        def evaluate(interp, kidfunc=kidfunc, operation=node.attr):
+            posvalue = kidfunc(interp)
+            try:
+                posvalue = float(posvalue)
+            except TypeError:
+                pass
+            if operation == "op_neg":
+                try:
+                    return -posvalue
+                except TypeError:
+                    return (lambda v: -v, posvalue)
+            elif operation == "op_not":
+                try:
+                    return ~long(posvalue)
+                except TypeError:
+                    return (lambda v: ~long(v), posvalue)
+            else:
+                return posvalue
+        return evaluate
+
+    def c_power_expr(self, node, context):
+        "Compile the combination of two expressions using a power operator."
+        if len(node.kids) == 1:
+            return self.c_trivial_node(node, context)
+        else:
+            return self.compile_binary_function(node, context, ncptl_dfunc_power, ncptl_func_power)
+
+    def c_integer(self, node, context):
+        "Compile a constant integer."
+        if context == "int":
+            value = long(node.attr)
+        else:
+            value = float(node.attr)
+        return lambda interp, value=value: value
+
+    def c_ident(self, node, context):
+        "Compile a reference to an identifier."
+        # Predefined variables are returned as a tuple to be evaluated
+        # later.  The only exception is num_tasks because it's usable
+        # in more contexts than the others.
+        if node.attr == "num_tasks":
+            if context == "int":
+                return lambda interp: long(interp.numtasks)
+            else:
+                return lambda interp: float(interp.numtasks)
+        if Variables.variables.has_key(node.attr):
+            return lambda interp, v=node.attr: \
+                (lambda self=interp, v=v: float(self.counters[self.physrank][v]),)
+
+        # Now handle the general case -- user-defined variables.
+        def evaluate(interp, varname=node.attr, node=node, want_float=context == "float"):
+            for frame in interp.scopes:
+                if frame.has_key(varname):
+                    if want_float:
+                        return float(frame[varname])
+                    return frame[varname]
+            interp.errmsg.error_fatal("Variable %s is not defined" % varname,
+                                      lineno0=node.lineno0, lineno1=node.lineno1)
+        return evaluate
+
+    def c_my_task(self, node, context):
+        "Compile a reference to virtrank."
+        return lambda interp: interp.virtrank
+
+    def c_real(self, node, context):
+        "Compile the evaluation of an expression in floating-point context."
+        def evaluate(interp, kidfunc=self.compile_kid(node.kids[0], "float"),
+                     round_result=context == "int"):
+            interp.context = "float"
+            result = kidfunc(interp)
+            if round_result:
+                result = round(result)
+                interp.context = "int"
+            return result
+        return evaluate
+
+
     #---------------------------------#
     # AST interpretation: relational  #
     # expressions (return true/false) #
@@ -1037,19 +1818,7 @@ class NCPTL_CodeGen:
         elif node.attr == "op_mult":
             return self.apply_binary_function((lambda a, b: a*b), node)
         elif node.attr == "op_div":
-            def safe_divide(value1, value2, self=self, node=node):
-                "Divide two numbers but report divide-by-zero errors."
-                if self.context == "int":
-                    numerator = self.eval_lazy_expr(value1)
-                    denominator = self.eval_lazy_expr(value2)
-                else:
-                    numerator = self.eval_lazy_expr(value1, types.FloatType)
-                    denominator = self.eval_lazy_expr(value2, types.FloatType)
-                try:
-                    return numerator / denominator
-                except ZeroDivisionError:
-                    self.errmsg.error_fatal("Divide-by-zero error (%s/%s)" % (`numerator`, `denominator`),
-                                            lineno0=node.lineno0, lineno1=node.lineno1)
+            safe_divide = lambda a, b, self=self, node=node: self.safe_divide(node, a, b)
             return self.apply_binary_function(safe_divide, node)
         elif node.attr == "op_mod":
             return self.apply_binary_function(ncptl_dfunc_modulo, node, ncptl_func_modulo)
@@ -1472,15 +2241,8 @@ class NCPTL_CodeGen:
     def n_restricted_ident(self, node):
         """Return a variable name and a list of tasks that match a
         SUCH THAT expression."""
-        tasklist = []
-        self.scopes.insert(0, {})
         varname = node.kids[0].attr
-        for task in range(0L, self.numtasks):
-            self.scopes[0][varname] = task
-            if self.process_node(node.kids[1]):
-                tasklist.append(task)
-        self.scopes.pop(0)
-        return (varname, tasklist)
+        return (varname, self.select_tasks(varname, node.kids[1]))
 
     def n_string_or_expr_list(self, node):
         "Concatenate all child values into a single list."
@@ -1509,15 +2271,8 @@ class NCPTL_CodeGen:
              Return a list of tasks that match a given condition and a
              variable name that takes on each task number in turn.
         """
-        tasklist = []
-        self.scopes.insert(0, {})
         varname = node.kids[0].attr
-        for task in range(0L, self.numtasks):
-            self.scopes[0][varname] = task
-            if self.process_node(node.kids[1]):
-                tasklist.append(task)
-        self.scopes.pop(0)
-        return (varname, tasklist)
+        return (varname, self.select_tasks(varname, node.kids[1]))
 
     def n_comma(self, node):
         "Combine all descendents' values into a list and return that."
@@ -1746,6 +2501,476 @@ class NCPTL_CodeGen:
         return node.attr
 
 
+    #-------------------------------------#
+    # AST interpretation: SUCH THAT       #
+    # expressions over a vector of tasks  #
+    #-------------------------------------#
+
+    def select_tasks(self, varname, predicate):
+        """Return a list of the tasks for which PREDICATE is true
+        when VARNAME is bound to each task in turn."""
+        # If NumPy is available, try evaluating the predicate over all
+        # tasks at once.
+        if numpy != None and self.context == "int":
+            try:
+                vectorizable = predicate.vectorizable
+            except AttributeError:
+                vectorizable = self.mark_task_dependence(predicate, varname)
+                predicate.vectorizable = vectorizable
+            if vectorizable:
+                try:
+                    alltasks = numpy.arange(self.numtasks, dtype=numpy.int64)
+                    selected = self.as_vector(self.evaluate_vector(predicate, alltasks),
+                                              alltasks)
+                    return map(long, numpy.flatnonzero(selected).tolist())
+                except VectorizationError:
+                    # Something can't be computed exactly (e.g., a
+                    # division by zero for some task).  Let the
+                    # scalar code below handle it.
+                    pass
+
+        # Evaluate the predicate one task at a time.
+        tasklist = []
+        self.scopes.insert(0, {})
+        for task in range(0L, self.numtasks):
+            self.scopes[0][varname] = task
+            if self.process_node(predicate):
+                tasklist.append(task)
+        self.scopes.pop(0)
+        return tasklist
+
+    def mark_task_dependence(self, node, varname):
+        """Mark each node in an expression according to whether its
+        value depends upon VARNAME.  Return 1 if every node that does
+        can be evaluated over a vector of tasks, 0 otherwise."""
+        vectorizable = 1
+        node.task_dependent = int(node.type == "ident" and node.attr == varname)
+        for kid in node.kids:
+            if not self.mark_task_dependence(kid, varname):
+                vectorizable = 0
+            if kid.task_dependent:
+                node.task_dependent = 1
+        if not node.task_dependent or node.type == "ident":
+            return vectorizable
+        try:
+            valid_attrs = self.vector_node_types[node.type]
+        except KeyError:
+            return 0
+        if valid_attrs != None and node.attr not in valid_attrs:
+            return 0
+        if node.type == "func_call" and node.attr[:5] == "MESH_":
+            # The mesh shape must be the same for every task.
+            if node.kids[0].task_dependent:
+                return 0
+            if node.attr == "MESH_NEIGHBOR" and node.kids[2].type != "expr_list":
+                return 0
+        return vectorizable
+
+    def evaluate_vector(self, node, tasks):
+        """Evaluate an expression over a vector of tasks.  Return a
+        long if the expression does not depend on the task or a NumPy
+        vector of 64-bit integers if it does."""
+        if not node.task_dependent:
+            # Evaluate task-independent expressions only once.
+            value = self.process_node(node)
+            if type(value) not in [types.IntType, types.LongType, types.BooleanType]:
+                raise VectorizationError
+            value = long(value)
+            self.check_vector_bound(abs(value))
+            return value
+        methodcode = getattr(self, "v_" + node.type, self.v_trivial_node)
+        return self.as_vector(methodcode(node, tasks), tasks)
+
+    def as_vector(self, value, tasks):
+        "Broadcast a scalar or vector to a vector of 64-bit integers."
+        value = numpy.asarray(value, dtype=numpy.int64)
+        if value.ndim == 0:
+            value = numpy.repeat(value, len(tasks))
+        return value
+
+    def vector_bound(self, value):
+        "Return the largest magnitude in a scalar or a vector."
+        if type(value) == types.LongType:
+            return abs(value)
+        if len(value) == 0:
+            return 0L
+        return max(abs(long(value.min())), abs(long(value.max())))
+
+    def check_vector_bound(self, bound):
+        """Abort vectorized evaluation if a 64-bit integer might
+        overflow where a Python long would not."""
+        if bound >= self.vector_limit:
+            raise VectorizationError
+
+    def vector_arguments(self, node, tasks):
+        "Evaluate a function's argument list over a vector of tasks."
+        if node.type == "expr_list":
+            return map(lambda kid, self=self, tasks=tasks: self.evaluate_vector(kid, tasks),
+                       node.kids)
+        else:
+            return [self.evaluate_vector(node, tasks)]
+
+    def v_trivial_node(self, node, tasks):
+        "Evaluate each child in turn and return the last child's value."
+        result = None
+        for kid in node.kids:
+            result = self.evaluate_vector(kid, tasks)
+        return result
+
+    def v_ident(self, node, tasks):
+        "Return the vector of tasks itself."
+        return tasks
+
+    def v_rel_disj_expr(self, node, tasks):
+        "Return 1 wherever any of our children is true."
+        if len(node.kids) == 1:
+            return self.v_trivial_node(node, tasks)
+        value1 = self.evaluate_vector(node.kids[0], tasks)
+        if type(value1) == types.LongType:
+            if value1:
+                return 1L
+            return self.evaluate_vector(node.kids[1], tasks)
+
+        # Evaluate the second child only for the tasks that the scalar
+        # code would evaluate it for.
+        result = numpy.ones(len(tasks), dtype=numpy.int64)
+        lanes = numpy.flatnonzero(value1 == 0)
+        if len(lanes) > 0:
+            result[lanes] = self.evaluate_vector(node.kids[1], tasks[lanes])
+        return result
+
+    def v_rel_conj_expr(self, node, tasks):
+        "Return 1 only where all of our children are true."
+        if len(node.kids) == 1:
+            return self.v_trivial_node(node, tasks)
+        value1 = self.evaluate_vector(node.kids[0], tasks)
+        if type(value1) == types.LongType:
+            if value1:
+                return self.evaluate_vector(node.kids[1], tasks)
+            return 0L
+
+        # Evaluate the second child only for the tasks that the scalar
+        # code would evaluate it for.
+        result = numpy.zeros(len(tasks), dtype=numpy.int64)
+        lanes = numpy.flatnonzero(value1)
+        if len(lanes) > 0:
+            result[lanes] = self.evaluate_vector(node.kids[1], tasks[lanes])
+        return result
+
+    def v_eq_expr(self, node, tasks):
+        "Compare our children's values over a vector of tasks."
+        attr2func = {
+            "op_eq": numpy.equal,
+            "op_ne": numpy.not_equal,
+            "op_gt": numpy.greater,
+            "op_lt": numpy.less,
+            "op_ge": numpy.greater_equal,
+            "op_le": numpy.less_equal}
+        values = map(lambda kid, self=self, tasks=tasks: self.evaluate_vector(kid, tasks),
+                      node.kids)
+        if attr2func.has_key(node.attr):
+            return attr2func[node.attr](values[0], values[1])
+        elif node.attr == "op_divides":
+            if numpy.any(values[0] == 0):
+                raise VectorizationError
+            return numpy.mod(values[1], numpy.abs(values[0])) == 0
+        elif node.attr == "op_odd":
+            return numpy.mod(values[0], 2) != 0
+        elif node.attr == "op_even":
+            return numpy.mod(values[0], 2) == 0
+        elif node.attr in ["op_in_range", "op_not_in_range"]:
+            lower = numpy.minimum(values[1], values[2])
+            upper = numpy.maximum(values[1], values[2])
+            inrange = (lower <= values[0]) & (values[0] <= upper)
+            if node.attr == "op_in_range":
+                return inrange
+            else:
+                return ~inrange
+        else:
+            self.errmsg.error_internal('Unable to vectorize eq_expr "%s"' % node.attr)
+
+    def v_ifelse_expr(self, node, tasks):
+        "Select one of two expressions based on a condition."
+        if len(node.kids) != 3:
+            return self.v_trivial_node(node, tasks)
+        value1 = self.evaluate_vector(node.kids[0], tasks)
+        value2 = self.evaluate_vector(node.kids[2], tasks)
+        condition = self.evaluate_vector(node.kids[1], tasks)
+        return numpy.where(condition != 0, value1, value2)
+
+    def v_add_expr(self, node, tasks):
+        "Combine two vectors using an additive operator."
+        if len(node.kids) == 1:
+            return self.v_trivial_node(node, tasks)
+        value1 = self.evaluate_vector(node.kids[0], tasks)
+        value2 = self.evaluate_vector(node.kids[1], tasks)
+        if node.attr == "op_plus":
+            self.check_vector_bound(self.vector_bound(value1) + self.vector_bound(value2))
+            return value1 + value2
+        elif node.attr == "op_minus":
+            self.check_vector_bound(self.vector_bound(value1) + self.vector_bound(value2))
+            return value1 - value2
+        elif node.attr == "op_xor":
+            return numpy.bitwise_xor(value1, value2)
+        elif node.attr == "op_or":
+            return numpy.bitwise_or(value1, value2)
+        else:
+            self.errmsg.error_internal('Unable to vectorize add_expr "%s"' % node.attr)
+
+    def v_mult_expr(self, node, tasks):
+        "Combine two vectors using a multiplicative operator."
+        if len(node.kids) == 1:
+            return self.v_trivial_node(node, tasks)
+        value1 = self.evaluate_vector(node.kids[0], tasks)
+        value2 = self.evaluate_vector(node.kids[1], tasks)
+        if node.attr == "op_mult":
+            self.check_vector_bound(self.vector_bound(value1) * self.vector_bound(value2))
+            return value1 * value2
+        elif node.attr in ["op_div", "op_mod"]:
+            # Let the scalar code report division by zero.
+            if numpy.any(value2 == 0):
+                raise VectorizationError
+            if node.attr == "op_div":
+                return numpy.floor_divide(value1, value2)
+            else:
+                return numpy.mod(value1, numpy.abs(value2))
+        elif node.attr == "op_shl":
+            return self.vector_shift_left(value1, value2)
+        elif node.attr == "op_shr":
+            return self.vector_shift_left(value1, -value2)
+        elif node.attr == "op_and":
+            return numpy.bitwise_and(value1, value2)
+        else:
+            self.errmsg.error_internal('Unable to vectorize mult_expr "%s"' % node.attr)
+
+    def vector_shift_left(self, num, bits):
+        "Shift left by a number of bits (right if negative) as in ncptl_func_shift_left()."
+        maxbits = self.vector_bound(bits)
+        if maxbits >= 63L:
+            raise VectorizationError
+        self.check_vector_bound(self.vector_bound(num) << maxbits)
+        return numpy.where(bits >= 0,
+                           numpy.left_shift(num, numpy.maximum(bits, 0)),
+                           numpy.right_shift(num, numpy.maximum(-bits, 0)))
+
+    def v_unary_expr(self, node, tasks):
+        "Apply a unary operator to a vector."
+        posvalue = self.v_trivial_node(node, tasks)
+        if node.attr in [None, "op_pos"]:
+            return posvalue
+        elif node.attr == "op_neg":
+            return -posvalue
+        elif node.attr == "op_not":
+            return numpy.invert(posvalue)
+        else:
+            self.errmsg.error_internal('Unable to vectorize unary_expr "%s"' % node.attr)
+
+    def v_power_expr(self, node, tasks):
+        "Raise one vector to the power of another."
+        if len(node.kids) == 1:
+            return self.v_trivial_node(node, tasks)
+        base = self.evaluate_vector(node.kids[0], tasks)
+        exponent = self.evaluate_vector(node.kids[1], tasks)
+        if numpy.any(exponent < 0) or numpy.any((base == 0) & (exponent == 0)):
+            # Let the scalar code handle the special cases.
+            raise VectorizationError
+        maxbase = self.vector_bound(base)
+        maxexponent = self.vector_bound(exponent)
+        if maxbase > 1L:
+            self.check_vector_bound(maxbase ** min(maxexponent, 64L))
+        return numpy.power(base, exponent)
+
+    def v_func_call(self, node, tasks):
+        "Invoke a run-time library function over a vector of tasks."
+        funcname = node.attr
+
+        # The mesh and torus functions share a common set of
+        # dimensions, which we require to be the same for every task.
+        if funcname[:5] == "MESH_":
+            dimensions = self.process_node(node.kids[0])
+            for dim_wrap in dimensions:
+                if type(dim_wrap[0]) not in [types.IntType, types.LongType]:
+                    raise VectorizationError
+            gdimens = [long(dim_wrap[0]) for dim_wrap in dimensions]
+            gdimens = (gdimens + [1L, 1L, 1L])[:3]
+            gtorus = [dim_wrap[1] for dim_wrap in dimensions]
+            gtorus = (gtorus + [False, False, False])[:3]
+            if funcname == "MESH_NEIGHBOR":
+                gtask = self.evaluate_vector(node.kids[1], tasks)
+                gdeltas = self.vector_arguments(node.kids[2], tasks)
+                gdeltas = (gdeltas + [0L, 0L, 0L])[:3]
+                return self.vector_mesh_neighbor(gdimens, gtorus, gtask, gdeltas)
+            elif funcname == "MESH_COORDINATE":
+                gtask = self.evaluate_vector(node.kids[1], tasks)
+                gcoord = self.evaluate_vector(node.kids[2], tasks)
+                if numpy.any((gcoord < 0) | (gcoord > 2)):
+                    raise VectorizationError
+                coords = self.vector_mesh_coordinates(gdimens, gtask)[1:]
+                return numpy.where(gcoord == 0, coords[0],
+                                   numpy.where(gcoord == 1, coords[1], coords[2]))
+            else:
+                gtask1 = self.evaluate_vector(node.kids[1], tasks)
+                gtask2 = self.evaluate_vector(node.kids[2], tasks)
+                return self.vector_mesh_distance(gdimens, gtorus, gtask1, gtask2)
+
+        # Ensure we have the correct number of arguments.  Otherwise,
+        # let the scalar code report the error.
+        funcparams = self.vector_arguments(node.kids[0], tasks)
+        num_params = len(funcparams)
+        function_arguments = {
+            "ABS":               [1],
+            "KNOMIAL_CHILD":     [2, 3, 4],
+            "KNOMIAL_CHILDREN":  [1, 2, 3],
+            "KNOMIAL_PARENT":    [1, 2, 3],
+            "TREE_CHILD":        [2, 3],
+            "TREE_PARENT":       [1, 2]
+        }
+        if funcname in ["MIN", "MAX"]:
+            if num_params < 2:
+                raise VectorizationError
+        else:
+            valid_num_params = function_arguments[funcname]
+            if num_params not in valid_num_params:
+                raise VectorizationError
+
+        # Evaluate the function.
+        if funcname == "ABS":
+            return numpy.abs(funcparams[0])
+        elif funcname == "MIN":
+            return reduce(numpy.minimum, funcparams)
+        elif funcname == "MAX":
+            return reduce(numpy.maximum, funcparams)
+        elif funcname[:5] == "TREE_":
+            # Tree arity defaults to 2.
+            if num_params == valid_num_params[0]:
+                funcparams.append(2L)
+            arity = funcparams[-1]
+            if numpy.any(arity < 1):
+                raise VectorizationError
+            task = funcparams[0]
+            if funcname == "TREE_PARENT":
+                return numpy.where(task <= 0, -1, (task-1) // arity)
+            child = funcparams[1]
+            self.check_vector_bound(self.vector_bound(task) * self.vector_bound(arity) +
+                                    self.vector_bound(child) + 1L)
+            return numpy.where((child < 0) | (child >= arity), -1, task*arity + child + 1)
+        else:
+            # k defaults to 2 in k-nomial tree and the number of tasks
+            # defaults to num_tasks.
+            if num_params < valid_num_params[-2]:
+                funcparams.append(2L)
+            if num_params < valid_num_params[-1]:
+                funcparams.append(long(self.numtasks))
+            if funcname == "KNOMIAL_CHILDREN":
+                funcparams.insert(1, 0L)
+            (arity, numtasks) = funcparams[-2:]
+            if type(arity) != types.LongType or type(numtasks) != types.LongType or arity < 2L:
+                raise VectorizationError
+            task = self.as_vector(funcparams[0], tasks)
+            if funcname == "KNOMIAL_PARENT":
+                return self.vector_knomial_parent(task, arity, numtasks)
+            else:
+                child = self.as_vector(funcparams[1], tasks)
+                return self.vector_knomial_child(task, child, arity, numtasks,
+                                                 funcname == "KNOMIAL_CHILDREN")
+
+    def vector_mesh_coordinates(self, dimens, task):
+        """Map a vector of tasks to a vector of x, y, and z
+        coordinates as in the run-time library.  Return a vector
+        indicating which tasks lie on the mesh and vectors of
+        coordinates (-1 for tasks that lie off the mesh)."""
+        (width, height, depth) = dimens
+        meshelts = width * height * depth
+        if meshelts == 0L or width < 0L or height < 0L or depth < 0L:
+            raise VectorizationError
+        self.check_vector_bound(meshelts)
+        onmesh = (task >= 0) & (task < meshelts)
+        xpos = numpy.where(onmesh, task % width, -1)
+        ypos = numpy.where(onmesh, (task % (width*height)) // width, -1)
+        zpos = numpy.where(onmesh, task // (width*height), -1)
+        return (onmesh, xpos, ypos, zpos)
+
+    def vector_mesh_neighbor(self, dimens, torus, task, deltas):
+        "Return a vector of neighbors on a 3-D mesh or torus."
+        coords = self.vector_mesh_coordinates(dimens, task)
+        onmesh = coords[0]
+        newcoords = []
+        for dim in range(3):
+            self.check_vector_bound(dimens[dim] + self.vector_bound(deltas[dim]))
+            pos = coords[dim+1] + deltas[dim]
+            if torus[dim]:
+                pos = numpy.mod(pos, dimens[dim])
+            onmesh = onmesh & (pos >= 0) & (pos < dimens[dim])
+            newcoords.append(pos)
+        (width, height) = dimens[:2]
+        return numpy.where(onmesh,
+                           newcoords[2]*height*width + newcoords[1]*width + newcoords[0],
+                           -1)
+
+    def vector_mesh_distance(self, dimens, torus, task1, task2):
+        "Return a vector of Manhattan distances on a 3-D mesh or torus."
+        coords1 = self.vector_mesh_coordinates(dimens, task1)
+        coords2 = self.vector_mesh_coordinates(dimens, task2)
+        distance = 0L
+        for dim in range(3):
+            delta = numpy.abs(coords1[dim+1] - coords2[dim+1])
+            if torus[dim]:
+                delta = numpy.where(delta > dimens[dim]/2L, dimens[dim] - delta, delta)
+            distance = distance + delta
+        return numpy.where(coords1[0] & coords2[0], distance, -1)
+
+    def vector_knomial_powers(self, arity, numtasks):
+        """Return the place value of each base-ARITY digit needed to
+        represent every task in a k-nomial tree."""
+        powers = [1L]
+        powk = arity
+        while powk-1L < numtasks-1L:
+            powers.append(powk)
+            powk = powk * arity
+        return powers
+
+    def vector_knomial_parent(self, task, arity, numtasks):
+        "Return a vector of parents in a k-nomial tree."
+        # Clear each task's most significant nonzero base-k digit.
+        result = numpy.repeat(numpy.int64(-1), len(task))
+        pending = (task > 0) & (task < numtasks)
+        powers = self.vector_knomial_powers(arity, numtasks)
+        powers.reverse()
+        for power in powers:
+            digit = (task // power) % arity
+            found = pending & (digit != 0)
+            result = numpy.where(found, task - digit*power, result)
+            pending = pending & ~found
+        if numpy.any(pending):
+            raise VectorizationError
+        return result
+
+    def vector_knomial_child(self, task, child, arity, numtasks, count_only):
+        """Return a vector of children in a k-nomial tree or, if
+        COUNT_ONLY is true, a vector of the number of children."""
+        # Children are ordered by increasing digit position then by
+        # increasing digit value.  Only the digits above a task's most
+        # significant nonzero digit can be set.
+        if numpy.any(task < 0):
+            raise VectorizationError
+        valid = (task < numtasks) & (child >= 0)
+        result = numpy.repeat(numpy.int64(-1), len(task))
+        num_children = numpy.zeros(len(task), dtype=numpy.int64)
+        remaining = child.copy()
+        for power in self.vector_knomial_powers(arity, numtasks):
+            num_here = numpy.where(valid & (task < power),
+                                   numpy.minimum(arity-1L, (numtasks-1L-task) // power),
+                                   0)
+            found = valid & (remaining >= 0) & (remaining < num_here)
+            result = numpy.where(found, task + (remaining+1)*power, result)
+            remaining = remaining - num_here
+            num_children = num_children + num_here
+        if count_only:
+            return numpy.where(valid, num_children, -1)
+        else:
+            return result
+
+
     #-----------------------------------#
     # AST interpretation: trivial       #
     # nodes and catch-all functionality #
@@ -1759,6 +2984,14 @@ class NCPTL_CodeGen:
             result = self.process_node(kid)
         return result
 
+    def n_simple_stmt(self, node):
+        """Execute a statement then, if enough new events have
+        accumulated, simulate as many of them as possible."""
+        result = self.n_trivial_node(node)
+        if self.event_window > 0L and self.events_buffered >= self.event_window:
+            self.process_available_events()
+        return result
+
     def n_undefined(self, node):
         "Issue an internal-error message when given an undefined node type."
         self.errmsg.error_internal('I don\'t know how to process nodes of type "%s"' % node.type)
@@ -1820,8 +3053,14 @@ class NCPTL_CodeGen:
                     self.errmsg.error_fatal("the --%s option accepts only 0 or 1" % opt[2])
             elif opt[0] == "latency_list":
                 self.latency_list = self.parse_latency_hierarchy(opt[-1])
+                self.latency_groups = None
             elif opt[0] == "kill_reps":
                 self.kill_reps = opt[-1]
+            elif opt[0] == "event_window":
+                if opt[-1] < 0L:
+                    self.errmsg.error_fatal("the --%s option accepts only nonnegative numbers" % opt[2])
+                if not self.retain_events:
+                    self.event_window = opt[-1]
             else:
                 self.scopes[0][opt[0]] = opt[-1]
 
@@ -2028,21 +3267,19 @@ class NCPTL_CodeGen:
             if warmups > 0L:
                 suppress = self.suppress_output
                 self.suppress_output = 1
-                for i in range(0L, warmups):
-                    self.process_node(node.kids[2])
+                self.repeat_statement(node, statement_node, warmups)
                 self.suppress_output = suppress
             if node.attr == "synchronized":
                 newevents = {}
                 tasklist = range(0, self.numtasks)
                 unique_id = self.get_unique_id()
-                for task in tasklist:
-                    self.push_event(self.Event("SYNC", task=task, peers=tasklist,
-                                               srclines=(node.lineno0, node.lineno1),
-                                               collective_id=unique_id))
+                self.push_collective_event(self.Event("SYNC", task=None, peers=tasklist,
+                                                      srclines=(node.lineno0, node.lineno1),
+                                                      collective_id=unique_id),
+                                           tasklist)
 
         # Perform the regular repetitions.
-        for i in range(0L, self.process_node(node.kids[0])):
-            self.process_node(statement_node)
+        self.repeat_statement(node, statement_node, self.process_node(node.kids[0]))
 
     def n_for_each(self, node):
         "Repeat a statement for each element in a list of ranges."
@@ -2089,15 +3326,14 @@ class NCPTL_CodeGen:
                 newevents = {}
                 tasklist = range(0, self.numtasks)
                 unique_id = self.get_unique_id()
-                for task in tasklist:
-                    self.push_event(self.Event("SYNC", task=task, peers=tasklist,
-                                               srclines=(node.lineno0, node.lineno1),
-                                               collective_id=unique_id))
+                self.push_collective_event(self.Event("SYNC", task=None, peers=tasklist,
+                                                      srclines=(node.lineno0, node.lineno1),
+                                                      collective_id=unique_id),
+                                           tasklist)
 
         # Because time isn't particularly meaningful here, we simply
         # perform a fixed number of repetitions.
-        for i in range(0, self.for_time_reps):
-            self.process_node(statement_node)
+        self.repeat_statement(node, statement_node, self.for_time_reps)
 
     def n_if_stmt(self, node):
         "Execute a statement if a given condition is true."
@@ -2244,20 +3480,19 @@ class NCPTL_CodeGen:
             self.scopes.pop(0)
         self.scopes.pop(0)
 
-        # Construct and evaluate a closure that pushes all of the new
-        # events on the appropriate event list.
-        def push_send_events(self, node, makecopy=1):
-            for receiver, eventlist in newreceives.items():
-                if makecopy:
-                    eventlist = copy.deepcopy(eventlist)
-                for event in eventlist:
-                    self.push_event(event)
-            for sender, eventlist in newsends.items():
-                if makecopy:
-                    eventlist = copy.deepcopy(eventlist)
-                for event in eventlist:
-                    self.push_event(event)
-        push_send_events(self, node, 0)
+        # Construct and evaluate a closure that pushes an instance of
+        # each new event on the appropriate event list.  The events
+        # we constructed serve only as templates so they can be
+        # reused without being modified by the simulation.
+        templates = []
+        for receiver, eventlist in newreceives.items():
+            templates.extend(eventlist)
+        for sender, eventlist in newsends.items():
+            templates.extend(eventlist)
+        def push_send_events(self, node, templates=templates):
+            for template in templates:
+                self.push_event(template.instantiate())
+        push_send_events(self, node)
 
         # If all of our arguments are constant, store the closure for
         # next time.
@@ -2335,14 +3570,14 @@ class NCPTL_CodeGen:
                 self.scopes.pop(0)
             self.scopes.pop(0)
 
-        # Construct and evaluate a closure that pushes all of the new
-        # events on the appropriate event list.
-        def push_receive_events(self, node, makecopy=1, eventlist=eventlist):
-            if makecopy:
-                eventlist = copy.deepcopy(eventlist)
-            for event in eventlist:
-                self.push_event(event)
-        push_receive_events(self, node, 0)
+        # Construct and evaluate a closure that pushes an instance of
+        # each new event on the appropriate event list.  As in the
+        # SEND statement, the events we constructed serve only as
+        # templates.
+        def push_receive_events(self, node, templates=eventlist):
+            for template in templates:
+                self.push_event(template.instantiate())
+        push_receive_events(self, node)
 
         # If all of our arguments are constant, store the closure for
         # next time.
@@ -2363,9 +3598,9 @@ class NCPTL_CodeGen:
         unique_id = self.get_unique_id()
         tasklist = map(int, tasklist)
         newevents = {}
-        for task in self.filter_task_list(tasklist):
-            self.push_event(self.Event("SYNC", task=task, peers=tasklist,
-                                       srclines=srclines, collective_id=unique_id))
+        self.push_collective_event(self.Event("SYNC", task=None, peers=tasklist,
+                                              srclines=srclines, collective_id=unique_id),
+                                   self.filter_task_list(tasklist))
 
     def n_mcast_stmt(self, node):
         "Multicast a message from one task to multiple others."
@@ -2386,12 +3621,11 @@ class NCPTL_CodeGen:
                 if self.virtrank in rtasklist:
                     rtasklist.remove(self.virtrank)
                 tasklist = map(int, [self.virtrank]+rtasklist)
-                for task in tasklist:
-                    event = self.Event("MCAST", task=task, peers=tasklist,
-                                       srclines=srclines, tag=smsgspec[5],
-                                       msgsize=smsgspec[2], attributes=sattribs,
-                                       collective_id=unique_id)
-                    self.push_event(event)
+                event = self.Event("MCAST", task=None, peers=tasklist,
+                                   srclines=srclines, tag=smsgspec[5],
+                                   msgsize=smsgspec[2], attributes=sattribs,
+                                   collective_id=unique_id)
+                self.push_collective_event(event, tasklist)
         self.scopes.pop(0)
 
     def n_reduce_stmt(self, node):
@@ -2433,11 +3667,10 @@ class NCPTL_CodeGen:
         srclines = (node.lineno0, node.lineno1)
         peerlist = [stasklist, rtasklist]
         unique_id = self.get_unique_id()
-        for task in tasklist:
-            event = self.Event("REDUCE", task=task, peers=peerlist,
-                               srclines=srclines, tag=tag, msgsize=message_size,
-                               attributes=data_type, collective_id=unique_id)
-            self.push_event(event)
+        event = self.Event("REDUCE", task=None, peers=peerlist,
+                           srclines=srclines, tag=tag, msgsize=message_size,
+                           attributes=data_type, collective_id=unique_id)
+        self.push_collective_event(event, tasklist)
 
 
     #-------------------#
@@ -2450,22 +3683,11 @@ class NCPTL_CodeGen:
         leftovers = []           # List of leftover-event error messages
         self.context = "float"   # Some futures may need to know the context.
 
-        # Complete all events on all tasks.
+        # Complete as many events as possible on all tasks then
+        # determine why the remaining tasks are blocked.
         self.initialize_opmethod()
-        for task in range(0, self.numtasks):
-            # Don't do anything if we know we're stuck.
-            if self.stuck_tasks.has_key(task):
-                continue
-
-            # Process the current task until no incomplete events remain.
-            eventlist = self.eventlist[task]
-            while not eventlist.all_complete():
-                errstring = self.process_fully_task_event(task)
-                if errstring == None:
-                    eventlist.try_posting_all()
-                else:
-                    leftovers.append((task, errstring))
-                    break
+        self.schedule_tasks()
+        leftovers.extend(self.diagnose_blocked_tasks())
 
         # Determine if any asynchronous events were not waited for.
         not_waited = {}
@@ -2523,6 +3745,23 @@ class NCPTL_CodeGen:
             error_message = error_message + string.join(leftovers, "\n   * ")
             self.errmsg.warning(error_message)
 
+    def process_available_events(self):
+        """
+             Process as many of the events accumulated so far as
+             possible then discard those that have completed.  Unlike
+             process_all_events, this method reports no errors
+             because a blocked task may yet be satisfied by events
+             that have not been generated.
+        """
+        prev_context = self.context
+        self.context = "float"   # Some futures may need to know the context.
+        self.initialize_opmethod()
+        self.schedule_tasks()
+        for eventlist in self.eventlist:
+            eventlist.retire_completed()
+        self.events_buffered = 0L
+        self.context = prev_context
+
     def initialize_opmethod(self):
         "Initialize the map from operation to method call that processes it."
         self.opmethod = {"SEND"      : self.process_send,
@@ -2544,37 +3783,105 @@ class NCPTL_CodeGen:
                          "COMPUTE"   : self.process_no_op,
                          "TOUCH"     : self.process_no_op}
 
-    def process_fully_task_event(self, task):
+    def schedule_tasks(self):
         """
-             Process the first incomplete event for a given task,
-             recursively processing that event's dependencies on other
-             tasks.  Assumption: The task contains at least one
-             incomplete event.
+             Complete events on all tasks until no task can make
+             further progress.  Tasks that may be able to run are
+             kept on a stack of ready tasks.  A task that blocks is
+             recorded in a wait-for graph (self.waiting_on) as
+             waiting for the task that blocked it and is made ready
+             again only when that task -- or the blocked task itself,
+             as a side effect of a collective operation -- completes
+             an event.  The blocking task is run next so that chains
+             of dependencies are resolved in the order in which they
+             were encountered.
         """
+        numtasks = int(self.numtasks)
+        self.waiting_on = [None] * numtasks
+        waiters = map(lambda task: [], range(numtasks))
+        ready = filter(lambda task, self=self: not self.stuck_tasks.has_key(task),
+                       range(numtasks-1, -1, -1))
+        while ready != []:
+            task = ready.pop()
+            if self.waiting_on[task] != None or self.eventlist[task].all_complete():
+                continue
 
-        # First check for the easy case: the task can complete immediately.
-        blocked_on, numcompleted = self.process_task_while_able(task)
-        if blocked_on == None:
-            return None
+            # Process the task until it completes or blocks.
+            self.progressed_tasks = {}
+            blocked_on, numcompleted = self.process_task_while_able(task)
+            self.eventlist[task].try_posting_all()
+            if blocked_on != None:
+                self.waiting_on[task] = blocked_on
+                waiters[blocked_on].append(task)
+                if self.waiting_on[blocked_on] == None:
+                    ready.append(blocked_on)
+
+            # Wake every task that was waiting on a task that made
+            # progress as well as every blocked task that progressed.
+            progressed = self.progressed_tasks.keys()
+            progressed.sort()
+            progressed.reverse()
+            for peer in progressed:
+                if peer != task and self.waiting_on[peer] != None:
+                    self.waiting_on[peer] = None
+                    ready.append(peer)
+                peer_waiters = waiters[peer]
+                peer_waiters.reverse()
+                for waiter in peer_waiters:
+                    if self.waiting_on[waiter] == peer:
+                        self.waiting_on[waiter] = None
+                        ready.append(waiter)
+                waiters[peer] = []
+
+    def diagnose_blocked_tasks(self):
+        """
+             Walk the wait-for graph produced by schedule_tasks and
+             return a list of {task, error message} pairs, one for
+             each incomplete task.  A chain of dependencies ends
+             either in a task that has already terminated or in a
+             cycle (i.e., deadlock), in which case all of the tasks
+             along the chain are marked as stuck and their unposted
+             events are deleted.
+        """
+        leftovers = []
+        chain_end = {}        # Map from a task to the end of its chain of dependencies
+        for task in range(0, self.numtasks):
+            # Don't do anything if we know we're stuck.
+            if self.stuck_tasks.has_key(task) or self.eventlist[task].all_complete():
+                continue
 
-        # Build up a list of dependencies until some task completes or
-        # we encounter a cycle of dependencies (i.e., deadlock).
-        dependencies = [task]
-        while blocked_on != None:
-            # Abort if the task is blocked on a peer which will never
-            # satisfy it.
-            if self.eventlist[blocked_on].all_complete():
-                return ("Task %d terminated before satisfying task %d's %s operation" %
-                        (blocked_on, task,
-                         self.eventlist[task].get_first_incomplete().operation))
-
-            # Stop processing the current task if it's either
-            # deadlocked or blocked -- possibly indirectly -- on a
-            # deadlocked task.
-            dependencies.append(blocked_on)
-            try:
-                # Construct a list of deadlocked tasks.
-                deadlock = dependencies[dependencies[:-1].index(blocked_on):]
+            # Follow the chain of dependencies until we reach either
+            # a terminated task or a task we've already encountered.
+            dependencies = [task]
+            chain_index = {task: 0}
+            blocked_on = self.waiting_on[task]
+            while not chain_end.has_key(blocked_on):
+                if blocked_on == None:
+                    self.errmsg.error_internal("Task %d is neither blocked nor complete" %
+                                               dependencies[-1])
+                if self.eventlist[blocked_on].all_complete():
+                    chain_end[blocked_on] = ("terminated", blocked_on)
+                    break
+                if chain_index.has_key(blocked_on):
+                    # Construct a list of deadlocked tasks.
+                    deadlock = dependencies[chain_index[blocked_on]:] + [blocked_on]
+                    chain_end[blocked_on] = ("deadlocked",
+                                             string.join(map(str, deadlock), " --> "))
+                    break
+                chain_index[blocked_on] = len(dependencies)
+                dependencies.append(blocked_on)
+                blocked_on = self.waiting_on[blocked_on]
+            endtype, endinfo = chain_end[blocked_on]
+            for deptask in dependencies:
+                chain_end[deptask] = (endtype, endinfo)
+
+            # Report either premature termination or deadlock.
+            if endtype == "terminated":
+                leftovers.append((task,
+                                  "Task %d terminated before satisfying task %d's %s operation" %
+                                  (endinfo, task,
+                                   self.eventlist[task].get_first_incomplete().operation)))
+            else:
                 for deadtask in dependencies:
                     # Delete all events following a stuck event.
                     eventlist = self.eventlist[deadtask]
@@ -2583,27 +3890,8 @@ class NCPTL_CodeGen:
                     self.stuck_tasks[deadtask] = 1
 
                 # Tell the user which tasks have deadlocked.
-                error_message = "The following tasks have deadlocked: "
-                error_message = error_message + string.join(map(str, deadlock), " --> ")
-                return error_message
-            except ValueError:
-                pass
-
-            # If the last link in the chain makes progress we can
-            # break out of the loop and unwind the chain.
-            blocked_on, numcompleted = self.process_task_while_able(blocked_on)
-            if numcompleted > 0:
-                break
-
-        # Unwind the chain of dependencies by attempting to complete
-        # each task in the chain (except the first, which we already
-        # completed).  Note that we're not guaranteed to be successful
-        # because an event may depend on multiple other events but
-        # we've satisfied only one of them.
-        dependencies.reverse()
-        for deptask in dependencies[1:]:
-            self.process_task_while_able(deptask)
-        return None
+                leftovers.append((task, "The following tasks have deadlocked: " + endinfo))
+        return leftovers
 
     def process_task_while_able(self, task):
         """
@@ -2662,23 +3950,22 @@ class NCPTL_CodeGen:
         task = wait_event.task
 
         # First pass: Ensure that all events are ready to complete.
-        # If not, return the event on which we're blocked.
-        unpop_list = []
-        try:
-            for event in self.pendingevents[task]:
-                if event.operation == "SEND":
-                    pass
-                elif event.operation == "RECEIVE":
-                    matched_event = self.msgqueue[task].pop_match(event)
-                    if matched_event == None:
-                        return event.peers[0]
-                    unpop_list.insert(0, (task, event, matched_event))
-                else:
-                    self.errmsg.error_internal('Unrecognized event type "%s"' % event.operation)
-        finally:
-            # Restore the message queue to its previous state.
-            for task, event, matched_event in unpop_list:
-                self.msgqueue[task].unpop_match(event, matched_event)
+        # If not, return the event on which we're blocked.  Rather
+        # than pop and re-push matching messages we merely ensure
+        # that each (source, tag, size) queue holds at least as many
+        # messages as there are pending receives that want one.
+        msgqueue = self.msgqueue[task]
+        num_wanted = {}
+        for event in self.pendingevents[task]:
+            if event.operation == "SEND":
+                pass
+            elif event.operation == "RECEIVE":
+                matchkey = (event.peers[0], event.tag, event.msgsize)
+                num_wanted[matchkey] = num_wanted.get(matchkey, 0) + 1
+                if msgqueue.count_matches(event) < num_wanted[matchkey]:
+                    return event.peers[0]
+            else:
+                self.errmsg.error_internal('Unrecognized event type "%s"' % event.operation)
 
         # Second pass: Complete all events.
         remote_senders = []
@@ -2697,19 +3984,17 @@ class NCPTL_CodeGen:
 
     def process_sync(self, event):
         "Process a SYNC event."
-
-        # First pass: Ensure that all events are ready to complete.
-        barrier_events = []
-        for peer in event.peers:
-            self.eventlist[peer].try_posting_all()
-            inc_ev = self.eventlist[peer].get_first_incomplete()
-            if inc_ev.posttime == None or not self.collectives_match(inc_ev, event):
-                return peer
-            barrier_events.append(inc_ev)
-
-        # Second pass: Complete all events.
-        for peer in event.peers:
-            self.eventlist[peer].complete(barrier_events)
+        # Wait until every participant has reached the barrier.
+        collective = self.arrive_at_collective(event, 1)
+        missing_task = collective.find_missing()
+        if missing_task != None:
+            return missing_task
+
+        # Complete all events at once.
+        barrier_events = collective.get_events()
+        for peer in collective.peers:
+            self.eventlist[peer].complete(barrier_events, peertime=collective.peertime)
+        del self.collectives[event.collective_id]
         return None
 
     def process_mcast(self, event):
@@ -2717,28 +4002,33 @@ class NCPTL_CodeGen:
 
         # Handle the case in which we synchronize after a multicast.
         if self.mcastsync:
-            # First pass: Ensure that all events are ready to complete.
-            mcast_events = []
-            for peer in event.peers:
-                self.eventlist[peer].try_posting_all()
-                inc_ev = self.eventlist[peer].get_first_incomplete()
-                if inc_ev.posttime == None or not self.collectives_match(inc_ev, event):
-                    return peer
-                mcast_events.append(inc_ev)
-                if inc_ev.msgsize != mcast_events[0].msgsize:
-                    return inc_ev.task
+            # Wait until every participant has reached the multicast.
+            # The root contributes its message latency; everyone else
+            # is considered an equal.
+            collective = self.arrive_at_collective(event, event.task == event.peers[0])
+            missing_task = collective.find_missing()
+            if missing_task != None:
+                return missing_task
+            mcast_events = collective.get_events()
+            rootev = mcast_events[0]
+            child_events = mcast_events[1:]
+            for childev in child_events:
+                if childev.msgsize != rootev.msgsize:
+                    return childev.task
 
             # We don't actually need to manipulate the message queue
             # to perform the multicast.  We just handle all cases at
             # once.
-            rootev = mcast_events[0]
-            self.eventlist[rootev.task].complete(peerlist=[mcast_events[0]],
-                                                 nolat_peerlist=mcast_events[1:])
+            self.eventlist[rootev.task].complete(peerlist=[rootev],
+                                                 nolat_peerlist=child_events,
+                                                 peertime=collective.peertime)
             self.update_counters(rootev, "SEND")
-            for childev in mcast_events[1:]:
-                self.eventlist[childev.task].complete(peerlist=[mcast_events[0]],
-                                                      nolat_peerlist=mcast_events[1:])
+            for childev in child_events:
+                self.eventlist[childev.task].complete(peerlist=[rootev],
+                                                      nolat_peerlist=child_events,
+                                                      peertime=collective.peertime)
                 self.update_counters(childev, "RECEIVE")
+            del self.collectives[event.collective_id]
             return None
 
         # Now handle the default, non-synchronizing case.
@@ -2758,6 +4048,33 @@ class NCPTL_CodeGen:
                 self.update_counters(event, "RECEIVE")
         return None
 
+    def arrive_at_collective(self, event, with_latency):
+        """
+             Record that a task reached a collective operation and
+             return the Collective object that tracks the operation's
+             participants.  The event contributes its post time plus
+             either its message latency (if WITH_LATENCY is true) or
+             its post-to-complete overhead to the time at which every
+             participant completes.  Arriving counts as progress so
+             that tasks waiting on the arriving task look for another
+             participant to wait on.
+        """
+        try:
+            collective = self.collectives[event.collective_id]
+        except KeyError:
+            collective = self.Collective(event.peers)
+            self.collectives[event.collective_id] = collective
+        if not collective.arrived.has_key(event.task):
+            eventlist = self.eventlist[event.task]
+            eventlist.try_posting_all()
+            if with_latency:
+                peertime = event.posttime + eventlist.message_latency(event)
+            else:
+                peertime = event.posttime + eventlist.post_complete_overhead(event)
+            collective.arrive(event, peertime)
+            self.progressed_tasks[event.task] = 1
+        return collective
+
     def process_reduce(self, event):
         "Process a REDUCE event."
         # Acquire a list and hash of senders and receivers.
@@ -2786,6 +4103,8 @@ class NCPTL_CodeGen:
             reduce_send_events = []
             for peer in allpeers:
                 self.eventlist[peer].try_posting_all()
+                if self.eventlist[peer].all_complete():
+                    return peer
                 inc_ev = self.eventlist[peer].get_first_incomplete()
                 if inc_ev.posttime == None or not self.collectives_match(inc_ev, event):
                     return peer
@@ -112,8 +112,10 @@ class NCPTL_CodeGen(codegen_interpret.NCPTL_CodeGen):
             self.eventlist[task].codegen = self
             self.eventlist[task].task = task
 
-        # Remove log-file options and add an option for showing all events.
+        # Remove log-file options, retain all events for visualization,
+        # and add an option for showing all events.
         self.set_log_file_status(0)
+        self.set_event_retention(1)
         self.options.extend([
             ["arrowwidth",
              "Python expression to map m, representing a message size in bytes, to an arrow width in points",
@@ -644,6 +646,10 @@ class NCPTL_CodeGen(codegen_interpret.NCPTL_CodeGen):
                                             self.pendingevents[wait_event.task]))
         return codegen_interpret.NCPTL_CodeGen.process_wait_all(self, wait_event)
 
+    class Event(codegen_interpret.NCPTL_CodeGen.Event):
+        # Additional fields with which we annotate events
+        __slots__ = ["clique", "await_receives", "await_sends", "offset"]
+
     class EventList(codegen_interpret.NCPTL_CodeGen.EventList):
         def message_latency(self, event):
             "Return the message latency for a given event."
@@ -686,7 +692,7 @@ class NCPTL_CodeGen(codegen_interpret.NCPTL_CodeGen):
             # complete depending upon the value of the ALLEVENTS flag.
             return self.codegen.allevents
 
-        def complete(self, peerlist=None, nolat_peerlist=None):
+        def complete(self, peerlist=None, nolat_peerlist=None, peertime=None):
             """
                  Mark the first incomplete event as completed and
                  return the completion time.  We additionally keep
@@ -694,7 +700,7 @@ class NCPTL_CodeGen(codegen_interpret.NCPTL_CodeGen):
                  and also assign CLIQUE to the set of matched
                  communication events.
             """
-            newtime = codegen_interpret.NCPTL_CodeGen.EventList.complete(self, peerlist, nolat_peerlist)
+            newtime = codegen_interpret.NCPTL_CodeGen.EventList.complete(self, peerlist, nolat_peerlist, peertime)
 
             # Keep track of blocking receives.
             thisev = self.events[self.first_incomplete-1]
@@ -746,7 +752,11 @@ class NCPTL_CodeGen(codegen_interpret.NCPTL_CodeGen):
     #----------------------------------#
 
     def visualize_events(self, filesource, filetarget, sourcecode):
-        'Visualize all of the events dumped by the interpret backend.'
+        """
+             Visualize all of the events dumped by the interpret
+             backend.  Return a generator that yields the lines of
+             LaTeX code in order.
+        """
 
         # Tell each event its offset into the corresponding task's event list.
         for eventlist in self.eventlist:
@@ -768,16 +778,23 @@ class NCPTL_CodeGen(codegen_interpret.NCPTL_CodeGen):
         self.maxtime = max(filter(lambda ct: ct!=None, map(lambda ev: ev.completetime, eventlist)) +
                            map(lambda ev: ev.posttime, eventlist))
 
+        # Produce the LaTeX code incrementally.
+        return self.latex_document(filesource, filetarget, sourcecode, eventlist)
+
+    def latex_document(self, filesource, filetarget, sourcecode, eventlist):
+        "Yield each line of a LaTeX document that visualizes EVENTLIST."
         # Produce a LaTeX prologue.
-        latexcode = []
-        latexcode.extend(self.latex_header_comments(filesource, filetarget, sourcecode, eventlist))
-        latexcode.append("")
-        latexcode.extend(self.latex_preamble())
-        latexcode.append("")
+        for oneline in self.latex_header_comments(filesource, filetarget, sourcecode, eventlist):
+            yield oneline
+        yield ""
+        for oneline in self.latex_preamble():
+            yield oneline
+        yield ""
 
         # Draw all of the nodes (one for each {task, time} pair).
-        latexcode.extend(self.latex_draw_nodes())
-        latexcode.append("")
+        for oneline in self.latex_draw_nodes():
+            yield oneline
+        yield ""
 
         # Define a mapping from an operation to a method.
         op2method = {
@@ -787,36 +804,35 @@ class NCPTL_CodeGen(codegen_interpret.NCPTL_CodeGen):
             "REDUCE"   : self.vis_reduce}
 
         # Process every event on every task.
-        latexcode.extend([
-            r"% Draw all of the communication operations.",
-            r"% PLACEHOLDER: COMMUNICATION",
-            r"\psset{linecolor=\sendrecvcolor}"])
+        yield r"% Draw all of the communication operations."
+        yield r"% PLACEHOLDER: COMMUNICATION"
+        yield r"\psset{linecolor=\sendrecvcolor}"
         for event in eventlist:
             try:
-                latexcode.extend(op2method[event.operation](event))
+                vislines = op2method[event.operation](event)
             except KeyError:
-                pass
-        latexcode.append("")
+                continue
+            for oneline in vislines:
+                yield oneline
+        yield ""
 
         # Draw Xs atop deadlocked nodes.
-        latexcode.extend([
-            r'% Draw an "X" atop every permanently blocked node.',
-            r"% PLACEHOLDER: DEADLOCK"])
+        yield r'% Draw an "X" atop every permanently blocked node.'
+        yield r"% PLACEHOLDER: DEADLOCK"
         for task in range(0, self.numtasks):
             if self.stucktimes[task] != None:
-                latexcode.append(r'\drawX{%d}' % task)
-        latexcode.append("")
+                yield r'\drawX{%d}' % task
+        yield ""
 
         # Optionally annotate event postings and completions.
         if self.annotations > 0:
-            latexcode.extend(self.latex_annotate_nodes(eventlist))
-            latexcode.append("")
+            for oneline in self.latex_annotate_nodes(eventlist):
+                yield oneline
+            yield ""
 
         # Produce a LaTeX epilogue.
-        latexcode.extend(self.latex_epilogue())
-
-        # Return the resulting LaTeX code.
-        return latexcode
+        for oneline in self.latex_epilogue():
+            yield oneline
 
 
     #------------------------#
@@ -1207,7 +1223,7 @@ class NCPTL_CodeGen(codegen_interpret.NCPTL_CodeGen):
             return []
 
         # Split the list of peers into contiguous ranges.
-        peerlist = event.peers
+        peerlist = list(event.peers)
         peerlist.sort()
         peer_ranges = [[peerlist[0]]]
         for peer in peerlist[1:]:
@@ -62,6 +62,9 @@ import sys
 import os
 import string
 import time
+import struct
+import heapq
+import tempfile
 
 
 class NCPTL_CodeGen(codegen_interpret.NCPTL_CodeGen):
@@ -82,6 +85,7 @@ class NCPTL_CodeGen(codegen_interpret.NCPTL_CodeGen):
         self.inc_source = 1       # 0=exclude source lines; 1=include them
         self.inc_concev = 0       # 0=exclude coNCePTuaL event names; 1=include them
         self.dimemas_events = 0   # 1=extra events for Dimemas simulator; 0=skip
+        self.sort_buffer = 100000 # Maximum number of trace records to sort in memory
         self.comm_ops = ["SEND", "RECEIVE", "WAIT_ALL", "SYNC", "MCAST"]   # List of all communication operations
 
     def generate(self, ast, filesource='<stdin>', filetarget="-", sourcecode=None):
@@ -92,15 +96,18 @@ class NCPTL_CodeGen(codegen_interpret.NCPTL_CodeGen):
         for el in self.eventlist:
             el.codegen = self
 
-        # Remove log-file options and add an option changing the event
-        # frequency and one for including all events.
+        # Remove log-file options, retain all events for tracing, and
+        # add an option changing the event frequency and one for
+        # including all events.
         self.set_log_file_status(0)
+        self.set_event_retention(1)
         self.options.extend([
             ["evtime", "Paraver event time (ns)", "event-time", "P", 1000L],
             ["comptime", "Time spent in each non-communication event (ns)", "comp-time", "O", 0L],
             ["inc_source", "0=exclude references to coNCePTuaL source lines; 1=include them", "conc-source", "R", 1L],
             ["inc_concev", "0=exclude names of coNCePTuaL event types; 1=include them", "conc-events", "E", 0L],
-            ["inc_dimemas", "0=no Dimemas events; 1=extra events for Dimemas simulator", "dimemas-events", "D", 0L]])
+            ["inc_dimemas", "0=no Dimemas events; 1=extra events for Dimemas simulator", "dimemas-events", "D", 0L],
+            ["sortbuffer", "Maximum number of trace records to sort in memory", "sort-buffer", "B", 100000L]])
 
         # Perform a prefix traversal (roughly) and "trace" the results.
         self.process_node(ast)
@@ -307,6 +314,12 @@ VALUES
             if self.dimemas_events not in [0, 1]:
                 self.errmsg.error_fatal("the --%s option accepts only 0 or 1" % opt[2])
             return 1
+        elif opt[0] == "sortbuffer":
+            self.sort_buffer = int(opt[-1])
+            if self.sort_buffer < _ExternalSorter.min_records:
+                self.errmsg.error_fatal("the --%s option accepts only integers of at least %d" %
+                                        (opt[2], _ExternalSorter.min_records))
+            return 1
         elif hasattr(self.parent, "n_program_PROCESS_OPTION"):
             # Give our parent a chance to process the current option.
             return self.parent.n_program_PROCESS_OPTION(self, localvars)
@@ -332,6 +345,10 @@ VALUES
     # Method overrides #
     #------------------#
 
+    class Event(codegen_interpret.NCPTL_CodeGen.Event):
+        # Additional fields with which we annotate events
+        __slots__ = ["peerevents", "clique"]
+
     class EventList(codegen_interpret.NCPTL_CodeGen.EventList):
         def post_complete_overhead(self, event):
             "Return the overhead between posting and completing an event."
@@ -357,7 +374,7 @@ VALUES
             else:
                 return 0
 
-        def complete(self, peerlist=None, nolat_peerlist=None):
+        def complete(self, peerlist=None, nolat_peerlist=None, peertime=None):
             """
                  Mark the first incomplete event as completed and
                  return the completion time.  We additionally keep
@@ -365,7 +382,7 @@ VALUES
                  and also assign CLIQUE to the set of matched
                  communication events.
             """
-            newtime = codegen_interpret.NCPTL_CodeGen.EventList.complete(self, peerlist, nolat_peerlist)
+            newtime = codegen_interpret.NCPTL_CodeGen.EventList.complete(self, peerlist, nolat_peerlist, peertime)
 
             # Keep track of blocking receives.
             thisev = self.events[self.first_incomplete-1]
@@ -417,7 +434,11 @@ VALUES
     #--------------------------#
 
     def trace_events(self):
-        '"Trace" all of the events dumped by the interpret backend.'
+        """
+             "Trace" all of the events dumped by the interpret
+             backend.  Return a generator that yields the lines of
+             the Paraver trace in order.
+        """
         # Enumerate all operations that the coNCePTuaL interpreter knows about.
         self.op2number = {}
         for op in sorted(self.opmethod.keys()):
@@ -435,43 +456,53 @@ VALUES
         # Process every event on every task into an internal
         # representation of Paraver trace data, each record being a
         # tuple of {record type, start time, end time, task,
-        # event-specific data}.
+        # event-specific data}.  Records are sorted in batches of at
+        # most self.sort_buffer and spilled to a temporary file.
         self.peergroups = {}
         maxtime = 0L
-        paraver_ir = []
+        sorter = _ExternalSorter(self.sort_buffer)
         for evlist in self.eventlist:
             for event in evlist.events:
                 # Perform event processing common to all event types.
                 maxtime = max(maxtime, event.posttime, event.completetime)
                 if self.inc_concev:
-                    paraver_ir.append((2, event.posttime, None, event.task,
-                                       [(1000000, self.op2number[event.operation])]))
+                    sorter.add((2, event.posttime, None, event.task,
+                                [(1000000, self.op2number[event.operation])]))
                 if self.inc_source:
-                    paraver_ir.append((2, event.posttime, None, event.task,
-                                       [(1000001, event.srclines[0])]))
+                    sorter.add((2, event.posttime, None, event.task,
+                                [(1000001, event.srclines[0])]))
 
                 # Perform event-specific processing of each event.
                 try:
-                    paraver_ir.extend(op2method[event.operation](event))
+                    records = op2method[event.operation](event)
                 except KeyError:
-                    paraver_ir.extend(self.trace_non_comm(event))
+                    records = self.trace_non_comm(event)
+                for rec in records:
+                    sorter.add(rec)
 
-        # Output a Paraver header.
-        paraver_trace = []
+        # Prepare a Paraver header.
+        header = []
         timestr = time.strftime("%02d/%02m/%02Y at %02H:%02M", time.localtime())
         nodestr = "%d(1%s)" % (self.numtasks, ",1" * (self.numtasks-1))
         appstr = "%d(%s)" % (self.numtasks, string.join(["1:" + str(i) for i in range(1,self.numtasks+1)], ","))
-        paraver_trace.append("#Paraver (%s):%d_ns:%s:1:%s,%d" % \
-                                 (timestr, maxtime*self.time_increment+1,
-                                  nodestr, appstr, len(self.peergroups)))
+        header.append("#Paraver (%s):%d_ns:%s:1:%s,%d" % \
+                          (timestr, maxtime*self.time_increment+1,
+                           nodestr, appstr, len(self.peergroups)))
         for pgtasks, pgnum in sorted(self.peergroups.items(), key=lambda t_n: t_n[1]):
-            paraver_trace.append("c:1:%d:%d:%s" % \
-                                     (pgnum, len(pgtasks),
-                                      string.join(map(str, pgtasks), ":")))
-
-        # Sort the Paraver records by ascending time and descending
-        # record type and convert each record to a string.
-        for rec in sorted(paraver_ir, key=lambda ir: (ir[1], -ir[0], ir[3])):
+            header.append("c:1:%d:%d:%s" % \
+                              (pgnum, len(pgtasks),
+                               string.join(map(str, pgtasks), ":")))
+        return self.format_records(header, sorter.sorted_records(), maxtime)
+
+    def format_records(self, header, records, maxtime):
+        """
+             Yield each line of HEADER followed by each record in
+             RECORDS, which must already be sorted by ascending time
+             and descending record type, converted to a string.
+        """
+        for oneline in header:
+            yield oneline
+        for rec in records:
             if rec[0] == 1:
                 # State record
                 rectype, begin_time, end_time, task_id, state = rec
@@ -481,17 +512,17 @@ VALUES
                 except TypeError:
                     # Event never finished
                     end_time = maxtime * self.time_increment
-                paraver_trace.append("%d:%d:1:%d:1:%d:%d:%d" % \
-                                         (rectype, task_id+1, task_id+1,
-                                          begin_time, end_time, state))
+                yield "%d:%d:1:%d:1:%d:%d:%d" % \
+                      (rectype, task_id+1, task_id+1,
+                       begin_time, end_time, state)
             elif rec[0] == 2:
                 # Event record
                 rectype, begin_time, end_time, task_id, evinfo = rec
                 begin_time *= self.time_increment
                 evinfo_str = string.join(["%d:%d" % type_value for type_value in evinfo], ":")
-                paraver_trace.append("%d:%d:1:%d:1:%d:%s" % \
-                                         (rectype, task_id+1, task_id+1,
-                                          begin_time, evinfo_str))
+                yield "%d:%d:1:%d:1:%d:%s" % \
+                      (rectype, task_id+1, task_id+1,
+                       begin_time, evinfo_str)
             elif rec[0] == 3:
                 # Communication record
                 rectype, begin_time, end_time, send_id, comm_info = rec
@@ -502,14 +533,13 @@ VALUES
                     # Event never finished
                     end_time = maxtime * self.time_increment
                 recv_id, size = comm_info
-                paraver_trace.append("%d:%d:1:%d:1:%d:%d:%d:1:%d:1:%d:%d:%d:0" % \
-                                         (rectype, send_id+1, send_id+1,
-                                          begin_time, begin_time,
-                                          recv_id+1, recv_id+1, end_time,
-                                          end_time, size))
+                yield "%d:%d:1:%d:1:%d:%d:%d:1:%d:1:%d:%d:%d:0" % \
+                      (rectype, send_id+1, send_id+1,
+                       begin_time, begin_time,
+                       recv_id+1, recv_id+1, end_time,
+                       end_time, size)
             else:
                 self.errmsg.error_internal("unable to parse record %s" % repr(rec))
-        return paraver_trace
 
 
     #------------------------#
@@ -609,3 +639,168 @@ VALUES
         if self.comptime == 0:
             return []
         return [(1, event.posttime, event.completetime, event.task, 1)]
+
+
+###########################################################################
+
+class _ExternalSorter:
+    """
+       Sort Paraver IR records by ascending time, descending record
+       type, and task, preserving insertion order among ties.  At
+       most MAXRECORDS records are held in memory at a time; the rest
+       are written to a temporary file in sorted runs of fixed-size
+       binary records, which are merged when read back.  At most
+       MERGE_FANIN runs are merged at once so memory use doesn't grow
+       with the number of runs; longer lists of runs are first merged
+       into fewer, longer runs in additional passes.
+    """
+
+    # Each record is stored as {sequence number, record type, begin
+    # time, end time, end-time-is-valid flag, task, two
+    # record-specific integers}.
+    record_format = "=QBqqBqqq"
+    record_size = struct.calcsize(record_format)
+
+    merge_fanin = 16        # Maximum number of runs to merge at once
+    min_records = 1024      # Minimum value of MAXRECORDS
+
+    def __init__(self, maxrecords):
+        "Prepare to accept records."
+        self.maxrecords = max(maxrecords, self.min_records)
+        self.buffer = []
+        self.seqnum = 0L
+        self.runfile = None
+        self.runs = []        # List of {file offset, record count} tuples
+
+    def add(self, rec):
+        "Add a record, spilling a sorted run to disk if the buffer is full."
+        self.buffer.append(((rec[1], -rec[0], rec[3], self.seqnum), rec))
+        self.seqnum = self.seqnum + 1
+        if len(self.buffer) >= self.maxrecords:
+            self.spill()
+
+    def pack(self, keyrec):
+        "Convert a {key, record} tuple to a string."
+        seqnum = keyrec[0][3]
+        rectype, begin_time, end_time, task, data = keyrec[1]
+        if rectype == 1:
+            values = (data, 0)
+        elif rectype == 2:
+            if len(data) != 1:
+                raise ValueError, "Paraver event records must contain exactly one type:value pair"
+            values = data[0]
+        else:
+            values = tuple(data)
+        if end_time == None:
+            return struct.pack(self.record_format, seqnum, rectype,
+                               begin_time, 0, 0, task, values[0], values[1])
+        return struct.pack(self.record_format, seqnum, rectype,
+                           begin_time, end_time, 1, task, values[0], values[1])
+
+    def unpack(self, packed):
+        "Convert a string to a {key, record} tuple."
+        seqnum, rectype, begin_time, end_time, has_end, task, value0, value1 = \
+            struct.unpack(self.record_format, packed)
+        if not has_end:
+            end_time = None
+        if rectype == 1:
+            data = value0
+        elif rectype == 2:
+            data = [(value0, value1)]
+        else:
+            data = [value0, value1]
+        return ((begin_time, -rectype, task, seqnum),
+                (rectype, begin_time, end_time, task, data))
+
+    def spill(self):
+        "Write the buffer to the temporary file as a sorted run."
+        if not self.buffer:
+            return
+        if self.runfile == None:
+            self.runfile = tempfile.TemporaryFile()
+        self.buffer.sort()
+        self.runfile.seek(0, 2)
+        self.runs.append((self.runfile.tell(), len(self.buffer)))
+        self.runfile.write(string.join(map(self.pack, self.buffer), ""))
+        self.buffer = []
+
+    def read_run(self, runfile, offset, count, chunksize):
+        "Yield the {key, record} tuples in a single run."
+        while count > 0:
+            numrecs = min(count, chunksize)
+            runfile.seek(offset)
+            chunk = runfile.read(numrecs * self.record_size)
+            for recnum in range(0, numrecs):
+                yield self.unpack(chunk[recnum*self.record_size:(recnum+1)*self.record_size])
+            offset = offset + numrecs*self.record_size
+            count = count - numrecs
+
+    def merge_runs(self, runs, chunksize):
+        "Yield the {key, record} tuples in a list of runs in sorted order."
+        readers = map(lambda run, self=self, chunksize=chunksize:
+                          self.read_run(self.runfile, run[0], run[1], chunksize),
+                      runs)
+        heap = []
+        for runnum in range(0, len(readers)):
+            try:
+                key, rec = readers[runnum].next()
+                heap.append((key, runnum, rec))
+            except StopIteration:
+                pass
+        heapq.heapify(heap)
+        while heap:
+            key, runnum, rec = heap[0]
+            yield (key, rec)
+            try:
+                newkey, newrec = readers[runnum].next()
+                heapq.heapreplace(heap, (newkey, runnum, newrec))
+            except StopIteration:
+                heapq.heappop(heap)
+
+    def merge_pass(self, chunksize):
+        """
+             Merge each group of MERGE_FANIN runs into a single run
+             in a new temporary file, which replaces the current one.
+        """
+        newfile = tempfile.TemporaryFile()
+        newruns = []
+        for firstrun in range(0, len(self.runs), self.merge_fanin):
+            group = self.runs[firstrun:firstrun+self.merge_fanin]
+            offset = newfile.tell()
+            count = 0
+            packed = []
+            for keyrec in self.merge_runs(group, chunksize):
+                packed.append(self.pack(keyrec))
+                count = count + 1
+                if len(packed) >= chunksize:
+                    newfile.write(string.join(packed, ""))
+                    packed = []
+            newfile.write(string.join(packed, ""))
+            newruns.append((offset, count))
+        newfile.flush()
+        self.runfile.close()
+        self.runfile = newfile
+        self.runs = newruns
+
+    def sorted_records(self):
+        "Yield every record in sorted order."
+        if self.runfile == None:
+            # Everything fit in memory.
+            self.buffer.sort()
+            for key, rec in self.buffer:
+                yield rec
+            self.buffer = []
+            return
+
+        # Merge the runs, MERGE_FANIN at a time, reading from each
+        # only enough records at a time to keep the total within the
+        # buffer size.
+        self.spill()
+        self.runfile.flush()
+        chunksize = max(1, self.maxrecords / self.merge_fanin)
+        while len(self.runs) > self.merge_fanin:
+            self.merge_pass(chunksize)
+        for key, rec in self.merge_runs(self.runs, chunksize):
+            yield rec
+        self.runfile.close()
+        self.runfile = None
@@ -63,6 +63,7 @@ import os
 import string
 import re
 import types
+import heapq
 from math import *
 
 
@@ -93,9 +94,11 @@ class NCPTL_CodeGen(codegen_interpret.NCPTL_CodeGen):
         for el in self.eventlist:
             el.codegen = self
 
-        # Remove log-file options and add an option changing the event
-        # frequency and one for including all events.
+        # Remove log-file options, retain all events for tracing, and
+        # add an option changing the event frequency and one for
+        # including all events.
         self.set_log_file_status(0)
+        self.set_event_retention(1)
         self.options.extend([
             ["evfreq", "PICL event frequency (Hz)", "frequency", "F", 100000L],
             ["allevents", "0=include only communication events; 1=include all events ", "all-events", "A", 0L]])
@@ -149,6 +152,57 @@ class NCPTL_CodeGen(codegen_interpret.NCPTL_CodeGen):
         # Return the modified input and output filenames.
         return (infilename, outfilename)
 
+    def emit_picl(self, picltime, task, fmt, args):
+        """
+             Queue a PICL record for output.  FMT must contain a "%s"
+             where the time should go.  Records are written in order
+             of time, then task, then the order in which they were
+             queued.
+        """
+        timestr = "%.*f" % (self.time_digits, picltime)
+        heapq.heappush(self.picl_heap,
+                       ((float(timestr), task, self.picl_seqnum),
+                        fmt % ((timestr,) + args)))
+        self.picl_seqnum = self.picl_seqnum + 1
+
+    def flush_picl(self, before=None):
+        """
+             Remove from the queue and return, in order, every PICL
+             record whose time precedes BEFORE (or all records if
+             BEFORE is None).
+        """
+        heap = self.picl_heap
+        if before == None:
+            limit = None
+        else:
+            limit = float("%.*f" % (self.time_digits, before))
+        records = []
+        while heap and (limit == None or heap[0][0][0] < limit):
+            records.append(heapq.heappop(heap)[1])
+        return records
+
+    def merge_events(self):
+        """
+             Yield a {posting time, task, event} tuple for each event
+             on each task in order of posting time.  Each task's
+             event list is already sorted by posting time so a k-way
+             merge suffices.
+        """
+        heap = []
+        for task in range(0, len(self.eventlist)):
+            events = self.eventlist[task].events
+            if events:
+                heap.append((events[0].posttime, task, 0))
+        heapq.heapify(heap)
+        while heap:
+            posttime, task, evnum = heap[0]
+            events = self.eventlist[task].events
+            if evnum+1 < len(events):
+                heapq.heapreplace(heap, (events[evnum+1].posttime, task, evnum+1))
+            else:
+                heapq.heappop(heap)
+            yield (posttime, task, events[evnum])
+
     def write_picl(self, rectype, task, begintime, endtime, beginargs, endargs,
                  beginformat="2", endformat="2"):
         "Write arbitrary begin and end PICL events."
@@ -160,15 +214,16 @@ class NCPTL_CodeGen(codegen_interpret.NCPTL_CodeGen):
             else:
                 return str(val)
 
-        beginpicl = ("-3 %d %.*f %d %d %d" %
-                     (rectype, self.time_digits, begintime, task, 0, len(beginargs)))
+        beginpicl = "-3 %d %%s %d %d %d" % (rectype, task, 0, len(beginargs))
         if len(beginargs):
-            beginpicl = beginpicl + " %s %s" % (beginformat, string.join(map(port_o_str, beginargs), " "))
-        endpicl = ("-4 %d %.*f %d %d %d" %
-                     (rectype, self.time_digits, endtime, task, 0, len(endargs)))
+            beginpicl = beginpicl + string.replace(" %s %s" % (beginformat, string.join(map(port_o_str, beginargs), " ")),
+                                                   "%", "%%")
+        endpicl = "-4 %d %%s %d %d %d" % (rectype, task, 0, len(endargs))
         if len(endargs):
-            endpicl = endpicl + " %s %s" % (endformat, string.join(map(port_o_str, endargs), " "))
-        self.picl_events.extend([beginpicl, endpicl])
+            endpicl = endpicl + string.replace(" %s %s" % (endformat, string.join(map(port_o_str, endargs), " ")),
+                                               "%", "%%")
+        self.emit_picl(begintime, task, beginpicl, ())
+        self.emit_picl(endtime, task, endpicl, ())
 
     def allocate_task_subset(self, tasklist):
         """
@@ -176,7 +231,7 @@ class NCPTL_CodeGen(codegen_interpret.NCPTL_CodeGen):
              collective-communication operation.  Return the
              corresponding subset ID.
         """
-        if tasklist == range(0, int(self.numtasks)):
+        if list(tasklist) == range(0, int(self.numtasks)):
             return -1
         tasklist_string = string.join(map(lambda lng: str(int(lng)), tasklist), " ")
         if self.tasks2id.has_key(tasklist_string):
@@ -186,9 +241,8 @@ class NCPTL_CodeGen(codegen_interpret.NCPTL_CodeGen):
         # Define a new subset.
         subset_id = len(self.tasks2id)
         self.tasks2id[tasklist_string] = subset_id
-        self.picl_events.append("-202 -812 %.*f -1 -1 %d 2 %d %s" %
-                                (self.time_digits, 0.0, len(tasklist)+1,
-                                 subset_id, tasklist_string))
+        self.emit_picl(0.0, -1, "-202 -812 %s -1 -1 %d 2 %d %s",
+                       (len(tasklist)+1, subset_id, tasklist_string))
         return subset_id
 
 
@@ -236,6 +290,10 @@ class NCPTL_CodeGen(codegen_interpret.NCPTL_CodeGen):
     # Method overrides #
     #------------------#
 
+    class Event(codegen_interpret.NCPTL_CodeGen.Event):
+        # Additional fields with which we annotate events
+        __slots__ = ["peerevents"]
+
     class EventList(codegen_interpret.NCPTL_CodeGen.EventList):
         def complete_post_overhead(self, prev_ev, this_ev):
             "Return the overhead between completing an event and posting the next event."
@@ -265,7 +323,9 @@ class NCPTL_CodeGen(codegen_interpret.NCPTL_CodeGen):
         self.physrank = event.task    # May be needed by futures.
         self.eventlist[task].try_posting_all()   # Update event.posttime.
         self.counters[task]["elapsed_usecs"] = event.posttime - self.timer_start[task]
-        event.attributes = [string.join(map(self.eval_lazy_expr, event.attributes), "")]
+        event.attributes = [string.join(map(lambda e, self=self:
+                                            self.eval_lazy_expr(e, types.StringType),
+                                            event.attributes), "")]
         self.eventlist[task].complete()
         return None
 
@@ -283,19 +343,32 @@ class NCPTL_CodeGen(codegen_interpret.NCPTL_CodeGen):
     #--------------------------#
 
     def trace_events(self):
-        '"Trace" all of the events dumped by the interpret backend.'
-
-        # Combine the event lists into a single list sorted by posting time.
-        sorted_events = map(lambda ev: (ev.posttime, ev.task, ev),
-                            reduce(lambda a, b: a+b,
-                                   map(lambda el: el.events, self.eventlist)))
-        sorted_events.sort()
+        """
+             "Trace" all of the events dumped by the interpret
+             backend, yielding PICL records in order of time.  Only
+             the records belonging to events still in progress are
+             held in memory.
+        """
+        self.picl_heap = []
+        self.picl_seqnum = 0
+
+        # Define up front every task subset that a collective will
+        # use because subset definitions must precede all other
+        # records.
+        for posttime, task, event in self.merge_events():
+            if event.completetime == None:
+                continue
+            if event.operation == "SYNC":
+                self.allocate_task_subset(event.peers)
+            elif event.operation == "REDUCE":
+                senders, receivers = event.peers
+                self.allocate_task_subset(senders)
+                if len(receivers) > 1 and senders != receivers:
+                    self.allocate_task_subset(receivers)
 
         # Initialize PICL on all tasks.
-        self.picl_events = []
         for task in range(0, self.numtasks):
-            self.picl_events.append("-3 -901 %.*f %d %d 0" %
-                                    (self.time_digits, 0.0, task, 0))
+            self.emit_picl(0.0, task, "-3 -901 %s %d %d 0", (task, 0))
 
         # Define a mapping from an operation to a method.
         op2method = {
@@ -307,39 +380,34 @@ class NCPTL_CodeGen(codegen_interpret.NCPTL_CodeGen):
             "REDUCE"   : self.trace_reduce,
             "OUTPUT"   : self.trace_output}
 
-        # Process every event on every task.
+        # Process every event on every task.  Finalize PICL on each
+        # task as soon as we've processed the task's last event.
+        # Because an event can be posted at most one time unit after
+        # its predecessor completes, no record still to come can
+        # precede the finalization record.
         maxtime = [0.0] * int(self.numtasks)
         self.pending_ops = map(lambda x: [], maxtime)
-        for posttime, task, event in sorted_events:
+        for task in range(0, self.numtasks):
+            if not self.eventlist[task].events:
+                self.emit_picl(self.time_increment, task, "-4 -901 %s %d %d 0", (task, 0))
+        for posttime, task, event in self.merge_events():
+            # No event after this one can produce a record that
+            # precedes this event's beginning.
             begintime = (posttime+1) * self.time_increment
-            try:
+            for record in self.flush_picl(begintime):
+                yield record
+            if event.completetime != None:
                 endtime = (event.completetime+1) * self.time_increment
-            except TypeError:
-                # The event never completed.
-                continue
-            maxtime[task] = max(maxtime[task], endtime)
-            try:
-                op2method[event.operation](task, event, begintime, endtime)
-            except KeyError:
-                self.trace_non_comm(task, event, begintime, endtime)
-
-        # Finalize PICL on all tasks.
-        for task in range(0, self.numtasks):
-            self.picl_events.append("-4 -901 %.*f %d %d 0" %
-                                    (self.time_digits,
-                                     maxtime[task]+self.time_increment,
-                                     task, 0))
-
-        # Sort events by time and return the result.  Force stable
-        # sorting using the current event number.
-        sorted_events = []
-        eventnum = 0
-        for picl_event in self.picl_events:
-            fields = string.split(picl_event)
-            sorted_events.append(((float(fields[2]), int(fields[3]), eventnum), picl_event))
-            eventnum = eventnum + 1
-        sorted_events.sort()
-        return map(lambda fe: fe[1], sorted_events)
+                maxtime[task] = max(maxtime[task], endtime)
+                try:
+                    op2method[event.operation](task, event, begintime, endtime)
+                except KeyError:
+                    self.trace_non_comm(task, event, begintime, endtime)
+            if event is self.eventlist[task].events[-1]:
+                self.emit_picl(maxtime[task]+self.time_increment, task,
+                               "-4 -901 %s %d %d 0", (task, 0))
+        for record in self.flush_picl():
+            yield record
 
 
     #------------------------#
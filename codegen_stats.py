@@ -110,8 +110,10 @@ class NCPTL_CodeGen(codegen_interpret.NCPTL_CodeGen):
         self.generate_initialize(ast, filesource, sourcecode)
         self.sourcecode = sourcecode
 
-        # Remove log-file options and add a few backend-specific options.
+        # Remove log-file options, retain all events for reporting,
+        # and add a few backend-specific options.
         self.set_log_file_status(0)
+        self.set_event_retention(1)
         self.options.extend([
             ["outputformat",
              'Output format, either "text", "excelcsv", or "sep:<string>"',
@@ -68,6 +68,7 @@ class GUIPyInterface( java.lang.Object ):
         self.parser = NCPTL_Parser( self.lexer )
         self.codegen = NCPTL_CodeGen(options=[], numtasks=numtasks)
         self.codegen.procmap = None
+        self.codegen.set_event_retention(1)
 
     def get_language_version( self ):
         "@sig public java.lang.String get_language_version()"
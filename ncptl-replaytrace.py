@@ -60,6 +60,15 @@ import string
 import re
 import getopt
 import curses
+import stat
+import bisect
+import tempfile
+from array import array
+try:
+    import cPickle
+    pickle = cPickle
+except ImportError:
+    import pickle
 
 # Define some global variables
 progname = os.path.basename(sys.argv[0]) # This program's name
@@ -67,14 +76,95 @@ tracefilename = None                     # File containing trace data
 delayms = 0                              # Delay in msecs after screen updates
 monitortask = 0                          # Physical task ID to monitor
 breakpoint = -1                          # Line number at which to single-step
+starteventnum = None                     # Event number at which to begin
+startline = None                         # Source line at which to begin
 sourcefilename = None                    # File containing coNCePTuaL source
 
+# Define the format of a line of trace data.
+trace_re = re.compile(r'\[TRACE\] phys: (\d+) \| virt: (\d+) \| action: (\w+) \| event: (\d+) / (\d+) \| lines: (\d+) - (\d+)')
+
+# Increment the following whenever the format of the index file changes.
+index_version = 1
+
 # Summarize program usage.
 def usage(exitcode):
     "Provide a usage message."
-    print "Usage: %s [--help] [--trace=<file>] [--delay=<msec>] [--monitor=<task ID>] [--breakpoint=<line#>] <source.ncptl>" % progname
+    print "Usage: %s [--help] [--trace=<file>] [--delay=<msec>] [--monitor=<task ID>] [--breakpoint=<line#>] [--event=<event#>] [--line=<line#>] <source.ncptl>" % progname
     sys.exit(exitcode)
 
+# Index a trace file.
+def build_index(tracefile, spoolfile=None):
+    """
+       Make a single pass over a trace file and return an {offsets,
+       firstevent, linepos} tuple of dictionaries keyed by processor
+       number.  offsets[p] holds the file offset of each of
+       processor p's trace lines; firstevent[p] maps an event number
+       to the position within offsets[p] of its first occurrence;
+       and linepos[p] maps a source line to the positions of all of
+       the events that begin on that line.  If SPOOLFILE is given,
+       every line read is also copied to it.
+    """
+    offsets = {}
+    firstevent = {}
+    linepos = {}
+    offset = 0
+    while 1:
+        oneline = tracefile.readline()
+        if oneline == "":
+            break
+        if spoolfile:
+            spoolfile.write(oneline)
+        fields = trace_re.match(oneline)
+        if fields:
+            physrank = int(fields.group(1))
+            eventnum = int(fields.group(4))
+            firstline = int(fields.group(6))
+            try:
+                taskoffsets = offsets[physrank]
+            except KeyError:
+                taskoffsets = offsets[physrank] = array("l")
+                firstevent[physrank] = {}
+                linepos[physrank] = {}
+            position = len(taskoffsets)
+            taskoffsets.append(offset)
+            if not firstevent[physrank].has_key(eventnum):
+                firstevent[physrank][eventnum] = position
+            try:
+                linepos[physrank][firstline].append(position)
+            except KeyError:
+                linepos[physrank][firstline] = array("l", [position])
+        offset = offset + len(oneline)
+    return (offsets, firstevent, linepos)
+
+def load_index(tracefilename, tracefile):
+    """
+       Return the index of a trace file.  The index is read from a
+       sidecar file if one exists and is up to date; otherwise, it is
+       built and (if possible) written to the sidecar file.
+    """
+    indexfilename = tracefilename + ".idx"
+    statinfo = os.stat(tracefilename)
+    signature = (index_version, statinfo[stat.ST_SIZE], statinfo[stat.ST_MTIME])
+    try:
+        indexfile = open(indexfilename, "rb")
+        indexsig, index = pickle.load(indexfile)
+        indexfile.close()
+        if indexsig == signature:
+            return index
+    except:
+        # Any problem with the sidecar file means we reindex.
+        pass
+    index = build_index(tracefile)
+    try:
+        tempname = "%s.%d" % (indexfilename, os.getpid())
+        indexfile = open(tempname, "wb")
+        pickle.dump((signature, index), indexfile, 2)
+        indexfile.close()
+        os.rename(tempname, indexfilename)
+    except (IOError, OSError):
+        pass
+    return index
+
 # Parse the command line.
 try:
     longopts = [
@@ -82,8 +172,10 @@ try:
         "trace=",
         "delay=",
         "monitor=",
-        "breakpoint="]
-    opts, args = getopt.getopt(sys.argv[1:], "hT:D:M:P:", longopts)
+        "breakpoint=",
+        "event=",
+        "line="]
+    opts, args = getopt.getopt(sys.argv[1:], "hT:D:M:B:E:L:", longopts)
 except getopt.error:
     sys.stderr.write("%s: bad option\n" % progname)
     sys.exit(1)
@@ -99,6 +191,14 @@ try:
             monitortask = int(optarg)
         elif opt in ("-B", "--breakpoint"):
             breakpoint = int(optarg)
+        elif opt in ("-E", "--event"):
+            starteventnum = int(optarg)
+            if starteventnum < 1:
+                raise ValueError
+        elif opt in ("-L", "--line"):
+            startline = int(optarg)
+            if startline < 1:
+                raise ValueError
         else:
             usage(1)
     if delayms<0 or monitortask<0:
@@ -111,17 +211,49 @@ if (len(args) != 1):
     usage(1)
 sourcefilename = args[0]
 
-# Open all of our input files.
+# Open all of our input files and index the trace data.  Because we
+# seek within the trace data, data read from the standard input
+# device are first copied to a temporary file.
 try:
+    sourcefile = open(sourcefilename, "r")
     if (tracefilename):
-        tracefile = open(tracefilename, "r")
+        tracefile = open(tracefilename, "rb")
+        offsets, firstevent, linepos = load_index(tracefilename, tracefile)
     else:
-        tracefile = sys.stdin
-    sourcefile = open(sourcefilename, "r")
-except IOError, errmsg:
+        tracefile = tempfile.TemporaryFile()
+        offsets, firstevent, linepos = build_index(sys.stdin, tracefile)
+        tracefile.flush()
+except (IOError, OSError), errmsg:
     sys.stderr.write('%s: %s\n' % (progname, errmsg))
     sys.exit(1)
 sourcecode = string.split(re.sub(r'\n+$', "", sourcefile.read()), "\n")
+tasklist = offsets.keys()
+tasklist.sort()
+if not offsets.has_key(monitortask):
+    sys.stderr.write('%s: the trace data contain no events for processor %d\n' %
+                     (progname, monitortask))
+    sys.exit(1)
+
+# Determine where to begin replaying.
+position = 0
+if starteventnum != None:
+    try:
+        position = firstevent[monitortask][starteventnum]
+    except KeyError:
+        sys.stderr.write('%s: processor %d never executes event %d\n' %
+                         (progname, monitortask, starteventnum))
+        sys.exit(1)
+if startline != None:
+    try:
+        linepositions = linepos[monitortask][startline]
+    except KeyError:
+        linepositions = []
+    linenum = bisect.bisect_left(linepositions, position)
+    if linenum == len(linepositions):
+        sys.stderr.write('%s: processor %d executes no events at line %d\n' %
+                         (progname, monitortask, startline))
+        sys.exit(1)
+    position = linepositions[linenum]
 
 # Initialize curses.
 win = curses.initscr()
@@ -145,8 +277,8 @@ for cline in range(0, len(sourcecode)):
     win.addstr(sourcecode[cline][:cols-6], curses.A_NORMAL)
 win.refresh()
 
-# Process the trace file line-by-line.
-taskdigits = len(str(monitortask))
+# Replay the monitored task's trace lines, seeking directly to each.
+taskdigits = len(str(tasklist[-1]))
 actionlen = 7
 eventdigits = 1
 prevfirstline = -1
@@ -157,26 +289,18 @@ win.addstr(lines-1, 0,
             " "*eventdigits, " "*eventdigits),
            curses.A_BOLD)
 win.refresh()
-while 1:
+taskoffsets = offsets[monitortask]
+while position < len(taskoffsets):
     # Parse a line of the trace file.
-    oneline = tracefile.readline()
-    if oneline == "":
-        break
-    fields = re.match(r'\[TRACE\] phys: (\d+) \| virt: (\d+) \| action: (\w+) \| event: (\d+) / (\d+) \| lines: (\d+) - (\d+)',
-                      oneline)
-    if not fields:
-        continue
+    tracefile.seek(taskoffsets[position])
+    position = position + 1
+    fields = trace_re.match(tracefile.readline())
     physrank_str, virtrank_str, action_str, eventnum_str, numevents_str, firstline_str, lastline_str = fields.groups()
-    physrank = int(physrank_str)
-    if physrank != monitortask:
-        continue
     virtrank = int(virtrank_str)
     eventnum = int(eventnum_str)
     numevents = int(numevents_str)
     firstline = int(firstline_str) - 1
     lastline = int(lastline_str) - 1
-    if taskdigits < len(physrank_str):
-        taskdigits = len(physrank_str)
     if taskdigits < len(virtrank_str):
         taskdigits = len(virtrank_str)
     if actionlen < len(action_str):
@@ -233,12 +357,34 @@ while 1:
     elif string.upper(onechar) == "D":
         # Delete the breakpoint.
         breakpoint = -1
+    elif string.upper(onechar) == "J":
+        # Jump to the next event at the breakpoint.
+        try:
+            linepositions = linepos[monitortask][breakpoint]
+        except KeyError:
+            linepositions = []
+        linenum = bisect.bisect_left(linepositions, position)
+        if linenum < len(linepositions):
+            position = linepositions[linenum]
+    elif string.upper(onechar) in ("N", "P"):
+        # Monitor the next or previous task, resuming from the first
+        # occurrence of the current event number.
+        tasknum = tasklist.index(monitortask)
+        if string.upper(onechar) == "N":
+            tasknum = (tasknum + 1) % len(tasklist)
+        else:
+            tasknum = (tasknum - 1) % len(tasklist)
+        monitortask = tasklist[tasknum]
+        taskoffsets = offsets[monitortask]
+        try:
+            position = firstevent[monitortask][eventnum]
+        except KeyError:
+            position = 0
     elif string.upper(onechar) == "Q":
         # Abort the program.
         break
 
 # Finish up cleanly.
-if (tracefilename):
-    tracefile.close()
+tracefile.close()
 sourcefile.close()
 curses.endwin()
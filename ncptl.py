@@ -61,18 +61,96 @@ import getopt
 import re
 import string
 import random
+import socket
+import stat
+try:
+    from importlib import import_module
+except ImportError:
+    # Older versions of Python (and Jython) lack importlib.
+    def import_module(name):
+        return __import__(name)
 from ncptl_lexer import NCPTL_Lexer
 from ncptl_parser import NCPTL_Parser
 from ncptl_semantic import NCPTL_Semantic
+from ncptl_cache import NCPTL_Cache
+from ncptl_batch import NCPTL_Batch, submit_job
 from ncptl_config import ncptl_config, expanded_ncptl_config
 from ncptl_error import NCPTL_Error
 from ncptl_backends import backend_list
 
 
+def directory_mtimes(dirlist):
+    "Return the modification time of each directory in a list (None if missing)."
+    mtimes = []
+    for bdir in dirlist:
+        try:
+            mtimes.append(os.stat(bdir)[stat.ST_MTIME])
+        except OSError:
+            mtimes.append(None)
+    return mtimes
+
+
+def backend_index():
+    """
+         Return a mapping from each backend found in the backend path
+         to the file that implements it.  The mapping is cached in
+         the user's coNCePTuaL cache directory and is reused as long
+         as neither the backend path nor any directory in it has
+         changed.
+    """
+    global backend2path
+    if backend2path != None:
+        return backend2path
+    cache = NCPTL_Cache()
+    mtimes = directory_mtimes(backend_path)
+    cached_index = cache.load_index("backends")
+    try:
+        cached_path, cached_mtimes, cached_backend2path = cached_index
+        if cached_path == backend_path and cached_mtimes == mtimes:
+            backend2path = cached_backend2path
+            return backend2path
+    except (TypeError, ValueError):
+        pass
+
+    # The cache is missing or stale.  Scan the entire backend path.
+    backend2path = {}
+    for bdir in backend_path:
+        try:
+            for somefile in os.listdir(bdir):
+                re_matches = re.search(r'^codegen_(.+)\.py[co]?$', somefile)
+                if re_matches:
+                    new_backend = re_matches.group(1)
+                    if not backend2path.has_key(new_backend):
+                        backend2path[new_backend] = os.path.normpath(os.path.join(bdir, somefile))
+        except:
+            # Ignore non-directories and directories we don't have access to.
+            pass
+    cache.store_index("backends", (backend_path, mtimes, backend2path))
+    return backend2path
+
+
+def find_backend(backend):
+    """
+         Return the name of the file that implements a given backend
+         or None if the backend can't be found.  Standard backends
+         are looked for only where they are installed (and in
+         NCPTL_PATH, which takes precedence), so the full backend
+         path needs to be consulted only for nonstandard backends.
+    """
+    if backend2path == None and pythondir and backend in backend_list:
+        for bdir in backend_path[:len(ncptl_path) + 1]:
+            for suffix in (".py", ".pyc", ".pyo"):
+                filename = os.path.join(bdir, "codegen_%s%s" % (backend, suffix))
+                if os.path.isfile(filename):
+                    return filename
+    return backend_index().get(backend)
+
+
 def show_backends(odev):
     "List all available backends."
     odev.write('''The following backends are available ("*" = standard backend; "-" = other
 backend found in the backend path):\n\n''')
+    backend2path = backend_index()
     sorted_backends = backend2path.items()
     if len(sorted_backends) > 0:
         sorted_backends.sort(lambda a, b: cmp(a[1], b[1]) or cmp(a[0], b[0]))
@@ -111,10 +189,15 @@ def usage(exitcode=0):
     else:
         dev = sys.stderr
     dev.write("""Usage: ncptl [--backend=<string>] [--quiet] [--no-link | --no-compile]
-         [--keep-ints] [--lenient] [--filter=<sed expr>] [--output=<file>]
+         [--keep-ints] [--lenient] [--no-cache] [--filter=<sed expr>]
+         [--output=<file>]
          <file.ncptl> | --program=<program>
          [<backend-specific options>]
 
+       ncptl [--quiet] [--jobs=<number>] --batch=<manifest> | --serve=<socket>
+
+       ncptl --connect=<socket> <ncptl arguments>
+
        ncptl --help
 
        ncptl [--backend=<string>] --help-backend
@@ -133,22 +216,25 @@ def locate_backend(backend):
             backend = os.environ["NCPTL_BACKEND"]
         except KeyError:
             return None
-    if not backend2path.has_key(backend):
+    if find_backend(backend) == None:
         sys.stderr.write("ncptl: Unable to find the %s backend\n\n" % backend)
         show_backends(sys.stderr)
         raise SystemExit, 1
     return backend
 
 
-def sed_filter(somestring, sedexpr):
-    "Apply a sed-style expression to a given string."
+def sed_compile(sedexpr):
+    """
+         Parse a sed-style expression and return a {compiled pattern,
+         replacement string, maximum number of substitutions} tuple.
+    """
 
     # Split a sed-like substitution expression into a list
     # (e.g., "s/foo/bar/g" --> ["s", "foo", "bar", "g"]).
     bad_subst = 'invalid sed substitution string "%s"' % sedexpr
     sedexpr = string.strip(sedexpr)
     if len(sedexpr) < 5 or sedexpr[0] != "s" or not re.match(r'\S', sedexpr[1]):
-        errmsg.error_fatal(badsubst)
+        errmsg.error_fatal(bad_subst)
     sedfrags = []
     for frag in string.split(sedexpr, sedexpr[1]):
         try:
@@ -159,7 +245,7 @@ def sed_filter(somestring, sedexpr):
         except IndexError:
             sedfrags.append(frag)
     if len(sedfrags) != 4:
-        errmsg.error_fatal(badsubst)
+        errmsg.error_fatal(bad_subst)
 
     # Convert the list of flag characters to a single number.
     flags = 0
@@ -183,9 +269,13 @@ def sed_filter(somestring, sedexpr):
             except KeyError:
                 errmsg.error_fatal('unknown substitution flag "%s"' % flagchar)
 
-    # Perform the substitution(s).
-    subst_obj = re.compile(sedfrags[1], flags)
-    return subst_obj.sub(sedfrags[2], somestring, numsubs)
+    return (re.compile(sedfrags[1], flags), sedfrags[2], numsubs)
+
+
+def sed_filter(somestring, sedexpr):
+    "Apply a sed-style expression to a given string."
+    subst_obj, replacement, numsubs = sed_compile(sedexpr)
+    return subst_obj.sub(replacement, somestring, numsubs)
 
 
 def test_runability(executable_name):
@@ -214,13 +304,71 @@ def test_runability(executable_name):
     except:
         pass
 
-###########################################################################
 
-# The program starts here.
-if __name__ == "__main__":
-    # Prepare to issue uniform error messages.
-    errmsg = NCPTL_Error("ncptl")
+def import_backend(backend):
+    "Import a backend and return its NCPTL_CodeGen class."
+    orig_path = sys.path
+    sys.path = list(sys.path)
+    if pythondir:
+        sys.path.insert(0, pythondir)
+    sys.path[:0] = ncptl_path
+    try:
+        return import_module("codegen_" + backend).NCPTL_CodeGen
+    finally:
+        sys.path = orig_path
+
+
+def run_batch(manifestname, socketname, numjobs, be_verbose):
+    """
+         Compile every program listed in a manifest file or submitted
+         to a Unix-domain socket.  Return the exit status to use.
+    """
+    # Do everything that doesn't depend on the program being
+    # compiled once, before we create the worker processes.
+    if be_verbose:
+        sys.stderr.write("# Loading all backends ...\n")
+    for backend in backend_index().keys():
+        try:
+            import_backend(backend)
+        except:
+            # We'll report the problem if a job actually uses this
+            # backend.
+            pass
+    parser = NCPTL_Parser(NCPTL_Lexer())
+    parser.parse_many([("Task 0 outputs 0.", "<warm-up>")])
+    parser.parse_many([('x is "x" and comes from "--x" or "-x" with default 0', "<warm-up>")],
+                      start="header_decl")
+    del parser
+
+    # Compile each program in a separate child process.
+    batch = NCPTL_Batch(lambda argv: compile_program(argv, 0), numjobs)
+    if socketname != None:
+        if be_verbose:
+            sys.stderr.write("# Accepting jobs on %s ...\n" % socketname)
+        try:
+            batch.serve(socketname)
+        except KeyboardInterrupt:
+            pass
+        return 0
+    else:
+        if be_verbose:
+            sys.stderr.write("# Reading jobs from %s ...\n" % manifestname)
+        try:
+            joblist = batch.read_manifest(manifestname)
+        except (IOError, ValueError), reason:
+            errmsg.error_fatal("unable to read jobs from %s (%s)" % (manifestname, reason))
+        return batch.run_jobs(joblist)
+
 
+
+def compile_program(argv, allow_batch=1):
+    """
+         Compile a single coNCePTuaL program given a list of ncptl
+         command-line arguments (excluding the program name).  Exit
+         via SystemExit on failure.  If ALLOW_BATCH is true, the
+         arguments may instead request that many programs be
+         compiled in a batch.
+    """
     # Set default values for our command-line parameters.
     outfilename = "-"
     backend = None
@@ -231,40 +379,15 @@ if __name__ == "__main__":
     execute_link = 1
     keep_ints = 0
     lenient = 0
+    use_cache = 1
     be_verbose = 1
-
-    # Determine where coNCePTuaL was installed.
-    try:
-        pythondir = ncptl_config["pythondir"]
-        prefix = ncptl_config["prefix"]
-        pythondir = re.sub(r'\$\{prefix\}', prefix, pythondir)
-    except:
-        pythondir = None
-
-    # Look for additional backends.
-    backend2path = {}
-    backend_path = []
-    if os.environ.has_key("NCPTL_PATH"):
-        backend_path.extend(string.split(os.environ["NCPTL_PATH"], ":"))
-    if pythondir:
-        backend_path.append(pythondir)
-    backend_path.extend(sys.path)
-    backend_path = map(os.path.normpath, backend_path)
-    for bdir in backend_path:
-        try:
-            for somefile in os.listdir(bdir):
-                re_matches = re.search(r'^codegen_(.+)\.py[co]?$', somefile)
-                if re_matches:
-                    new_backend = re_matches.group(1)
-                    if not backend2path.has_key(new_backend):
-                        backend2path[new_backend] = os.path.normpath(os.path.join(bdir, somefile))
-        except:
-            # Ignore non-directories and directories we don't have access to.
-            pass
+    manifestname = None
+    socketname = None
+    numjobs = None
 
     # Parse the command line.
     end_of_options = "--~!@#$%^&*"
-    argumentlist = map(lambda a: re.sub(r'^--$', end_of_options, a), sys.argv[1:])
+    argumentlist = map(lambda a: re.sub(r'^--$', end_of_options, a), argv)
     success = 0
     filelist = []
     options = []
@@ -275,10 +398,14 @@ if __name__ == "__main__":
                      ("E",  "no-compile"),
                      ("K",  "keep-ints"),
                      ("L",  "lenient"),
+                     ("C",  "no-cache"),
                      ("o:", "output="),
                      ("b:", "backend="),
                      ("f:", "filter="),
-                     ("p:", "program=")]
+                     ("p:", "program="),
+                     ("B:", "batch="),
+                     ("S:", "serve="),
+                     ("j:", "jobs=")]
     shortopts = string.join(map(lambda sl: sl[0], shortlongopts), "")
     longopts = map(lambda sl: sl[1], shortlongopts)
     while not success:
@@ -336,6 +463,8 @@ if __name__ == "__main__":
             keep_ints = 1
         elif opt in ("-L", "--lenient"):
             lenient = 1
+        elif opt in ("-C", "--no-cache"):
+            use_cache = 0
         elif opt in ("-o", "--output"):
             outfilename = optarg
         elif opt in ("-b", "--backend"):
@@ -345,26 +474,39 @@ if __name__ == "__main__":
         elif opt in ("-p", "--program"):
             entirefile = optarg
             infilename = "<command line>"
+        elif opt in ("-B", "--batch"):
+            manifestname = optarg
+        elif opt in ("-S", "--serve"):
+            socketname = optarg
+        elif opt in ("-j", "--jobs"):
+            try:
+                numjobs = int(optarg)
+                if numjobs < 1:
+                    raise ValueError
+            except ValueError:
+                errmsg.error_fatal('--jobs expects a positive integer but was given "%s"' % optarg)
         else:
             usage(1)
     if len(filelist) > 1 or (len(filelist) > 0 and entirefile != None):
         # We currently allow only one program to be compiled per invocation.
         usage(1)
 
+    # Compile many programs if so instructed.
+    if manifestname != None or socketname != None:
+        if not allow_batch:
+            errmsg.error_fatal("--batch and --serve cannot be used within a batch job")
+        if filelist != [] or entirefile != None or (manifestname != None and socketname != None):
+            usage(1)
+        raise SystemExit, run_batch(manifestname, socketname, numjobs, be_verbose)
+
     # Load the named backend.
     backend = locate_backend(backend)
     try:
         if backend != None:
             if be_verbose:
                 sys.stderr.write("# Loading the %s backend from %s ...\n" %
-                                 (backend, os.path.abspath(backend2path[backend])))
-            orig_path = sys.path
-            if pythondir:
-                sys.path.insert(0, pythondir)
-            if os.environ.has_key("NCPTL_PATH"):
-                sys.path[:0] = string.split(os.environ["NCPTL_PATH"], ":")
-            exec("from codegen_%s import NCPTL_CodeGen" % backend)
-            sys.path = orig_path
+                                 (backend, os.path.abspath(find_backend(backend))))
+            NCPTL_CodeGen = import_backend(backend)
     except ImportError, reason:
         errmsg.error_fatal('unable to load backend "%s" (reason: %s)' %
                            (backend, str(reason)))
@@ -383,7 +525,7 @@ if __name__ == "__main__":
             # be a backend option at this point because we've already
             # processed the frontend's command line and therefore
             # would have already seen a frontend --help.
-            if "--help" in sys.argv or "--help-backend" in sys.argv or "-H" in sys.argv:
+            if "--help" in argv or "--help-backend" in argv or "-H" in argv:
                 if backend == None:
                     errmsg.warning('backend help cannot be provided unless a backend is specified')
                     sys.stderr.write("\n")
@@ -412,12 +554,10 @@ if __name__ == "__main__":
         except IOError, (errno, strerror):
             errmsg.error_fatal("unable to read from %s (%s)" % (infilename, strerror))
 
-    # Instantiate a lexer, parser, and code generator.
-    lexer = NCPTL_Lexer()
-    parser = NCPTL_Parser(lexer)
-    semantic = NCPTL_Semantic()
+    # Instantiate a code generator.
     if backend != None:
         codegen = NCPTL_CodeGen(backend_options)
+        codegen.use_cache = use_cache
 
     # Compile the program into backend-specific source code.
     try:
@@ -425,18 +565,44 @@ if __name__ == "__main__":
     except AttributeError:
         # Jython 2.2a1 doesn't support sys.setcheckinterval.
         pass
-    if be_verbose:
-        sys.stderr.write("# Lexing ...\n")
-    tokenlist = lexer.tokenize(entirefile, filesource=infilename)
-    del lexer
-    if be_verbose:
-        sys.stderr.write("# Parsing ...\n")
-    syntree = parser.parsetokens(tokenlist, filesource=infilename)
-    del parser
-    if be_verbose:
-        sys.stderr.write("# Analyzing program semantics ...\n")
-    syntree = semantic.analyze(syntree, filesource=infilename, lenient=lenient)
-    del semantic
+    syntree = None
+    if use_cache:
+        # Reuse a previously analyzed AST if we have one.
+        cache = NCPTL_Cache()
+        cachekey = cache.make_key(entirefile, infilename, lenient)
+        cached_entry = cache.load(cachekey)
+        if cached_entry:
+            if be_verbose:
+                sys.stderr.write("# Reusing the cached analysis of %s ...\n" % infilename)
+            syntree, diagnostics = cached_entry
+            sys.stderr.write(diagnostics)
+    if syntree == None:
+        # Lex, parse, and analyze the program, recording any warnings
+        # so they can be replayed when the cached AST is reused.
+        lexer = NCPTL_Lexer()
+        parser = NCPTL_Parser(lexer)
+        semantic = NCPTL_Semantic()
+        verbose_dev = sys.stderr
+        if use_cache:
+            cache.begin_recording()
+        try:
+            if be_verbose:
+                verbose_dev.write("# Lexing ...\n")
+            tokenlist = lexer.tokenize(entirefile, filesource=infilename)
+            del lexer
+            if be_verbose:
+                verbose_dev.write("# Parsing ...\n")
+            syntree = parser.parsetokens(tokenlist, filesource=infilename)
+            del parser
+            if be_verbose:
+                verbose_dev.write("# Analyzing program semantics ...\n")
+            syntree = semantic.analyze(syntree, filesource=infilename, lenient=lenient)
+            del semantic
+        finally:
+            if use_cache:
+                diagnostics = cache.end_recording()
+        if use_cache:
+            cache.store(cachekey, syntree, diagnostics)
     if backend == None:
         # If a backend wasn't specified we have nothing left to do.
         if be_verbose:
@@ -454,9 +620,14 @@ if __name__ == "__main__":
             sys.stderr.write('# Compiling %s using the %s backend with the %s "%s"\n' %
                              (infilename, backend, option_word,
                               string.join(backend_options, " ")))
+    # The backend can return either a list of lines or any other
+    # iterable that produces lines, such as a generator.  In the
+    # latter case, unless the code is filtered, it is written as it
+    # is produced without ever being held in memory in its entirety.
     codelist = codegen.generate(syntree, filesource=infilename, filetarget=outfilename, sourcecode=entirefile)
 
-    # Filter the code listing if so desired.
+    # Filter the code listing if so desired.  Filters apply to the
+    # code as a whole so we have to gather it all up first.
     if filter_list != []:
         codestring = string.join(codelist, "\n")
         dummystring = string.join(map(lambda n: chr(random.randint(33, 126)),
@@ -505,3 +676,45 @@ if __name__ == "__main__":
                 sys.stderr.write("# Files generated: <standard output>\n")
             else:
                 sys.stderr.write("# Files generated: %s\n" % outfilename)
+
+
+###########################################################################
+
+# The program starts here.
+if __name__ == "__main__":
+    # Prepare to issue uniform error messages.
+    errmsg = NCPTL_Error("ncptl")
+
+    # If given a compilation server to use, let it do all the work.
+    if len(sys.argv) > 1 and sys.argv[1][:10] == "--connect=":
+        try:
+            exitcode, stdout_text, stderr_text = submit_job(sys.argv[1][10:], os.getcwd(), sys.argv[2:])
+        except (socket.error, ValueError), reason:
+            errmsg.error_fatal("unable to submit a job to %s (%s)" % (sys.argv[1][10:], reason))
+        sys.stdout.write(stdout_text)
+        sys.stderr.write(stderr_text)
+        raise SystemExit, exitcode
+
+    # Determine where coNCePTuaL was installed.
+    try:
+        pythondir = ncptl_config["pythondir"]
+        prefix = ncptl_config["prefix"]
+        pythondir = re.sub(r'\$\{prefix\}', prefix, pythondir)
+    except:
+        pythondir = None
+
+    # Determine where to look for backends.  We defer actually
+    # looking until we know which backends we need.
+    backend2path = None
+    ncptl_path = []
+    if os.environ.has_key("NCPTL_PATH"):
+        ncptl_path = string.split(os.environ["NCPTL_PATH"], ":")
+    backend_path = list(ncptl_path)
+    if pythondir:
+        backend_path.append(pythondir)
+    backend_path.extend(sys.path)
+    backend_path = map(os.path.normpath, backend_path)
+
+
+    # Compile the program.
+    compile_program(sys.argv[1:])
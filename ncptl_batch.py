@@ -0,0 +1,551 @@
+########################################################################
+#
+# Compile many coNCePTuaL programs in forks of a warm process
+#
+# By Scott Pakin <pakin@lanl.gov>
+#
+# ----------------------------------------------------------------------
+#
+# 
+# Copyright (C) 2003, Triad National Security, LLC
+# All rights reserved.
+# 
+# Copyright (2003).  Triad National Security, LLC.  This software
+# was produced under U.S. Government contract 89233218CNA000001 for
+# Los Alamos National Laboratory (LANL), which is operated by Los
+# Alamos National Security, LLC (Triad) for the U.S. Department
+# of Energy. The U.S. Government has rights to use, reproduce,
+# and distribute this software.  NEITHER THE GOVERNMENT NOR TRIAD
+# MAKES ANY WARRANTY, EXPRESS OR IMPLIED, OR ASSUMES ANY LIABILITY
+# FOR THE USE OF THIS SOFTWARE. If software is modified to produce
+# derivative works, such modified software should be clearly marked,
+# so as not to confuse it with the version available from LANL.
+# 
+# Additionally, redistribution and use in source and binary forms,
+# with or without modification, are permitted provided that the
+# following conditions are met:
+# 
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+# 
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer
+#     in the documentation and/or other materials provided with the
+#     distribution.
+# 
+#   * Neither the name of Triad National Security, LLC, Los Alamos
+#     National Laboratory, the U.S. Government, nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY TRIAD AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL TRIAD OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY,
+# OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT
+# OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE
+# OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# 
+#
+########################################################################
+
+import sys
+import os
+import string
+import re
+import time
+import shlex
+import socket
+import select
+import signal
+import errno
+import fcntl
+import tempfile
+import traceback
+try:
+    import multiprocessing
+except ImportError:
+    # Older versions of Python (and Jython) lack the multiprocessing
+    # module.  We then assume a single CPU.
+    multiprocessing = None
+
+
+# Function that compiles one program given a list of ncptl
+# command-line arguments.  NCPTL_Batch sets this before forking any
+# child processes so that the children inherit it.
+_compile_program = None
+
+
+###########################################################################
+
+def _exit_status(code):
+    "Map a SystemExit code to a process exit status the way Python does."
+    if code == None:
+        return 0
+    if type(code) == type(0):
+        return code
+    sys.stderr.write("%s\n" % str(code))
+    return 1
+
+
+def _exit_on_signal(signum, frame):
+    "Exit cleanly when terminated by a signal."
+    raise SystemExit, 0
+
+
+def _wait_child(options):
+    "Wait for any child process, retrying if interrupted by a signal."
+    while 1:
+        try:
+            return os.waitpid(-1, options)
+        except OSError, reason:
+            if reason.errno != errno.EINTR:
+                raise
+
+
+def _run_job(job):
+    """
+         Compile one program within the current process and return
+         an {exit status, standard output, standard error} tuple.
+         JOB is a {working directory, argument list} tuple.  The
+         standard input, output, and error devices are redirected at
+         the file-descriptor level so that output from child
+         processes (e.g., the C compiler) is captured as well.  This
+         is used only on systems that can't fork(); a job that
+         calls the C library's exit() will take the caller with it.
+    """
+    workdir, argv = job
+    sys.stdout.flush()
+    sys.stderr.flush()
+    orig_stdout = sys.stdout
+    orig_stderr = sys.stderr
+    orig_fds = map(os.dup, [0, 1, 2])
+    orig_workdir = os.getcwd()
+    orig_argv = sys.argv
+    captures = [tempfile.TemporaryFile(), tempfile.TemporaryFile()]
+    nullfd = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(nullfd, 0)
+    os.close(nullfd)
+    os.dup2(captures[0].fileno(), 1)
+    os.dup2(captures[1].fileno(), 2)
+    sys.stdout = os.fdopen(os.dup(1), "w")
+    sys.stderr = os.fdopen(os.dup(2), "w", 0)
+    exitcode = 0
+    try:
+        try:
+            os.chdir(workdir)
+            sys.argv = [orig_argv[0]] + argv
+            _compile_program(argv)
+        except SystemExit, exitinfo:
+            exitcode = _exit_status(exitinfo.code)
+        except:
+            traceback.print_exc()
+            exitcode = 1
+    finally:
+        # The job may have closed sys.stdout (e.g., after writing
+        # generated code to it) so we restore the original file
+        # objects and descriptors unconditionally.
+        for jobfile in [sys.stdout, sys.stderr]:
+            try:
+                jobfile.close()
+            except (IOError, ValueError):
+                pass
+        sys.stdout = orig_stdout
+        sys.stderr = orig_stderr
+        for fd in [0, 1, 2]:
+            os.dup2(orig_fds[fd], fd)
+            os.close(orig_fds[fd])
+        os.chdir(orig_workdir)
+        sys.argv = orig_argv
+    output = []
+    for capture in captures:
+        capture.seek(0)
+        output.append(capture.read())
+        capture.close()
+    return (exitcode, output[0], output[1])
+
+
+def _start_job(job, inherited=[]):
+    """
+         Fork a child process to compile one program and return a
+         {process ID, captured output files} tuple.  JOB is a
+         {working directory, argument list} tuple.  INHERITED lists
+         sockets and file descriptors the child should close.
+    """
+    sys.stdout.flush()
+    sys.stderr.flush()
+    captures = [tempfile.TemporaryFile(), tempfile.TemporaryFile()]
+    pid = os.fork()
+    if pid != 0:
+        return (pid, captures)
+
+    # We're the child.  Whatever happens, we must not return to the
+    # caller.
+    exitcode = 1
+    try:
+        try:
+            for obj in inherited:
+                if type(obj) == type(0):
+                    os.close(obj)
+                else:
+                    obj.close()
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            nullfd = os.open(os.devnull, os.O_RDONLY)
+            os.dup2(nullfd, 0)
+            os.close(nullfd)
+            os.dup2(captures[0].fileno(), 1)
+            os.dup2(captures[1].fileno(), 2)
+            sys.stdout = os.fdopen(os.dup(1), "w")
+            sys.stderr = os.fdopen(os.dup(2), "w", 0)
+            workdir, argv = job
+            os.chdir(workdir)
+            sys.argv = [sys.argv[0]] + argv
+            _compile_program(argv)
+            exitcode = 0
+        except SystemExit, exitinfo:
+            exitcode = _exit_status(exitinfo.code)
+        except:
+            traceback.print_exc()
+            exitcode = 1
+    finally:
+        for jobfile in [sys.stdout, sys.stderr]:
+            try:
+                jobfile.flush()
+            except (IOError, ValueError):
+                pass
+        os._exit(exitcode)
+
+
+def _job_result(status, captures):
+    """
+         Return an {exit status, standard output, standard error}
+         tuple given the status returned by waitpid() for a job's
+         process and the files that captured its output.
+    """
+    output = []
+    for capture in captures:
+        capture.seek(0)
+        output.append(capture.read())
+        capture.close()
+    if os.WIFSIGNALED(status):
+        signum = os.WTERMSIG(status)
+        output[1] = output[1] + "ncptl: job terminated by signal %d\n" % signum
+        return (128 + signum, output[0], output[1])
+    return (os.WEXITSTATUS(status), output[0], output[1])
+
+
+###########################################################################
+
+class NCPTL_Batch:
+    """
+       Compile many coNCePTuaL programs concurrently.  Each job is a
+       list of ncptl command-line arguments and runs in a child
+       process forked from the one that created the NCPTL_Batch
+       object.  Anything that process has already loaded (backends,
+       parse tables, etc.) is therefore available to every job at no
+       cost, yet no job can affect another.  A job's standard output,
+       standard error, and exit status are exactly what a separate
+       ncptl run would have produced, even if the job ends by calling
+       the C library's exit() or by receiving a signal.
+    """
+
+    def __init__(self, compile_program, numjobs=None):
+        "Prepare to run up to NUMJOBS jobs at once."
+        global _compile_program
+        _compile_program = compile_program
+        self.fork = hasattr(os, "fork")
+        if numjobs == None:
+            try:
+                numjobs = multiprocessing.cpu_count()
+            except (AttributeError, NotImplementedError):
+                numjobs = 1
+        self.numjobs = max(numjobs, 1)
+
+    def read_manifest(self, manifestname):
+        """
+             Return a list of jobs read from a manifest file.  Each
+             nonblank, non-comment line of the manifest contains
+             the arguments of one ncptl command line, quoted as for
+             the shell.  Relative filenames are interpreted relative
+             to the current directory.
+        """
+        if manifestname == "-":
+            manifest = sys.stdin
+        else:
+            manifest = open(manifestname)
+        joblist = []
+        workdir = os.getcwd()
+        for oneline in manifest.readlines():
+            if re.match(r'^\s*(#.*)?$', oneline):
+                continue
+            joblist.append((workdir, shlex.split(oneline)))
+        if manifest != sys.stdin:
+            manifest.close()
+        return joblist
+
+    def _fork_jobs(self, joblist):
+        """
+             Run a list of jobs in child processes, NUMJOBS at a
+             time, and yield their results in job order.
+        """
+        running = {}      # Map from a process ID to a {job number, captures} tuple
+        finished = {}     # Map from a job number to its result
+        nextjob = 0
+        nextresult = 0
+        while nextresult < len(joblist):
+            if finished.has_key(nextresult):
+                yield finished[nextresult]
+                del finished[nextresult]
+                nextresult = nextresult + 1
+                continue
+            while nextjob < len(joblist) and len(running) < self.numjobs:
+                pid, captures = _start_job(joblist[nextjob])
+                running[pid] = (nextjob, captures)
+                nextjob = nextjob + 1
+            pid, status = _wait_child(0)
+            if not running.has_key(pid):
+                continue
+            jobnum, captures = running[pid]
+            del running[pid]
+            finished[jobnum] = _job_result(status, captures)
+
+    def run_jobs(self, joblist):
+        """
+             Run a list of jobs in parallel.  Write each job's
+             standard output and standard error to ours in job order
+             and return the largest exit status any job returned.
+        """
+        if self.fork:
+            results = self._fork_jobs(joblist)
+        else:
+            results = map(_run_job, joblist)
+        worst_exitcode = 0
+        for exitcode, stdout_text, stderr_text in results:
+            sys.stdout.write(stdout_text)
+            sys.stdout.flush()
+            sys.stderr.write(stderr_text)
+            sys.stderr.flush()
+            worst_exitcode = max(worst_exitcode, exitcode)
+        return worst_exitcode
+
+    def serve(self, socketname, timeout=60):
+        """
+             Accept jobs from submit_job() over a Unix-domain socket
+             until interrupted.  A client that takes more than
+             TIMEOUT seconds to send its job is disconnected.
+        """
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            os.remove(socketname)
+        except OSError:
+            pass
+        server.bind(socketname)
+        orig_sigterm = signal.signal(signal.SIGTERM, _exit_on_signal)
+        running = {}      # Map from a process ID to a {connection, captures} tuple
+        pending = {}      # Map from a connection to a {received text, deadline} tuple
+        queued = []       # List of {connection, job} tuples ready to run
+        if self.fork:
+            # A SIGCHLD handler writes to a pipe that we select() on
+            # so that a job can't finish unnoticed between our
+            # reaping children and our waiting for a new connection.
+            wakeup = os.pipe()
+            for fd in wakeup:
+                fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+            def note_child(signum, frame, wakeup=wakeup):
+                try:
+                    os.write(wakeup[1], "\0")
+                except OSError:
+                    pass
+            orig_sigchld = signal.signal(signal.SIGCHLD, note_child)
+            signal.siginterrupt(signal.SIGCHLD, 0)
+        try:
+            server.listen(socket.SOMAXCONN)
+            while 1:
+                if not self.fork:
+                    connection, address = server.accept()
+                    try:
+                        job = _receive_job(connection, time.time() + timeout)
+                    except (socket.error, ValueError):
+                        connection.close()
+                        continue
+                    _send_result(connection, _run_job(job))
+                    continue
+
+                # Reply to every client whose job has finished.
+                while running:
+                    pid, status = _wait_child(os.WNOHANG)
+                    if pid == 0:
+                        break
+                    if running.has_key(pid):
+                        connection, captures = running[pid]
+                        del running[pid]
+                        _send_result(connection, _job_result(status, captures))
+
+                # Start as many of the received jobs as we have room for.
+                while queued and len(running) < self.numjobs:
+                    connection, job = queued.pop(0)
+                    inherited = [server, wakeup[0], wakeup[1], connection] + pending.keys()
+                    for otherconn, otherjob in queued:
+                        inherited.append(otherconn)
+                    for otherconn, captures in running.values():
+                        inherited.append(otherconn)
+                    pid, captures = _start_job(job, inherited)
+                    running[pid] = (connection, captures)
+
+                # Disconnect every client that missed its deadline.
+                now = time.time()
+                for connection, (received, deadline) in pending.items():
+                    if deadline <= now:
+                        del pending[connection]
+                        connection.close()
+
+                # Wait for a job to finish, a new connection, or more
+                # of a job.  Clients send their jobs concurrently so
+                # a slow client can't hold up the others.
+                waitlist = [server, wakeup[0]] + pending.keys()
+                if pending:
+                    deadline = min(map(lambda entry: entry[1], pending.values()))
+                    waittime = max(deadline - now, 0)
+                else:
+                    waittime = None
+                try:
+                    readable = select.select(waitlist, [], [], waittime)[0]
+                except select.error, reason:
+                    if reason.args[0] != errno.EINTR:
+                        raise
+                    continue
+                if wakeup[0] in readable:
+                    try:
+                        os.read(wakeup[0], 512)
+                    except OSError:
+                        pass
+
+                # Read whatever the clients have sent.  A job is
+                # complete once its client stops writing.
+                for connection in readable:
+                    if not pending.has_key(connection):
+                        continue
+                    try:
+                        data = connection.recv(65536)
+                    except socket.error:
+                        del pending[connection]
+                        connection.close()
+                        continue
+                    received, deadline = pending[connection]
+                    if data:
+                        received.append(data)
+                        continue
+                    del pending[connection]
+                    try:
+                        job = _parse_job(string.join(received, ""))
+                    except ValueError:
+                        connection.close()
+                        continue
+                    queued.append((connection, job))
+
+                # Accept a new connection.
+                if server in readable:
+                    connection, address = server.accept()
+                    pending[connection] = ([], time.time() + timeout)
+        finally:
+            signal.signal(signal.SIGTERM, orig_sigterm)
+            server.close()
+            try:
+                os.remove(socketname)
+            except OSError:
+                pass
+            for connection in pending.keys():
+                connection.close()
+            for connection, job in queued:
+                connection.close()
+            if self.fork:
+                # Let every outstanding job finish and reply to its
+                # client before we exit.
+                signal.signal(signal.SIGCHLD, orig_sigchld)
+                while running:
+                    pid, status = _wait_child(0)
+                    if running.has_key(pid):
+                        connection, captures = running[pid]
+                        del running[pid]
+                        _send_result(connection, _job_result(status, captures))
+                map(os.close, wakeup)
+
+
+###########################################################################
+
+# A job is sent over a socket as a NUL-separated list of strings
+# (the working directory followed by the ncptl arguments) terminated
+# by the end of the client's output.  The result is sent back as a
+# line containing the exit status and the lengths of the standard
+# output and standard error text followed by the text itself.
+
+def _receive_all(connection, deadline=None):
+    """
+         Read from a socket until the other end stops writing.  Raise
+         socket.timeout if the time.time() value DEADLINE passes first.
+    """
+    chunks = []
+    while 1:
+        if deadline != None:
+            timeleft = deadline - time.time()
+            if timeleft <= 0:
+                raise socket.timeout, "timed out"
+            connection.settimeout(timeleft)
+        data = connection.recv(65536)
+        if not data:
+            break
+        chunks.append(data)
+    if deadline != None:
+        connection.settimeout(None)
+    return string.join(chunks, "")
+
+
+def _parse_job(text):
+    "Convert the text of a job to a {working directory, argument list} tuple."
+    fields = string.split(text, "\0")
+    if len(fields) < 1 or fields[0] == "":
+        raise ValueError, "malformed job"
+    return (fields[0], fields[1:])
+
+
+def _receive_job(connection, deadline=None):
+    "Read a job from a socket by DEADLINE."
+    return _parse_job(_receive_all(connection, deadline))
+
+
+def _send_result(connection, result):
+    "Write a job's result to a socket and close the socket."
+    exitcode, stdout_text, stderr_text = result
+    try:
+        try:
+            connection.sendall("%d %d %d\n%s%s" % (exitcode, len(stdout_text), len(stderr_text),
+                                                   stdout_text, stderr_text))
+        except socket.error:
+            # The client went away; nobody is left to tell.
+            pass
+    finally:
+        connection.close()
+
+
+def submit_job(socketname, workdir, argv):
+    """
+         Ask a server started by NCPTL_Batch.serve() to compile a
+         program.  Return an {exit status, standard output, standard
+         error} tuple.
+    """
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        connection.connect(socketname)
+        connection.sendall(string.join([workdir] + list(argv), "\0"))
+        connection.shutdown(socket.SHUT_WR)
+        reply = _receive_all(connection)
+    finally:
+        connection.close()
+    header, body = string.split(reply, "\n", 1)
+    exitcode, stdout_len, stderr_len = map(int, string.split(header))
+    return (exitcode, body[:stdout_len], body[stdout_len:stdout_len+stderr_len])
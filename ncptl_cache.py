@@ -0,0 +1,362 @@
+########################################################################
+#
+# Persistent cache of analyzed coNCePTuaL abstract syntax trees and
+# of compiled backend output
+#
+# By Scott Pakin <pakin@lanl.gov>
+#
+# ----------------------------------------------------------------------
+#
+# 
+# Copyright (C) 2003, Triad National Security, LLC
+# All rights reserved.
+# 
+# Copyright (2003).  Triad National Security, LLC.  This software
+# was produced under U.S. Government contract 89233218CNA000001 for
+# Los Alamos National Laboratory (LANL), which is operated by Los
+# Alamos National Security, LLC (Triad) for the U.S. Department
+# of Energy. The U.S. Government has rights to use, reproduce,
+# and distribute this software.  NEITHER THE GOVERNMENT NOR TRIAD
+# MAKES ANY WARRANTY, EXPRESS OR IMPLIED, OR ASSUMES ANY LIABILITY
+# FOR THE USE OF THIS SOFTWARE. If software is modified to produce
+# derivative works, such modified software should be clearly marked,
+# so as not to confuse it with the version available from LANL.
+# 
+# Additionally, redistribution and use in source and binary forms,
+# with or without modification, are permitted provided that the
+# following conditions are met:
+# 
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+# 
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer
+#     in the documentation and/or other materials provided with the
+#     distribution.
+# 
+#   * Neither the name of Triad National Security, LLC, Los Alamos
+#     National Laboratory, the U.S. Government, nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY TRIAD AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL TRIAD OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY,
+# OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT
+# OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE
+# OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# 
+#
+########################################################################
+
+import sys
+import os
+import string
+import stat
+import shutil
+try:
+    import cPickle
+    pickle = cPickle
+except ImportError:
+    import pickle
+try:
+    from hashlib import md5
+except ImportError:
+    # Older versions of Python (and Jython) provide only the md5 module.
+    from md5 import new as md5
+from ncptl_config import ncptl_config
+
+
+# Modules whose contents determine the result of lexing, parsing, and
+# analyzing a program.  A change to any of these invalidates the cache.
+_front_end_modules = ["ncptl_lexer", "ncptl_parser", "ncptl_parse_table",
+                      "ncptl_semantic", "ncptl_ast", "ncptl_token",
+                      "ncptl_keywords", "ncptl_variables", "ncptl_error",
+                      "lex", "yacc"]
+
+# Default upper bound on the total size of the cache in megabytes.
+_default_cache_megabytes = 64
+
+
+###########################################################################
+
+# Helper class that records everything written to a file while still
+# passing it through
+class _RecordingWriter:
+    def __init__(self, device):
+        "Wrap a given file object."
+        self.device = device
+        self.recorded = []
+
+    def write(self, text):
+        "Write a string and remember that we did so."
+        self.recorded.append(text)
+        self.device.write(text)
+
+    def __getattr__(self, name):
+        "Delegate everything else to the underlying file object."
+        return getattr(self.device, name)
+
+
+###########################################################################
+
+class NCPTL_Cache:
+    """
+       Maintain a persistent, content-addressed cache of analyzed
+       abstract syntax trees.  Each entry is keyed by an MD5 hash of
+       the program source, the file name it came from, the
+       --lenient flag, and the compiler version and stores the AST
+       along with whatever diagnostics the front end issued.  The
+       cache is bounded in size; the least recently used entries are
+       evicted first.  All cache errors are silently ignored -- the
+       worst case is that the program simply gets recompiled.
+
+       The same directory also holds opaque files (object files and
+       executables) produced by compiling backends.  These are keyed
+       by whatever the backend says determines their contents, and
+       files that callers write and memory-map in place (e.g., the
+       columnar caches of parsed log files).  Finally, small named
+       indexes (e.g., of where each backend lives) can be stored
+       alongside the other entries; these are never evicted.
+    """
+
+    def __init__(self, cachedir=None, maxbytes=None):
+        "Locate (and if necessary create) the cache directory."
+        if cachedir == None:
+            try:
+                cachedir = os.environ["NCPTL_CACHE_DIR"]
+            except KeyError:
+                try:
+                    cachebase = os.environ["XDG_CACHE_HOME"]
+                except KeyError:
+                    cachebase = os.path.join(os.path.expanduser("~"), ".cache")
+                cachedir = os.path.join(cachebase, "ncptl")
+        if maxbytes == None:
+            try:
+                maxbytes = long(float(os.environ["NCPTL_CACHE_SIZE"]) * 1048576)
+            except (KeyError, ValueError):
+                maxbytes = _default_cache_megabytes * 1048576L
+        self.cachedir = cachedir
+        self.maxbytes = maxbytes
+        self.recorder = None
+        try:
+            if not os.path.isdir(cachedir):
+                os.makedirs(cachedir, 0700)
+            self.enabled = os.access(cachedir, os.R_OK | os.W_OK | os.X_OK)
+        except (OSError, IOError):
+            self.enabled = 0
+
+    def _compiler_signature(self):
+        "Return a string that changes whenever the front end changes."
+        signature = [ncptl_config["PACKAGE_VERSION"], sys.version]
+        for modname in _front_end_modules:
+            try:
+                filename = sys.modules[modname].__file__
+            except (KeyError, AttributeError):
+                try:
+                    filename = __import__(modname).__file__
+                except (ImportError, AttributeError):
+                    continue
+            if filename[-4:] in (".pyc", ".pyo") and os.path.exists(filename[:-1]):
+                filename = filename[:-1]
+            try:
+                statinfo = os.stat(filename)
+                signature.append("%s:%d:%d" % (modname,
+                                               statinfo[stat.ST_SIZE],
+                                               statinfo[stat.ST_MTIME]))
+            except OSError:
+                signature.append(modname)
+        return string.join(signature, "\n")
+
+    def make_key(self, sourcecode, filesource, lenient):
+        "Return the cache key for a given program."
+        hasher = md5()
+        hasher.update(self._compiler_signature())
+        hasher.update("\0%s\0%d\0" % (filesource, lenient))
+        hasher.update(sourcecode)
+        return hasher.hexdigest()
+
+    def make_build_key(self, keyparts):
+        "Return the cache key for a file built from a list of strings."
+        hasher = md5()
+        hasher.update(ncptl_config["PACKAGE_VERSION"])
+        for onepart in keyparts:
+            hasher.update("\0")
+            hasher.update(onepart)
+        return hasher.hexdigest()
+
+    def _entry_name(self, key, suffix=".ast"):
+        "Map a cache key to a filename."
+        return os.path.join(self.cachedir, key + suffix)
+
+    def load(self, key):
+        """
+             Return an {AST, diagnostics} tuple corresponding to a
+             given key or None if the key is not in the cache.
+        """
+        if not self.enabled:
+            return None
+        entryname = self._entry_name(key)
+        try:
+            entryfile = open(entryname, "rb")
+            try:
+                syntree, diagnostics = pickle.load(entryfile)
+            finally:
+                entryfile.close()
+        except:
+            # Treat missing, truncated, and otherwise corrupt entries
+            # as cache misses.
+            return None
+        try:
+            # Mark the entry as recently used.
+            os.utime(entryname, None)
+        except OSError:
+            pass
+        return (syntree, diagnostics)
+
+    def begin_recording(self):
+        "Start recording diagnostics written to the standard error device."
+        self.recorder = _RecordingWriter(sys.stderr)
+        sys.stderr = self.recorder
+
+    def end_recording(self):
+        "Stop recording diagnostics and return those that were recorded."
+        if self.recorder == None:
+            return ""
+        sys.stderr = self.recorder.device
+        diagnostics = string.join(self.recorder.recorded, "")
+        self.recorder = None
+        return diagnostics
+
+    def store(self, key, syntree, diagnostics):
+        "Add an entry to the cache then evict old entries as necessary."
+        if not self.enabled:
+            return
+        entryname = self._entry_name(key)
+        tempname = "%s.%d.tmp" % (entryname, os.getpid())
+        try:
+            entryfile = open(tempname, "wb")
+            try:
+                pickle.dump((syntree, diagnostics), entryfile, 2)
+            finally:
+                entryfile.close()
+            os.rename(tempname, entryname)
+        except:
+            try:
+                os.remove(tempname)
+            except OSError:
+                pass
+            return
+        self.evict()
+
+    def load_file(self, key, destname):
+        """
+             Copy the file corresponding to a given key to DESTNAME,
+             preserving its permissions.  Return 1 on success, 0 if
+             the key is not in the cache.
+        """
+        if not self.enabled:
+            return 0
+        entryname = self._entry_name(key, ".bin")
+        try:
+            shutil.copyfile(entryname, destname)
+            shutil.copymode(entryname, destname)
+        except (IOError, OSError):
+            return 0
+        try:
+            os.utime(entryname, None)
+        except OSError:
+            pass
+        return 1
+
+    def store_file(self, key, srcname):
+        "Copy a file into the cache then evict old entries as necessary."
+        if not self.enabled:
+            return
+        entryname = self._entry_name(key, ".bin")
+        tempname = "%s.%d.tmp" % (entryname, os.getpid())
+        try:
+            shutil.copyfile(srcname, tempname)
+            shutil.copymode(srcname, tempname)
+            os.rename(tempname, entryname)
+        except (IOError, OSError):
+            try:
+                os.remove(tempname)
+            except OSError:
+                pass
+            return
+        self.evict()
+
+    def mapped_file_name(self, key):
+        """
+             Return the name of the file that holds a given key's
+             memory-mappable data or None if the cache is disabled.
+             The caller reads and writes the file itself and should
+             call evict() after writing it.
+        """
+        if not self.enabled:
+            return None
+        return self._entry_name(key, ".map")
+
+    def load_index(self, name):
+        "Return the index stored under a given name or None if there is none."
+        if not self.enabled:
+            return None
+        try:
+            indexfile = open(self._entry_name(name, ".idx"), "rb")
+            try:
+                return pickle.load(indexfile)
+            finally:
+                indexfile.close()
+        except:
+            return None
+
+    def store_index(self, name, value):
+        "Store an index under a given name, replacing any previous index."
+        if not self.enabled:
+            return
+        indexname = self._entry_name(name, ".idx")
+        tempname = "%s.%d.tmp" % (indexname, os.getpid())
+        try:
+            indexfile = open(tempname, "wb")
+            try:
+                pickle.dump(value, indexfile, 2)
+            finally:
+                indexfile.close()
+            os.rename(tempname, indexname)
+        except:
+            try:
+                os.remove(tempname)
+            except OSError:
+                pass
+
+    def evict(self):
+        "Delete least recently used entries until the cache fits in maxbytes."
+        try:
+            entrylist = []
+            totalbytes = 0L
+            for entry in os.listdir(self.cachedir):
+                if entry[-4:] not in (".ast", ".bin", ".map"):
+                    continue
+                entryname = os.path.join(self.cachedir, entry)
+                statinfo = os.stat(entryname)
+                entrylist.append((statinfo[stat.ST_MTIME], entryname, statinfo[stat.ST_SIZE]))
+                totalbytes = totalbytes + statinfo[stat.ST_SIZE]
+        except OSError:
+            return
+        if totalbytes <= self.maxbytes:
+            return
+        entrylist.sort()
+        for mtime, entryname, entrybytes in entrylist:
+            if totalbytes <= self.maxbytes:
+                break
+            try:
+                os.remove(entryname)
+                totalbytes = totalbytes - entrybytes
+            except OSError:
+                pass
@@ -61,6 +61,9 @@ import lex
 from ncptl_error import NCPTL_Error
 from ncptl_keywords import Keywords
 
+# Define the PLY lexer from which each NCPTL_Lexer's lexer is cloned.
+_master_lexer = None
+
 class NCPTL_Lexer:
     def __init__(self):
         "Initialize the lexer."
@@ -157,16 +160,26 @@ class NCPTL_Lexer:
         # hash character).
         self.line2comment = {}
 
-        # Initialize the lexer.
-        lex.lex(module=self)
+        # Initialize the lexer.  Because building the master regular
+        # expression is expensive, we build it only once and give
+        # each NCPTL_Lexer object a clone that invokes its methods.
+        global _master_lexer
+        try:
+            lexobj = self.lexobj
+        except AttributeError:
+            if _master_lexer == None:
+                _master_lexer = lex.lex(module=self)
+            lexobj = _master_lexer.clone(self)
+            self.lexobj = lexobj
+        lexobj.lineno = 1
 
         # Repeatedly invoke the lexer and return all of the tokens it produces.
         self.lineno = 1
-        lex.input(sourcecode)
+        lexobj.input(sourcecode)
         self.toklist = []
         while 1:
             # Acquire the next token and assign it a line number if necessary.
-            token = lex.token()
+            token = lexobj.token()
             if not token:
                 break
             if token.lineno < self.lineno:
@@ -184,6 +197,16 @@ class NCPTL_Lexer:
             self.toklist.append(token)
         return self.toklist
 
+    def tokenize_many(self, sources):
+        """
+             Tokenize each (source code, file source) pair in a list
+             and return a list of the corresponding token lists.
+        """
+        toklists = []
+        for sourcecode, filesource in sources:
+            toklists.append(self.tokenize(sourcecode, filesource=filesource))
+        return toklists
+
     # Define a bunch of simple token types.
     t_comma       = r' , '
     t_ellipsis    = r' \.\.\. '
@@ -0,0 +1,688 @@
+########################################################################
+#
+# Merge comments from multiple coNCePTuaL log files using a pool of
+# worker processes
+#
+# By Scott Pakin <pakin@lanl.gov>
+#
+# ----------------------------------------------------------------------
+#
+# 
+# Copyright (C) 2003, Triad National Security, LLC
+# All rights reserved.
+# 
+# Copyright (2003).  Triad National Security, LLC.  This software
+# was produced under U.S. Government contract 89233218CNA000001 for
+# Los Alamos National Laboratory (LANL), which is operated by Los
+# Alamos National Security, LLC (Triad) for the U.S. Department
+# of Energy. The U.S. Government has rights to use, reproduce,
+# and distribute this software.  NEITHER THE GOVERNMENT NOR TRIAD
+# MAKES ANY WARRANTY, EXPRESS OR IMPLIED, OR ASSUMES ANY LIABILITY
+# FOR THE USE OF THIS SOFTWARE. If software is modified to produce
+# derivative works, such modified software should be clearly marked,
+# so as not to confuse it with the version available from LANL.
+# 
+# Additionally, redistribution and use in source and binary forms,
+# with or without modification, are permitted provided that the
+# following conditions are met:
+# 
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+# 
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer
+#     in the documentation and/or other materials provided with the
+#     distribution.
+# 
+#   * Neither the name of Triad National Security, LLC, Los Alamos
+#     National Laboratory, the U.S. Government, nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY TRIAD AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL TRIAD OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY,
+# OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT
+# OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE
+# OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# 
+#
+########################################################################
+
+import sys
+import os
+import re
+import string
+import math
+import getopt
+import itertools
+from array import array
+try:
+    import cStringIO
+    StringIO = cStringIO
+except ImportError:
+    import StringIO
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+import ncptl_logreader
+
+# Define some global variables.
+progname = os.path.basename(sys.argv[0])   # This program's name
+
+# Define the regular expressions ncptl-logmerge applies to each file.
+_blank_re = re.compile(r'\s*$')
+_title_re = re.compile(r'^\# coNCePTuaL log file', re.M)
+_ruler_re = re.compile(r'^\# ={19}', re.M)
+_rank_re = re.compile(r'^\# Rank \(0<=P<tasks\): (\d+)', re.M)
+_number_re = re.compile(r'''(([-+]?\d+(\.\d+)?) |   # Optional fraction
+                             ([-+]?(\d+)?\.\d+))    # Optional integer
+                            (?!\.)''', re.X)
+
+# Most lines recur across log files, so remember how each line rounds
+# (up to a limit).  Every worker process has its own cache.
+_rounded_lines = {}
+_rounded_lines_max = 100000
+
+# Map each aggregate-function name to the header the run-time library
+# writes for it and to a function that computes it.  The names are
+# those of the run-time library's find_*() functions.
+_aggregate_headers = {
+    "mean":           "(mean)",
+    "harmonic_mean":  "(harm. mean)",
+    "geometric_mean": "(geom. mean)",
+    "median":         "(median)",
+    "mad":            "(med. abs. dev.)",
+    "std_dev":        "(std. dev.)",
+    "variance":       "(variance)",
+    "sum":            "(sum)",
+    "minimum":        "(minimum)",
+    "maximum":        "(maximum)",
+    "final":          "(final)",
+    "only":           "(only value)"}
+
+# Define the aggregate functions to compute if none are specified.
+default_aggregates = "minimum,median,maximum"
+
+
+###########################################################################
+
+def file_of_files(name):
+    """
+       Expand one filename into one or more filenames.  A directory
+       is replaced by the files it contains, and "@file" is replaced
+       by the whitespace-separated filenames listed in file.
+       "@@name" stands for the literal name "@name".
+    """
+    if os.path.isdir(name):
+        # Replace directories with their non-directory contents.
+        filelist = map(lambda f, name=name: os.path.join(name, f), os.listdir(name))
+    elif name[:1] == "@":
+        # Specially process names beginning with "@".
+        atfile = name[1:]
+        if atfile[:1] == "@":
+            return [atfile]
+        try:
+            filelist = string.split(open(atfile).read())
+        except IOError:
+            raise IOError, "unable to open %s" % atfile
+        if filelist == []:
+            raise ValueError, "no filenames found in %s" % atfile
+        return filelist
+    else:
+        filelist = [name]
+
+    # Complain if any of the filenames is in fact a directory.
+    filesonly = []
+    for filename in filelist:
+        if os.path.isdir(filename):
+            sys.stderr.write("%s: warning: ignoring directory %s\n" % (progname, filename))
+        else:
+            filesonly.append(filename)
+    return filesonly
+
+
+def roundnum(num):
+    "Round a number to two significant digits."
+    if num == 0.0:
+        return 0
+    def twosigdigs(num):
+        pow10 = math.pow(10.0, math.floor(math.log10(num)))
+        return math.floor(num*10.0/pow10 + 0.5) / 10.0 * pow10
+    if num > 0:
+        return twosigdigs(num)
+    else:
+        return -twosigdigs(-num)
+
+
+def _perl_number(num):
+    "Format a number the way Perl converts numbers to strings."
+    return "%.15g" % num
+
+
+def round_numbers(oneline):
+    "Round every number in a line of text to two significant digits."
+    try:
+        return _rounded_lines[oneline]
+    except KeyError:
+        pass
+    if len(_rounded_lines) >= _rounded_lines_max:
+        _rounded_lines.clear()
+    rounded = _number_re.sub(lambda match: _perl_number(roundnum(float(match.group(0)))),
+                             oneline)
+    _rounded_lines[oneline] = rounded
+    return rounded
+
+
+def collapse_ranges(procnums, simplification=0):
+    """
+       Given a list of processor numbers (strings) sorted in
+       ascending numerical order, return a string of comma-separated
+       ranges.
+    """
+    if simplification >= 4:
+        return str(len(procnums))
+    rangestr = procnums[0]
+    rangelen = 0
+    for ofs in range(1, len(procnums)):
+        if int(procnums[ofs]) == int(procnums[ofs-1]) + 1:
+            # Continue the previous range.
+            rangelen = rangelen + 1
+        else:
+            # We skipped a number.
+            if rangelen == 1:
+                # Complete the previous degenerate range.
+                rangestr = rangestr + ",%s,%s" % (procnums[ofs-1], procnums[ofs])
+            elif rangelen:
+                # Complete the previous ordinary range.
+                rangestr = rangestr + "-%s,%s" % (procnums[ofs-1], procnums[ofs])
+            else:
+                # We didn't have a previous range.
+                rangestr = rangestr + ",%s" % procnums[ofs]
+            rangelen = 0
+
+    # Handle the final range.
+    if rangelen == 1:
+        rangestr = rangestr + ",%s" % procnums[-1]
+    elif rangelen:
+        rangestr = rangestr + "-%s" % procnums[-1]
+    return rangestr
+
+
+###########################################################################
+
+def prepare_log(filename, simplification=0, want_tables=0):
+    """
+       Read a log file and prepare it for merging.  Return the
+       process rank (as a string), the file's lines with the title
+       and rulers rewritten as ncptl-logmerge does and, if
+       SIMPLIFICATION is 3 or more, every number rounded, and -- if
+       WANT_TABLES is true -- the file's data tables.
+    """
+    logfile = open(filename)
+    try:
+        contents = logfile.read()
+    finally:
+        logfile.close()
+    if _blank_re.match(contents):
+        raise ValueError, "file %s contains no data" % filename
+    tables = None
+    if want_tables:
+        tables = ncptl_logreader.NCPTL_LogFile(StringIO.StringIO(contents)).tables
+
+    # Rewrite the title and rulers and find the processor number.
+    contents, numsubs = _title_re.subn("# Merged coNCePTuaL log file", contents, 1)
+    if not numsubs:
+        raise ValueError, "%s does not look like an unmerged coNCePTuaL log file" % filename
+    contents = _ruler_re.sub("# " + "="*26, contents)
+    rank = _rank_re.search(contents)
+    if not rank:
+        raise ValueError, "No process rank found in %s" % filename
+
+    # Split the result into lines, discarding trailing empty lines
+    # as Perl's split does.
+    lines = string.split(contents, "\n")
+    while lines and lines[-1] == "":
+        del lines[-1]
+    if simplification >= 3:
+        lines = map(round_numbers, lines)
+    return rank.group(1), lines, tables
+
+
+def _prepare_log_star(args):
+    "Invoke prepare_log from a worker process."
+    return apply(prepare_log, args)
+
+
+def read_logs(filenames, simplification=0, want_tables=0, jobs=None):
+    """
+       Prepare every log file in FILENAMES with prepare_log and
+       return a list of the results in the same order.  The files
+       are read and preprocessed by a pool of JOBS worker processes
+       (default: one per CPU).  Lines the files have in common are
+       stored only once.
+    """
+    arglist = map(lambda f, s=simplification, w=want_tables: (f, s, w), filenames)
+    if jobs == None and multiprocessing != None:
+        jobs = multiprocessing.cpu_count()
+    pool = None
+    if multiprocessing != None and jobs > 1 and len(filenames) > 1:
+        pool = multiprocessing.Pool(min(jobs, len(filenames)))
+        results = pool.imap(_prepare_log_star, arglist,
+                            max(1, len(filenames)/(jobs*4)))
+    else:
+        results = itertools.imap(_prepare_log_star, arglist)
+    logs = []
+    try:
+        for procnum, lines, tables in results:
+            logs.append((procnum, map(intern, lines), tables))
+    except:
+        if pool:
+            pool.terminate()
+        raise
+    if pool:
+        pool.close()
+        pool.join()
+    return logs
+
+
+###########################################################################
+
+def _merge_variants(lines_seen, procnums, simplification, unique_rounded):
+    """
+       Given a map from lines of text to a list of file numbers
+       which contain it, return the lines to output.
+    """
+    variations = lines_seen.keys()
+    if len(variations) == 1 and len(lines_seen[variations[0]]) == len(procnums):
+        # No mismatches -- output a single copy unless the user
+        # wants to simplify away non-mismatched lines.
+        if simplification:
+            return []
+        return variations
+
+    # Abort if the input files were generated from different executions.
+    for variant in variations:
+        if string.find(variant, "Unique execution identifier") != -1:
+            raise ValueError, "Not all log files came from the same run of the same program"
+
+    # Determine based on the simplification level and the number of
+    # variations if we need to output the line.
+    if simplification >= 2 and len(variations) == len(procnums):
+        return []
+    if simplification >= 3 and len(variations) == unique_rounded:
+        return []
+
+    # Sort the file numbers by processor number then output the
+    # variations sorted first by decreasing tally then by increasing
+    # file number.
+    bynumber = lambda a, b, procnums=procnums: cmp(int(procnums[a]), int(procnums[b]))
+    for fnums in lines_seen.values():
+        fnums.sort(bynumber)
+    variations.sort(lambda a, b, lines_seen=lines_seen:
+                        cmp(len(lines_seen[b]), len(lines_seen[a])) or
+                        cmp(lines_seen[a][0], lines_seen[b][0]))
+    outlines = []
+    for variant in variations:
+        ranks = map(lambda f, procnums=procnums: procnums[f], lines_seen[variant])
+        outlines.append("#[%s]%s" % (collapse_ranges(ranks, simplification), variant))
+    return outlines
+
+
+def merge_logs(logs, simplification=0):
+    """
+       Yield the lines of the merged log file that ncptl-logmerge
+       would produce from LOGS, a list of {rank, lines, tables} tuples as
+       read_logs returns.  SIMPLIFICATION has the same meaning as the
+       number of times ncptl-logmerge's --simplify option is given.
+       The files are walked in lockstep, each one consumed as a
+       stream of lines.
+    """
+    procnums = map(lambda log: log[0], logs)
+    inputdata = map(lambda log: log[1], logs)
+    filerange = range(0, len(inputdata))
+    unique_rounded = None
+    if simplification >= 3:
+        # Determine the number of unique values we get by rounding
+        # the file numbers.
+        roundedvals = {}
+        for fnum in filerange:
+            roundedvals[_perl_number(roundnum(fnum))] = 1
+        unique_rounded = len(roundedvals)
+
+    # Walk the files line by line until we exhaust (1) the initial
+    # row of octothorps, (2) the system-related prologue comments,
+    # (3) the list of environment variables, (4) the coNCePTuaL
+    # source code, (5) the separator between the prologue and the
+    # raw data, (6) the raw data, and (7) the epilogue comments.
+    # Each set ends with a synchronization line (a row consisting
+    # only of "#" characters).
+    lineno = [0] * len(inputdata)
+    for setnum in range(7):
+        while lineno[0] < len(inputdata[0]):
+            # Handle the common case, in which every file contains the
+            # same line, as quickly as possible.
+            pastend = []
+            try:
+                current = map(lambda lines, pos: lines[pos], inputdata, lineno)
+                fline = current[0]
+                if current.count(fline) == len(current):
+                    if fline and fline[0] == "#" and not string.lstrip(fline, "#"):
+                        break
+                    lineno = map(lambda pos: pos + 1, lineno)
+                    if not simplification:
+                        yield fline
+                    continue
+            except IndexError:
+                # Reading past the end of a file yields an empty line.
+                current = []
+                for fnum in filerange:
+                    try:
+                        current.append(inputdata[fnum][lineno[fnum]])
+                    except IndexError:
+                        current.append("")
+                        pastend.append(fnum)
+            warnings_seen = 0
+            for fline in current:
+                if fline[:11] == "# WARNING: ":
+                    warnings_seen = 1
+                    break
+
+            # Compare the current line across all files.  Tally but
+            # ignore synchronization lines, and if any file contains a
+            # warning, ignore all other lines.
+            lines_seen = {}
+            separators_seen = 0
+            for fnum in filerange:
+                fline = current[fnum]
+                if fline and fline[0] == "#" and not string.lstrip(fline, "#"):
+                    separators_seen = separators_seen + 1
+                    continue
+                if warnings_seen and fline[:11] != "# WARNING: ":
+                    continue
+                lineno[fnum] = lineno[fnum] + 1
+                try:
+                    lines_seen[fline].append(fnum)
+                except KeyError:
+                    lines_seen[fline] = [fnum]
+            if pastend and separators_seen + len(pastend) == len(inputdata):
+                # ncptl-logmerge would wait forever for the shorter
+                # file to reach a synchronization line.
+                raise ValueError, "the log file for rank %s ends prematurely" % procnums[pastend[0]]
+            for outline in _merge_variants(lines_seen, procnums,
+                                           simplification, unique_rounded):
+                yield outline
+
+            # Stop when we exhaust the current set of comments.
+            if separators_seen == len(inputdata):
+                break
+
+        # Consume and output the synchronization lines.
+        for fnum in filerange:
+            lineno[fnum] = lineno[fnum] + 1
+        if lineno[0] <= len(inputdata[0]) and not simplification:
+            yield inputdata[0][lineno[0]-1]
+
+
+###########################################################################
+
+def parse_aggregates(namelist):
+    """
+       Convert a comma-separated list of aggregate-function names
+       (e.g., "median,mad,percentile:95") into a list of {header,
+       function name, parameter} tuples.
+    """
+    aggregates = []
+    for name in string.split(namelist, ","):
+        name = string.strip(name)
+        if name[:11] == "percentile:":
+            try:
+                percentile = float(name[11:])
+            except ValueError:
+                raise ValueError, 'invalid percentile "%s"' % name[11:]
+            if percentile < 0.0 or percentile > 100.0:
+                raise ValueError, "Percentile %.25g is invalid (must be from 0 to 100)" % percentile
+            # The run-time library labels every percentile "th".
+            aggregates.append(("(%.0fth percentile)" % percentile, "percentile", percentile))
+        elif _aggregate_headers.has_key(name):
+            aggregates.append((_aggregate_headers[name], name, None))
+        else:
+            raise ValueError, 'unknown aggregate function "%s"' % name
+    return aggregates
+
+
+def _find_median(sortedvalues):
+    "Return the median of a sorted list of values."
+    middle = len(sortedvalues) / 2
+    if len(sortedvalues) & 1:
+        return sortedvalues[middle]
+    return (sortedvalues[middle-1] + sortedvalues[middle]) / 2.0
+
+
+def _find_variance(values):
+    "Return the (unbiased) variance of a list of values."
+    if len(values) <= 1:
+        return 0.0
+    mean = sum(values) / len(values)
+    return sum(map(lambda v, mean=mean: (v-mean)*(v-mean), values)) / (len(values) - 1.0)
+
+
+def compute_aggregate(funcname, param, values, sortedvalues):
+    """
+       Apply the named aggregate function to a list of values (in
+       rank order) and the same list sorted in ascending order.
+    """
+    numvalues = len(values)
+    if funcname == "mean":
+        return sum(values) / numvalues
+    elif funcname == "harmonic_mean":
+        if 0.0 in values:
+            raise ValueError, "Attempted to take the harmonic mean of a set containing a zero element"
+        return numvalues / sum(map(lambda v: 1.0/v, values))
+    elif funcname == "geometric_mean":
+        if 0.0 in values:
+            raise ValueError, "Attempted to take the geometric mean of a set containing a zero element"
+        product = 1.0
+        for value in values:
+            product = product * value
+        return math.pow(product, 1.0/numvalues)
+    elif funcname == "median":
+        return _find_median(sortedvalues)
+    elif funcname == "mad":
+        median = _find_median(sortedvalues)
+        abs_devs = map(lambda v, median=median: abs(v - median), sortedvalues)
+        abs_devs.sort()
+        return _find_median(abs_devs)
+    elif funcname == "std_dev":
+        return math.sqrt(_find_variance(values))
+    elif funcname == "variance":
+        return _find_variance(values)
+    elif funcname == "sum":
+        return sum(values)
+    elif funcname == "minimum":
+        return sortedvalues[0]
+    elif funcname == "maximum":
+        return sortedvalues[-1]
+    elif funcname == "final":
+        return values[-1]
+    elif funcname == "only":
+        if sortedvalues[0] != sortedvalues[-1]:
+            raise ValueError, 'Attempted to log more than one value in a "THE" column'
+        return values[0]
+    elif funcname == "percentile":
+        # Linearly interpolate between order statistics, as the
+        # run-time library does.
+        if param == 100.0:
+            return sortedvalues[-1]
+        data_offset = (numvalues - 1)*param/100.0 + 1.0
+        floor_data_offset = int(math.floor(data_offset))
+        lower_value = sortedvalues[floor_data_offset - 1]
+        upper_value = sortedvalues[min(floor_data_offset, numvalues - 1)]
+        return lower_value + (data_offset - floor_data_offset)*(upper_value - lower_value)
+    raise ValueError, 'unknown aggregate function "%s"' % funcname
+
+
+def aggregate_logs(logs, aggregates):
+    """
+       Given LOGS as returned by read_logs (with tables) and a list
+       of aggregates as returned by parse_aggregates, return a list
+       of ncptl_logreader.NCPTL_LogTable objects.  Table N of the
+       result summarizes table N of every log file that has one: each
+       cell aggregates the corresponding cell of every such log file,
+       with a column for each aggregate of each input column.  Each
+       cell's values are sorted once, and every aggregate is computed
+       from that single pass over the data.
+    """
+    # Process the log files in order of increasing rank.
+    tablelists = map(lambda log: (int(log[0]), log[2]), logs)
+    tablelists.sort()
+    tablelists = map(lambda rt: rt[1], tablelists)
+    numtables = max([0] + map(len, tablelists))
+
+    # Aggregate each table in turn.
+    aggtables = []
+    for tablenum in range(numtables):
+        tables = filter(None, map(lambda tl, tablenum=tablenum:
+                                      tablenum < len(tl) and tl[tablenum],
+                                  tablelists))
+        first = tables[0]
+        for table in tables[1:]:
+            if table.descriptions != first.descriptions:
+                raise ValueError, "table %d has different columns in different log files" % (tablenum+1)
+        descriptions = []
+        headers = []
+        collengths = []
+        columns = []
+        for colnum in range(first.numcols):
+            numrows = max(map(lambda t, c=colnum: t.collengths[c], tables))
+            aggcolumns = map(lambda a: array("d"), aggregates)
+            for rownum in xrange(numrows):
+                values = []
+                for table in tables:
+                    if rownum < table.collengths[colnum]:
+                        values.append(float(table.columns[colnum][rownum]))
+                sortedvalues = values[:]
+                sortedvalues.sort()
+                for aggnum in range(len(aggregates)):
+                    funcname, param = aggregates[aggnum][1:]
+                    aggcolumns[aggnum].append(compute_aggregate(funcname, param,
+                                                                values, sortedvalues))
+            for aggnum in range(len(aggregates)):
+                descriptions.append("%s %s" % (first.descriptions[colnum],
+                                               first.aggregates[colnum]))
+                headers.append(aggregates[aggnum][0])
+                collengths.append(numrows)
+                columns.append(aggcolumns[aggnum])
+        aggtables.append(ncptl_logreader.NCPTL_LogTable(descriptions, headers,
+                                                        max([0] + collengths),
+                                                        collengths, columns))
+    return aggtables
+
+
+###########################################################################
+
+def usage(exitcode):
+    "Provide a usage message."
+    print "Usage: %s [--help] [--simplify ...] [--output=<file>] [--jobs=<count>] [--aggregate-file=<file>] [--aggregates=<function>,...] <log file>..." % progname
+    sys.exit(exitcode)
+
+
+def main():
+    "Merge the log files named on the command line."
+    outfilename = "-"
+    simplification = 0
+    jobs = None
+    aggfilename = None
+    aggnames = default_aggregates
+    try:
+        longopts = [
+            "usage",
+            "help",
+            "simplify",
+            "output=",
+            "jobs=",
+            "aggregate-file=",
+            "aggregates="]
+        opts, args = getopt.getopt(sys.argv[1:], "uhso:j:a:", longopts)
+    except getopt.error:
+        sys.stderr.write("%s: bad option\n" % progname)
+        sys.exit(1)
+    for opt, optarg in opts:
+        if opt in ("-u", "--usage", "-h", "--help"):
+            usage(0)
+        elif opt in ("-s", "--simplify"):
+            simplification = simplification + 1
+        elif opt in ("-o", "--output"):
+            outfilename = optarg
+        elif opt in ("-j", "--jobs"):
+            try:
+                jobs = int(optarg)
+                if jobs < 1:
+                    raise ValueError
+            except ValueError:
+                sys.stderr.write('%s: %s expects a positive integer but was given "%s"\n' %
+                                 (progname, opt, optarg))
+                sys.exit(1)
+        elif opt in ("-a", "--aggregate-file"):
+            aggfilename = optarg
+        elif opt == "--aggregates":
+            aggnames = optarg
+    if args == []:
+        sys.stderr.write("%s: Input files were not specified\n" % progname)
+        usage(1)
+
+    outfile = None
+    try:
+        aggregates = parse_aggregates(aggnames)
+        inputfiles = []
+        for name in args:
+            inputfiles.extend(file_of_files(name))
+        if inputfiles == []:
+            raise ValueError, 'no valid filenames were found in "%s"' % string.join(args)
+        logs = read_logs(inputfiles, simplification, aggfilename != None, jobs)
+
+        # Output the merged file.
+        if outfilename == "-":
+            outfile = sys.stdout
+        else:
+            outfile = open(outfilename, "w")
+        numlines = 0
+        for oneline in merge_logs(logs, simplification):
+            outfile.write(oneline + "\n")
+            numlines = numlines + 1
+        if numlines == 0:
+            outfile.write("\n")
+        if outfile != sys.stdout:
+            outfile.close()
+        outfile = None
+
+        # Output the cross-rank aggregates.
+        if aggfilename != None:
+            if aggfilename == "-":
+                aggfile = sys.stdout
+            else:
+                aggfile = open(aggfilename, "w")
+            aggdata = ncptl_logreader.NCPTL_LogFile()
+            aggdata.tables = aggregate_logs(logs, aggregates)
+            for oneline in ncptl_logreader.format_data(aggdata):
+                aggfile.write(oneline + "\n")
+            if aggfile != sys.stdout:
+                aggfile.close()
+    except (IOError, OSError, ValueError), errmsg:
+        if outfile not in (None, sys.stdout):
+            # Don't leave a partially merged file behind.
+            outfile.close()
+            os.unlink(outfilename)
+        sys.stderr.write("%s: %s\n" % (progname, errmsg))
+        sys.exit(1)
+
+
+# Merge log files when invoked as a program.
+if __name__ == '__main__':
+    main()
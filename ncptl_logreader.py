@@ -0,0 +1,561 @@
+########################################################################
+#
+# Stream-parsing reader for coNCePTuaL log files with a memory-mapped
+# columnar cache
+#
+# By Scott Pakin <pakin@lanl.gov>
+#
+# ----------------------------------------------------------------------
+#
+# 
+# Copyright (C) 2003, Triad National Security, LLC
+# All rights reserved.
+# 
+# Copyright (2003).  Triad National Security, LLC.  This software
+# was produced under U.S. Government contract 89233218CNA000001 for
+# Los Alamos National Laboratory (LANL), which is operated by Los
+# Alamos National Security, LLC (Triad) for the U.S. Department
+# of Energy. The U.S. Government has rights to use, reproduce,
+# and distribute this software.  NEITHER THE GOVERNMENT NOR TRIAD
+# MAKES ANY WARRANTY, EXPRESS OR IMPLIED, OR ASSUMES ANY LIABILITY
+# FOR THE USE OF THIS SOFTWARE. If software is modified to produce
+# derivative works, such modified software should be clearly marked,
+# so as not to confuse it with the version available from LANL.
+# 
+# Additionally, redistribution and use in source and binary forms,
+# with or without modification, are permitted provided that the
+# following conditions are met:
+# 
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+# 
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer
+#     in the documentation and/or other materials provided with the
+#     distribution.
+# 
+#   * Neither the name of Triad National Security, LLC, Los Alamos
+#     National Laboratory, the U.S. Government, nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY TRIAD AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL TRIAD OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY,
+# OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT
+# OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE
+# OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# 
+#
+########################################################################
+
+import sys
+import os
+import re
+import string
+import stat
+import struct
+import mmap
+import itertools
+from array import array
+from ncptl_cache import NCPTL_Cache
+try:
+    import cPickle
+    pickle = cPickle
+except ImportError:
+    import pickle
+try:
+    import numpy
+except ImportError:
+    # NumPy is optional.  Without it, columns are returned as arrays
+    # of doubles.
+    numpy = None
+
+
+# Magic string at the start of every columnar cache file
+_columns_magic = "NCPTLCOL"
+
+# Columnar cache-file format version; change this whenever the layout
+# or the pickled metadata changes
+_columns_version = 1
+
+# Layout of the fixed-size header that follows the magic string:
+# {format version, unused, length of the pickled metadata}.  All
+# numbers, including the column data, are little-endian.
+_columns_header_format = "<IIQ"
+
+# Number of significant digits the run-time library uses when writing
+# data values (log_data_digits in logfilefuncs.c)
+_log_data_digits = 10
+
+# Number of data rows to accumulate before converting them to numbers
+# in bulk
+_rows_per_chunk = 4096
+
+# Regular expressions used while parsing
+_key_value_re = re.compile(r'^# ([^:]+): (.*)$')
+_quoted_re = re.compile(r'"((?:[^"\\]|\\.)*)"')
+_backslash_re = re.compile(r'\\(.)')
+
+
+###########################################################################
+
+class NCPTL_LogTable:
+    """
+       A single table of data from a log file.  DESCRIPTIONS and
+       AGGREGATES are the two header rows (e.g., "Bytes" and
+       "(mean)").  Columns can be shorter than the table as a whole;
+       COLLENGTHS gives the number of values actually present in each
+       column, and the remaining cells read as NaN.
+    """
+
+    def __init__(self, descriptions, aggregates, numrows, collengths, columns):
+        "Wrap a list of columns, each an array of doubles or a NumPy array."
+        self.descriptions = descriptions
+        self.aggregates = aggregates
+        self.numrows = numrows
+        self.numcols = len(descriptions)
+        self.collengths = collengths
+        self.columns = columns
+
+    def column(self, colnum):
+        "Return a single column as a NumPy array or an array of doubles."
+        return self.columns[colnum]
+
+    def as_array(self):
+        """
+           Return the entire table as a 2-D NumPy array indexed by
+           {row, column}.  This requires NumPy.
+        """
+        if numpy == None:
+            raise ImportError, "NCPTL_LogTable.as_array requires NumPy"
+        if self.numcols == 0:
+            return numpy.zeros((self.numrows, 0))
+        return numpy.column_stack(self.columns)
+
+    def format_rows(self):
+        """
+           Yield each row of the table, headers included, formatted
+           the way the run-time library wrote it.
+        """
+        for header in [self.descriptions, self.aggregates]:
+            yield string.join(map(_quote, header), ",")
+        columns = self.columns
+        collengths = self.collengths
+        colrange = range(0, self.numcols)
+        if self.numcols == 0:
+            return
+
+        # Rows in which every column has a value can be formatted in
+        # one step.
+        fullrows = min(collengths)
+        rowformat = string.join(["%%.%dg" % _log_data_digits] * self.numcols, ",")
+        for rowvalues in itertools.islice(itertools.izip(*columns), fullrows):
+            yield rowformat % rowvalues
+
+        # Rows in which some columns have ended require more care.
+        for rownum in xrange(fullrows, self.numrows):
+            cells = []
+            for colnum in colrange:
+                if rownum < collengths[colnum]:
+                    cells.append("%.*g" % (_log_data_digits, columns[colnum][rownum]))
+                else:
+                    cells.append("")
+            yield string.join(cells, ",")
+
+
+###########################################################################
+
+class NCPTL_LogFile:
+    """
+       Parse a coNCePTuaL log file in a single pass without holding
+       all of its text in memory.  The result consists of the
+       prologue's key:value comments (PROLOGUE), environment
+       variables (ENVIRONMENT), and program source code (SOURCE); the
+       data tables (TABLES); the epilogue's key:value comments
+       (EPILOGUE) and remaining comment text (EPILOGUE_TEXT); and
+       every warning message in the file (WARNINGS).  Key:value lists
+       preserve the order in which they appear in the file.
+    """
+
+    def __init__(self, logfile=None):
+        "Parse a log file given a filename or an open file object."
+        self.prologue = []
+        self.environment = []
+        self.source = []
+        self.warnings = []
+        self.tables = []
+        self.epilogue = []
+        self.epilogue_text = []
+        if logfile == None:
+            # Let the caller fill in the fields (e.g., from a cache).
+            self.filename = None
+            return
+        if type(logfile) == type(""):
+            self.filename = logfile
+            logfile = open(logfile)
+            try:
+                self._parse(logfile)
+            finally:
+                logfile.close()
+        else:
+            self.filename = getattr(logfile, "name", "<log file>")
+            self._parse(logfile)
+
+    def lookup(self, key, default=None):
+        "Return the value of the first prologue or epilogue comment named KEY."
+        for somekey, value in self.prologue + self.epilogue:
+            if somekey == key:
+                return value
+        return default
+
+    def _parse(self, logfile):
+        "Read a log file line by line."
+        is_conceptual = 0
+        section = "prologue"      # "prologue", "environment", "source", "data", or "epilogue"
+        headers = []              # Header rows of the current table
+        rowdata = None            # All values of the current table in row-major order
+        numrows = 0               # Number of rows in the current table
+        collengths = []           # Number of rows up to each column's last value
+        pending = []              # Data rows not yet converted to numbers
+        for oneline in logfile:
+            # Handle the common case, a data row, as quickly as possible.
+            if rowdata != None and oneline[:1] not in '#"\r\n':
+                pending.append(oneline)
+                if len(pending) >= _rows_per_chunk:
+                    numrows = self._convert_rows(pending, numcols, rowdata, numrows, collengths)
+                    pending = []
+                continue
+            if pending:
+                numrows = self._convert_rows(pending, numcols, rowdata, numrows, collengths)
+                pending = []
+            oneline = string.rstrip(oneline, "\r\n")
+
+            # Handle comments.
+            if oneline[:1] == "#":
+                if rowdata != None:
+                    self._store_table(headers, rowdata, numrows, collengths)
+                    headers = []
+                    rowdata = None
+                if section == "data":
+                    section = "epilogue"
+                if oneline[:5] == "#####":
+                    continue
+                if oneline == "# coNCePTuaL log file":
+                    is_conceptual = 1
+                    continue
+                if oneline == "# Merged coNCePTuaL log file":
+                    raise ValueError, "%s is a merged log file; use ncptl-logunmerge to split it" % self.filename
+                if oneline[:6] == "# ----":
+                    continue
+                if section == "source":
+                    if oneline[:5] == "#    ":
+                        self.source.append(oneline[6:])
+                        continue
+                    section = "prologue"
+                if oneline == "#":
+                    if section == "environment":
+                        section = "prologue"
+                    continue
+                if section == "prologue" and oneline == "# Environment variables":
+                    section = "environment"
+                    continue
+                if section == "prologue" and oneline == "# coNCePTuaL source code":
+                    section = "source"
+                    continue
+                kvmatch = _key_value_re.match(oneline)
+                if kvmatch:
+                    key, value = kvmatch.groups()
+                    if key == "WARNING":
+                        self.warnings.append(value)
+                    elif section == "environment":
+                        self.environment.append((key, value))
+                    elif section == "epilogue":
+                        self.epilogue.append((key, value))
+                    else:
+                        self.prologue.append((key, value))
+                elif section == "epilogue":
+                    self.epilogue_text.append(string.strip(oneline[1:]))
+                continue
+
+            # Everything else is part of a data table.  A blank line or
+            # a header row ends the previous table, and the second
+            # header row begins a new one.
+            section = "data"
+            if rowdata != None:
+                self._store_table(headers, rowdata, numrows, collengths)
+                headers = []
+                rowdata = None
+            if oneline == "":
+                continue
+            if oneline[0] != '"':
+                raise ValueError, "%s contains a data table without two header rows" % self.filename
+            headers.append(map(lambda s: _backslash_re.sub(r"\1", s),
+                               _quoted_re.findall(oneline)))
+            if len(headers) == 2:
+                numcols = len(headers[0])
+                if len(headers[1]) != numcols:
+                    raise ValueError, "%s contains a table whose header rows differ in length" % self.filename
+                rowdata = array("d")
+                numrows = 0
+                collengths = [0] * numcols
+        if pending:
+            numrows = self._convert_rows(pending, numcols, rowdata, numrows, collengths)
+        if rowdata != None:
+            self._store_table(headers, rowdata, numrows, collengths)
+        if not is_conceptual:
+            raise ValueError, "%s does not look like it was produced by coNCePTuaL" % self.filename
+
+        # Strip leading and trailing blank lines from the source code.
+        while self.source and self.source[0] == "":
+            del self.source[0]
+        while self.source and self.source[-1] == "":
+            del self.source[-1]
+
+    def _convert_rows(self, rowlines, numcols, rowdata, numrows, collengths):
+        """
+           Append the values in a list of data-row lines to ROWDATA,
+           with NaNs for empty cells, and update COLLENGTHS.  Return
+           the new number of rows.  All of the rows are split and
+           converted at once because that is much faster than
+           handling them one at a time.
+        """
+        rows = string.split(string.replace(string.join(rowlines, ""), "\r", ""), "\n")
+        if rows[-1] == "":
+            del rows[-1]
+        commas = map(str.count, rows, [","]*len(rows))
+        if min(commas) != numcols - 1 or max(commas) != numcols - 1:
+            self._reject_rows(rows, numcols)
+        rowtext = string.join(rows, ",")
+        if ",," in rowtext or rowtext[:1] == "," or rowtext[-1:] == ",":
+            # Trailing cells of shorter columns are empty.  A column's
+            # length is the number of rows up to its last value.
+            cells = string.split(rowtext, ",")
+            for colnum in range(0, numcols):
+                coltext = string.rstrip(string.join(cells[colnum::numcols], ","), ",")
+                if coltext != "":
+                    collengths[colnum] = numrows + string.count(coltext, ",") + 1
+            # Replacing ",," twice fills every run of empty cells.
+            rowtext = string.replace(rowtext, ",,", ",nan,")
+            rowtext = string.replace(rowtext, ",,", ",nan,")
+            if rowtext[:1] == ",":
+                rowtext = "nan" + rowtext
+            if rowtext[-1:] == ",":
+                rowtext = rowtext + "nan"
+        else:
+            collengths[:] = [numrows + len(rows)] * numcols
+        try:
+            rowdata.fromlist(map(float, string.split(rowtext, ",")))
+        except ValueError:
+            self._reject_rows(rows, numcols)
+        return numrows + len(rows)
+
+    def _reject_rows(self, rows, numcols):
+        "Complain about the first malformed or invalid row in a list of rows."
+        for oneline in rows:
+            cells = string.split(oneline, ",")
+            if len(cells) != numcols:
+                raise ValueError, 'malformed data row "%s" in %s' % (oneline, self.filename)
+            try:
+                map(float, filter(None, cells))
+            except ValueError:
+                raise ValueError, 'invalid data row "%s" in %s' % (oneline, self.filename)
+        raise ValueError, "invalid data in %s" % self.filename
+
+    def _store_table(self, headers, rowdata, numrows, collengths):
+        "Split a row-major array into columns and store the resulting table."
+        numcols = len(headers[0])
+        if numpy != None:
+            matrix = numpy.frombuffer(rowdata, dtype=numpy.float64).reshape(numrows, numcols)
+            columns = map(lambda c, matrix=matrix: matrix[:, c].copy(), range(0, numcols))
+        else:
+            columns = map(lambda c, rowdata=rowdata, numcols=numcols: rowdata[c::numcols],
+                          range(0, numcols))
+        self.tables.append(NCPTL_LogTable(headers[0], headers[1], numrows,
+                                          collengths, columns))
+
+    def write_columns(self, colfilename, signature=None):
+        """
+           Write the log file's contents to a columnar cache file.
+           SIGNATURE is stored alongside the data and returned by
+           read_columns so the caller can validate the cache.
+        """
+        # Determine where each table's data will go.
+        tablemeta = []
+        datasize = 0L
+        for table in self.tables:
+            tablemeta.append((table.descriptions, table.aggregates, table.numrows,
+                              table.collengths, datasize))
+            datasize = datasize + 8L*table.numrows*table.numcols
+        metadata = pickle.dumps({"signature"     : signature,
+                                 "filename"      : self.filename,
+                                 "prologue"      : self.prologue,
+                                 "environment"   : self.environment,
+                                 "source"        : self.source,
+                                 "warnings"      : self.warnings,
+                                 "epilogue"      : self.epilogue,
+                                 "epilogue_text" : self.epilogue_text,
+                                 "tables"        : tablemeta},
+                                2)
+        headerlen = len(_columns_magic) + struct.calcsize(_columns_header_format) + len(metadata)
+        padding = "\0" * (-headerlen % 8)
+
+        # Write the header, the metadata, and then every column of
+        # every table as little-endian doubles.
+        colfile = open(colfilename, "wb")
+        try:
+            colfile.write(_columns_magic)
+            colfile.write(struct.pack(_columns_header_format, _columns_version, 0, len(metadata)))
+            colfile.write(metadata)
+            colfile.write(padding)
+            for table in self.tables:
+                for column in table.columns:
+                    if numpy != None:
+                        colfile.write(numpy.asarray(column, dtype="<f8").tostring())
+                    else:
+                        column = array("d", column)
+                        if sys.byteorder != "little":
+                            column.byteswap()
+                        colfile.write(column.tostring())
+        finally:
+            colfile.close()
+
+
+###########################################################################
+
+def _quote(text):
+    "Quote a header string the way the run-time library does."
+    return '"%s"' % string.replace(string.replace(text, "\\", "\\\\"), '"', '\\"')
+
+
+def read_columns(colfilename):
+    """
+       Map a columnar cache file into memory and return a {log file,
+       signature} tuple.  With NumPy, each column is a read-only view
+       of the mapped file; without NumPy, columns are copied into
+       arrays of doubles when the file is read.
+    """
+    colfile = open(colfilename, "rb")
+    try:
+        if colfile.read(len(_columns_magic)) != _columns_magic:
+            raise ValueError, "%s is not a coNCePTuaL columnar cache file" % colfilename
+        headerbytes = colfile.read(struct.calcsize(_columns_header_format))
+        try:
+            version, unused, metalen = struct.unpack(_columns_header_format, headerbytes)
+        except struct.error:
+            raise ValueError, "%s has a truncated header" % colfilename
+        if version != _columns_version:
+            raise ValueError, "%s uses an unsupported columnar-cache format" % colfilename
+        metadata = pickle.loads(colfile.read(metalen))
+        headerlen = len(_columns_magic) + len(headerbytes) + metalen
+        database = headerlen + (-headerlen % 8)
+        mapping = mmap.mmap(colfile.fileno(), 0, access=mmap.ACCESS_READ)
+    finally:
+        colfile.close()
+
+    # Reconstruct the log file from the metadata and the mapped data.
+    logfile = NCPTL_LogFile()
+    for field in ["filename", "prologue", "environment", "source",
+                  "warnings", "epilogue", "epilogue_text"]:
+        setattr(logfile, field, metadata[field])
+    for descriptions, aggregates, numrows, collengths, offset in metadata["tables"]:
+        columns = []
+        offset = offset + database
+        for colnum in range(0, len(descriptions)):
+            if offset + 8*numrows > len(mapping):
+                raise ValueError, "%s is truncated" % colfilename
+            if numpy != None:
+                column = numpy.frombuffer(mapping, dtype="<f8", count=numrows, offset=offset)
+            else:
+                column = array("d", mapping[offset:offset + 8*numrows])
+                if sys.byteorder != "little":
+                    column.byteswap()
+            columns.append(column)
+            offset = offset + 8*numrows
+        logfile.tables.append(NCPTL_LogTable(descriptions, aggregates, numrows,
+                                             collengths, columns))
+    return (logfile, metadata["signature"])
+
+
+def load_log(logfilename, use_cache=1, cache=None):
+    """
+       Return an NCPTL_LogFile for a given log file.  If USE_CACHE is
+       true, the log file's contents are read from a columnar cache
+       file in the coNCePTuaL cache directory (CACHE or, by default,
+       a new NCPTL_Cache) when one exists and is up to date;
+       otherwise, the log file is parsed and (if possible) the cache
+       file is written for next time.
+    """
+    if not use_cache:
+        return NCPTL_LogFile(logfilename)
+    if cache == None:
+        cache = NCPTL_Cache()
+    statinfo = os.stat(logfilename)
+    signature = (os.path.abspath(logfilename),
+                 statinfo[stat.ST_SIZE], statinfo[stat.ST_MTIME])
+    colfilename = cache.mapped_file_name(cache.make_build_key(["log"] + map(str, signature)))
+    if colfilename == None:
+        return NCPTL_LogFile(logfilename)
+    try:
+        logfile, cachesig = read_columns(colfilename)
+        if cachesig == signature:
+            logfile.filename = logfilename
+            try:
+                os.utime(colfilename, None)
+            except OSError:
+                pass
+            return logfile
+    except:
+        # Any problem with the cache file means we reparse.
+        pass
+    logfile = NCPTL_LogFile(logfilename)
+    tempname = "%s.%d.tmp" % (colfilename, os.getpid())
+    try:
+        logfile.write_columns(tempname, signature)
+        os.rename(tempname, colfilename)
+    except (IOError, OSError):
+        try:
+            os.remove(tempname)
+        except OSError:
+            pass
+        return logfile
+    cache.evict()
+    return logfile
+
+
+def format_data(logfile):
+    """
+       Yield the lines of every data table in LOGFILE in the same
+       format as "ncptl-logextract --extract=data".
+    """
+    first = 1
+    for table in logfile.tables:
+        if not first:
+            yield ""
+        first = 0
+        for oneline in table.format_rows():
+            yield oneline
+
+
+# Output the data tables from one or more log files.
+if __name__ == '__main__':
+    use_cache = 1
+    filenames = sys.argv[1:]
+    if filenames and filenames[0] == "--no-cache":
+        use_cache = 0
+        filenames = filenames[1:]
+    if filenames == []:
+        sys.stderr.write("Usage: %s [--no-cache] <file.log>...\n" % sys.argv[0])
+        sys.exit(2)
+    for filename in filenames:
+        try:
+            for oneline in format_data(load_log(filename, use_cache)):
+                sys.stdout.write(oneline + "\n")
+        except (IOError, OSError, ValueError), errmsg:
+            sys.stderr.write("%s: %s\n" % (sys.argv[0], errmsg))
+            sys.exit(1)
@@ -76,6 +76,9 @@ except ImportError:
 # Define the name of the parse table to generate.
 _tabmodule = "ncptl_parse_table"
 
+# Map each start symbol to the first parser built for it.
+_parser_templates = {}
+
 class NCPTL_Parser:
     language_version = "1.5"
 
@@ -114,33 +117,71 @@ class NCPTL_Parser:
         self.tokenlist = tokenlist
         self.tokidx = 0
         self.errmsg = NCPTL_Error(filesource)
-        if not write_tables:
-            # Suppress "yacc: Symbol '...' is unreachable" messages.
-            orig_stderr = sys.stderr
-            try:
-                sys.stderr = open(ncptl_config["NULL_DEVICE_NAME"][1:-1], "w")
-            except (IOError, AccessControlException):
-                # We were built under one operating system but are
-                # running under a different operating system.  (We
-                # might be running as a Java program.)  Alternatively,
-                # we might be running in a sandbox with limited file
-                # access.
-                pass
         try:
             parser = self.parser_list[start]
         except KeyError:
-            parser = yacc.yacc(module=self, start=start,
-                               debug=0, tabmodule=_tabmodule,
-                               write_tables=write_tables,
-                               outputdir=os.path.dirname(__import__(self.__module__).__file__))
+            parser = self._make_parser(start, write_tables)
             self.parser_list[start] = parser
-        if not write_tables:
-            # Restore the stderr filehandle.
-            if sys.stderr != orig_stderr:
-                sys.stderr.close()
-                sys.stderr = orig_stderr
         return parser.parse(lexer=self)
 
+    def parse_many(self, sources, start="program"):
+        """
+             Lex and parse each (source code, file source) pair in a
+             list and return a list of the corresponding ASTs.
+        """
+        astlist = []
+        for sourcecode, filesource in sources:
+            tokenlist = self.lexer.tokenize(sourcecode, filesource=filesource)
+            astlist.append(self.parsetokens(tokenlist, filesource=filesource, start=start))
+        return astlist
+
+    def _make_parser(self, start, write_tables=0):
+        """
+             Return a parser for a given start symbol whose grammar
+             rules invoke our methods.  Because yacc.yacc() is
+             expensive, we invoke it only once per start symbol and
+             bind a copy of the result to each NCPTL_Parser object.
+        """
+        if write_tables or not _parser_templates.has_key(start):
+            if not write_tables:
+                # Suppress "yacc: Symbol '...' is unreachable" messages.
+                orig_stderr = sys.stderr
+                try:
+                    sys.stderr = open(ncptl_config["NULL_DEVICE_NAME"][1:-1], "w")
+                except (IOError, AccessControlException):
+                    # We were built under one operating system but are
+                    # running under a different operating system.  (We
+                    # might be running as a Java program.)  Alternatively,
+                    # we might be running in a sandbox with limited file
+                    # access.
+                    pass
+            template = yacc.yacc(module=self, start=start,
+                                 debug=0, tabmodule=_tabmodule,
+                                 write_tables=write_tables,
+                                 outputdir=os.path.dirname(__import__(self.__module__).__file__))
+            if not write_tables:
+                # Restore the stderr filehandle.
+                if sys.stderr != orig_stderr:
+                    sys.stderr.close()
+                    sys.stderr = orig_stderr
+            _parser_templates[start] = template
+        template = _parser_templates[start]
+        if template.errorfunc == self.p_error:
+            return template
+
+        # Share the template's parse tables but rebind its
+        # grammar-rule and error methods to ourself.
+        parser = copy.copy(template)
+        parser.productions = []
+        for production in template.productions:
+            if getattr(production, "func", None) != None:
+                production = copy.copy(production)
+                production.func = getattr(self, production.func.__name__)
+            parser.productions.append(production)
+        if template.errorfunc != None:
+            parser.errorfunc = getattr(self, template.errorfunc.__name__)
+        return parser
+
     def p_error(self, lextoken):
         try:
             token = self._lextoken2token(lextoken)
@@ -66,6 +66,11 @@ from ncptl_parser import NCPTL_Parser
 class NCPTL_Semantic:
     "Analyze the semantics of a coNCePTuaL program."
 
+    # Run compatible passes concurrently in a single walk of the AST.
+    # Setting this to 0 makes each pass walk the AST on its own, which
+    # is useful only for debugging and benchmarking.
+    fuse_passes = 1
+
     def analyze(self, ast, filesource='<stdin>', lenient=0):
         "Search an AST for forbidden constructs."
         self.errmsg = NCPTL_Error(filesource)
@@ -79,65 +84,92 @@ class NCPTL_Semantic:
             self.lexer = NCPTL_Lexer()
             self.parser = NCPTL_Parser(self.lexer)
 
-        # Initialize the AST.
-        _Initialize_AST(ast, self)
-
-        # Provide proper line numbers and printable text for all nodes.
-        _Propagate_Line_Numbers_Up(ast)
-        _Propagate_Line_Numbers_Down(ast)
-        _Propagate_Printables_Up(ast)
-
-        # Delete all empty subtrees.
-        _Propagate_Emptiness_Up(ast)
-        _Elide_Empty_Subtrees(ast)
-
-        # Ensure that all variables are being used properly.
-        _Identify_Definitions(ast)
-        _Propagate_Scopes_Down_And_Across(ast)
-        _Check_Receive_Ambiguity(ast)
-        _Check_Use_Without_Def(ast)
-        _Mark_Defs_Used(ast)
-        _Check_Def_Without_Use(ast)
-        _Check_Let_Bound_Variables(ast)
-
-        # Facilitate code generation for list comprehensions.
-        _Propagate_List_Comp_Exprs(ast)
-
-        # Ensure that command-line options are properly specified.
-        _Check_Command_Line_Options(ast)
-
-        # Ensure that message attributes are being used properly.
-        _Check_Message_Attributes(ast)
-
-        # Ensure that random variables aren't used where they don't belong.
-        _Check_Random_Variables(ast)
-
-        # Ensure that task expressions and the reduce statement aren't
-        # being used incorrectly.
-        _Check_Task_Expressions(ast)
-        _Check_My_Task(ast)
-        _Check_Reduce_Usage(ast)
-
-        # Identify which nodes have constant values across evaluations.
-        _Identify_Constant_Nodes(ast)
-
-        # Mark nodes that contain PROCESSOR_OF or TASK_OF beneath them.
-        _Find_ProcMap_Usage(ast)
-
-        # Hide from code generators the fact that aggregate functions
-        # can be combined into a list.
-        _Split_Aggregate_Func_Lists(ast)
+        # Define all of the analysis passes in the order in which they
+        # must appear to run.  _run_passes fuses consecutive passes
+        # into a single AST traversal except where a pass's
+        # depends_on or ends_traversal attribute says otherwise.
+        passlist = [
+            # Initialize the AST.
+            _Initialize_AST(semobj=self),
+
+            # Provide proper line numbers and printable text for all nodes.
+            _Propagate_Line_Numbers_Up(),
+            _Propagate_Line_Numbers_Down(),
+            _Propagate_Printables_Up(),
+
+            # Delete all empty subtrees.
+            _Propagate_Emptiness_Up(),
+            _Elide_Empty_Subtrees(),
+
+            # Ensure that all variables are being used properly.
+            _Identify_Definitions(),
+            _Propagate_Scopes_Down_And_Across(),
+            _Check_Receive_Ambiguity(),
+            _Check_Use_Without_Def(),
+            _Mark_Defs_Used(),
+            _Check_Def_Without_Use(),
+            _Check_Let_Bound_Variables(),
+
+            # Facilitate code generation for list comprehensions.
+            _Propagate_List_Comp_Exprs(),
+
+            # Ensure that command-line options are properly specified.
+            _Check_Command_Line_Options(),
+
+            # Ensure that message attributes are being used properly.
+            _Check_Message_Attributes(),
+
+            # Ensure that random variables aren't used where they don't belong.
+            _Check_Random_Variables(),
+
+            # Ensure that task expressions and the reduce statement aren't
+            # being used incorrectly.
+            _Check_Task_Expressions(),
+            _Check_My_Task(),
+            _Check_Reduce_Usage(),
+
+            # Identify which nodes have constant values across evaluations.
+            _Identify_Constant_Nodes(),
+
+            # Mark nodes that contain PROCESSOR_OF or TASK_OF beneath them.
+            _Find_ProcMap_Usage(),
+
+            # Hide from code generators the fact that aggregate functions
+            # can be combined into a list.
+            _Split_Aggregate_Func_Lists()]
+        _run_passes(ast, passlist, self.fuse_passes)
 
         # Return the modified AST.
         return ast
 
 
 class _AST_Traversal:
-    "Traverse an AST, invoking preorder and postorder methods as we go."
-
-    def __init__(self, ast):
-        "Begin the AST traversal."
-        self.traverse(ast)
+    """
+    Traverse an AST, invoking preorder and postorder methods as we go.
+    A subclass declares the node types it cares about by defining
+    pre_<type> and post_<type> methods (or pre_any and post_any for
+    all types).
+    """
+
+    # List the passes whose traversal must complete before this pass's
+    # traversal can begin.  A pass needs to be listed only if this
+    # pass reads, at some node, information the other pass produces
+    # at a node that is not an ancestor or a preorder predecessor.
+    depends_on = []
+
+    # Passes that graft new subtrees onto the AST in a postorder
+    # method must be the last pass of their traversal so that all
+    # subsequent passes see the new nodes.
+    ends_traversal = 0
+
+    def __init__(self, ast=None):
+        "Begin the AST traversal unless we're going to be fused with other passes."
+        if ast != None:
+            self.traverse(ast)
+
+    def prepare(self, ast):
+        "Perform any per-pass initialization before traversing an AST."
+        pass
 
     def traverse(self, node):
         """
@@ -146,20 +178,111 @@ class _AST_Traversal:
         the AST node's postorder method and the generic postorder
         method.
         """
-        do_nothing = lambda node: None
-        getattr(self, "pre_" + node.type, do_nothing)(node)
-        getattr(self, "pre_any", do_nothing)(node)
-        for kid in node.kids:
-            self.traverse(kid)
-        getattr(self, "post_" + node.type, do_nothing)(node)
-        getattr(self, "post_any", do_nothing)(node)
+        _Fused_Traversal(node, [self])
+
+
+# Map each _AST_Traversal subclass to the names of its pre_* and
+# post_* methods.
+_dispatch_tables = {}
+
+def _dispatch_table(passclass):
+    "Return a dictionary of the pre_* and post_* methods a class defines."
+    try:
+        return _dispatch_tables[passclass]
+    except KeyError:
+        methods = {}
+        for name in dir(passclass):
+            if name[:4] == "pre_" or name[:5] == "post_":
+                methods[name] = 1
+        _dispatch_tables[passclass] = methods
+        return methods
+
+
+class _Fused_Traversal:
+    """
+    Walk an AST once, invoking the preorder and postorder methods of
+    each of a list of passes in turn.  Each node sees the same
+    sequence of method calls per pass as it would if every pass
+    traversed the AST on its own.  The traversal uses an explicit
+    stack so that deeply nested programs can't exceed Python's
+    recursion limit.
+    """
+
+    def __init__(self, ast, passlist):
+        "Prepare each pass then traverse the AST."
+        self.passlist = passlist
+        self.callbacks = {}
+        for apass in passlist:
+            apass.prepare(ast)
+        self.traverse(ast)
+
+    def node_callbacks(self, nodetype):
+        "Return lists of preorder and postorder methods to invoke on a given node type."
+        preorder = []
+        postorder = []
+        for apass in self.passlist:
+            methods = _dispatch_table(apass.__class__)
+            for prefix, callbacks in [("pre_", preorder), ("post_", postorder)]:
+                for name in [prefix + nodetype, prefix + "any"]:
+                    if methods.has_key(name):
+                        callbacks.append(getattr(apass, name))
+        self.callbacks[nodetype] = (preorder, postorder)
+        return (preorder, postorder)
+
+    def traverse(self, ast):
+        "Traverse an AST iteratively in depth-first order."
+        callbacks = self.callbacks
+        stack = [(ast, None)]
+        while stack:
+            node, postorder = stack.pop()
+            if postorder != None:
+                for method in postorder:
+                    method(node)
+                continue
+            try:
+                preorder, postorder = callbacks[node.type]
+            except KeyError:
+                preorder, postorder = self.node_callbacks(node.type)
+            for method in preorder:
+                method(node)
+            stack.append((node, postorder))
+            kids = node.kids
+            for kidnum in xrange(len(kids)-1, -1, -1):
+                stack.append((kids[kidnum], None))
+
+
+def _run_passes(ast, passlist, fuse=1):
+    """
+    Partition a list of passes into groups that can share a traversal
+    then traverse the AST once per group.
+    """
+    grouplist = []
+    group = []
+    for apass in passlist:
+        if fuse:
+            for prevpass in group:
+                if prevpass.__class__ in apass.depends_on:
+                    grouplist.append(group)
+                    group = []
+                    break
+        elif group != []:
+            grouplist.append(group)
+            group = []
+        group.append(apass)
+        if apass.ends_traversal:
+            grouplist.append(group)
+            group = []
+    if group != []:
+        grouplist.append(group)
+    for group in grouplist:
+        _Fused_Traversal(ast, group)
 
 ###########################################################################
 
 class _Initialize_AST(_AST_Traversal):
     "Prepare each AST node for semantic analysis."
 
-    def __init__(self, ast, semobj):
+    def __init__(self, ast=None, semobj=None):
         "Store a reference to the semantic-analysis object."
         self.semobj = semobj
         _AST_Traversal.__init__(self, ast)
@@ -188,6 +311,8 @@ class _Propagate_Line_Numbers_Up(_AST_Traversal):
 class _Propagate_Line_Numbers_Down(_AST_Traversal):
     "Copy line numbers from parents to children."
 
+    depends_on = [_Propagate_Line_Numbers_Up]
+
     def pre_any(self, node):
         "Ensure that all children have valid line numbers."
 
@@ -292,6 +417,8 @@ class _Propagate_Emptiness_Up(_AST_Traversal):
 class _Elide_Empty_Subtrees(_AST_Traversal):
     "Remove the children of empty nodes from the AST."
 
+    depends_on = [_Propagate_Emptiness_Up]
+
     def pre_simple_stmt_list(self, node):
         "Prune empty statements from lists of THEN-separate statements."
         newkids = filter(lambda k: not k.sem["is_empty"], node.kids)
@@ -589,6 +716,9 @@ class _Check_Receive_Ambiguity(_AST_Traversal):
 class _Check_Use_Without_Def(_AST_Traversal):
     "Abort if we encounter an undefined variable."
 
+    # Receive statements can widen the scope of nodes that precede them.
+    depends_on = [_Check_Receive_Ambiguity]
+
     def pre_ident(self, node):
         "Abort if we're not in our own scope."
         if node.sem["varscope"].has_key(node.attr):
@@ -612,6 +742,8 @@ class _Check_Use_Without_Def(_AST_Traversal):
 class _Mark_Defs_Used(_AST_Traversal):
     "Mark every used definition as such."
 
+    depends_on = [_Check_Receive_Ambiguity]
+
     def pre_task_expr(self, node):
         """
               Mark our child ident and our child ident's definition
@@ -641,6 +773,9 @@ class _Mark_Defs_Used(_AST_Traversal):
 class _Check_Def_Without_Use(_AST_Traversal):
     "Issue a warning message if a variable is defined but never used."
 
+    # A definition's uses generally follow the definition.
+    depends_on = [_Mark_Defs_Used]
+
     def post_ident(self, node):
         "Complain if we're an unused definition."
         if node.sem.has_key("definition") and not node.sem.has_key("use"):
@@ -687,12 +822,17 @@ class _Check_Let_Bound_Variables(_AST_Traversal):
 class _Check_Command_Line_Options(_AST_Traversal):
     "Ensure that command-line arguments are used properly."
 
-    def __init__(self, ast):
+    # We need the complete list of undeclared variables and of the
+    # predefined variables used within each default-value expression.
+    # We also inject new param_decl nodes that later passes must see.
+    depends_on = [_Check_Use_Without_Def, _Check_Let_Bound_Variables]
+    ends_traversal = 1
+
+    def prepare(self, ast):
         "Define a set of parameter maps for use by the other methods."
         ast.sem["semobj"].parameter_maps = {"ident":     {},
                                             "longname":  {},
                                             "shortname": {}}
-        _AST_Traversal.__init__(self, ast)
 
     def pre_param_decl(self, node):
         "Perform various checks on parameter declarations."
@@ -1108,10 +1248,9 @@ class _Propagate_List_Comp_Exprs(_AST_Traversal):
     """Point the most deeply nested list comprehension node to
     the expression it should operate upon."""
 
-    def __init__(self, ast):
+    def prepare(self, ast):
         "Maintain a stack of list-comprehension expressions."
         self.expr_stack = []
-        _AST_Traversal.__init__(self, ast)
 
     def pre_range(self, node):
         if node.attr == "list_comp":
@@ -1133,7 +1272,7 @@ class _Propagate_List_Comp_Exprs(_AST_Traversal):
 class _Identify_Constant_Nodes(_AST_Traversal):
     "Designate nodes that don't change their value from evaluation to evaluation."
 
-    def __init__(self, ast):
+    def prepare(self, ast):
         "Categorize the nodes we expect to see."
         # Define a list of nodes that are always constant.
         nodelist = ["integer", "string", "an", "data_multiplier",
@@ -1142,9 +1281,6 @@ class _Identify_Constant_Nodes(_AST_Traversal):
                     "aggregate_func"]
         ast.sem["semobj"].always_const = dict([(ntype, 1) for ntype in nodelist])
 
-        # Mark each node as either constant or not constant.
-        _AST_Traversal.__init__(self, ast)
-
     def post_ident(self, node):
         "Handle identifiers, which are constant if and only if they represent a definition."
         if node.attr == "num_tasks":
@@ -0,0 +1,183 @@
+########################################################################
+#
+# Reader for binary trace files produced by the c_trace backend's
+# --trace-format=binary option
+#
+# By Scott Pakin <pakin@lanl.gov>
+#
+# ----------------------------------------------------------------------
+#
+# 
+# Copyright (C) 2003, Triad National Security, LLC
+# All rights reserved.
+# 
+# Copyright (2003).  Triad National Security, LLC.  This software
+# was produced under U.S. Government contract 89233218CNA000001 for
+# Los Alamos National Laboratory (LANL), which is operated by Los
+# Alamos National Security, LLC (Triad) for the U.S. Department
+# of Energy. The U.S. Government has rights to use, reproduce,
+# and distribute this software.  NEITHER THE GOVERNMENT NOR TRIAD
+# MAKES ANY WARRANTY, EXPRESS OR IMPLIED, OR ASSUMES ANY LIABILITY
+# FOR THE USE OF THIS SOFTWARE. If software is modified to produce
+# derivative works, such modified software should be clearly marked,
+# so as not to confuse it with the version available from LANL.
+# 
+# Additionally, redistribution and use in source and binary forms,
+# with or without modification, are permitted provided that the
+# following conditions are met:
+# 
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+# 
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer
+#     in the documentation and/or other materials provided with the
+#     distribution.
+# 
+#   * Neither the name of Triad National Security, LLC, Los Alamos
+#     National Laboratory, the U.S. Government, nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY TRIAD AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL TRIAD OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY,
+# OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT
+# OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE
+# OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# 
+#
+########################################################################
+
+import sys
+import string
+import struct
+
+
+# Magic string at the start of every binary trace file
+_trace_magic = "NCPTLTRC"
+
+# Trace-file format version we know how to read
+_trace_version = 1
+
+# Layout of the fixed-size header that follows the magic string and of
+# each trace record (without a byte-order prefix)
+_header_format = "IIqqi"
+_record_format = "Qqiiii"
+
+# Number of records to read from the file at a time
+_records_per_read = 4096
+
+
+###########################################################################
+
+class NCPTL_TraceFile:
+    """
+       Decode a binary trace file written by a program compiled with
+       the c_trace backend and --trace-format=binary.  The file
+       contains a header (a magic string, a format version, the size
+       of each record, the writer's physical rank and number of
+       events, and the names of all event types) followed by a
+       sequence of fixed-size records, all in the writer's native
+       byte order.  Each record is decoded into the same fields the
+       text format provides plus a timestamp.
+    """
+
+    def __init__(self, tracefile):
+        "Read the header from a filename or an open file object."
+        if type(tracefile) == type(""):
+            self.filename = tracefile
+            self.tracefile = open(tracefile, "rb")
+        else:
+            self.filename = getattr(tracefile, "name", "<trace>")
+            self.tracefile = tracefile
+        if self.tracefile.read(len(_trace_magic)) != _trace_magic:
+            raise ValueError, "%s is not a coNCePTuaL binary trace file" % self.filename
+
+        # Determine the writer's byte order from the version number.
+        headerbytes = self.tracefile.read(struct.calcsize("<" + _header_format))
+        for byteorder in ["<", ">"]:
+            try:
+                version, recordsize, physrank, numevents, numevtypes = \
+                    struct.unpack(byteorder + _header_format, headerbytes)
+            except struct.error:
+                raise ValueError, "%s has a truncated header" % self.filename
+            if version == _trace_version:
+                break
+        else:
+            raise ValueError, "%s uses an unsupported trace-file format" % self.filename
+        if recordsize != struct.calcsize(byteorder + _record_format):
+            raise ValueError, "%s contains %d-byte records; expected %d-byte records" % \
+                  (self.filename, recordsize, struct.calcsize(byteorder + _record_format))
+        self.byteorder = byteorder
+        self.recordsize = recordsize
+        self.physrank = int(physrank)
+        self.numevents = numevents
+
+        # Read the NUL-terminated event names.
+        self.eventnames = []
+        while len(self.eventnames) < numevtypes:
+            onename = []
+            while 1:
+                onechar = self.tracefile.read(1)
+                if onechar in ["", "\0"]:
+                    break
+                onename.append(onechar)
+            if onechar == "":
+                raise ValueError, "%s has a truncated header" % self.filename
+            self.eventnames.append(string.join(onename, ""))
+
+    def records(self):
+        """
+           Yield one {physrank, virtrank, action, eventnum, numevents,
+           firstline, lastline, timestamp} tuple per trace record.
+        """
+        recformat = self.byteorder + _record_format
+        recordsize = self.recordsize
+        physrank = self.physrank
+        numevents = self.numevents
+        eventnames = self.eventnames
+        while 1:
+            chunk = self.tracefile.read(recordsize * _records_per_read)
+            if len(chunk) < recordsize:
+                break
+            for offset in xrange(0, len(chunk) - recordsize + 1, recordsize):
+                timestamp, eventnum, virtrank, evtype, firstline, lastline = \
+                    struct.unpack(recformat, chunk[offset:offset+recordsize])
+                try:
+                    action = eventnames[evtype]
+                except IndexError:
+                    action = str(evtype)
+                yield (physrank, virtrank, action, eventnum, numevents,
+                       firstline, lastline, timestamp)
+
+    def close(self):
+        "Close the underlying file."
+        self.tracefile.close()
+
+
+def format_text_record(record):
+    "Format a decoded trace record the way the text trace format does."
+    return "[TRACE] phys: %d | virt: %d | action: %s | event: %d / %d | lines: %d - %d" % \
+           record[:7]
+
+
+# Convert one or more binary trace files to the text trace format.
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        sys.stderr.write("Usage: %s <file.trace>...\n" % sys.argv[0])
+        sys.exit(2)
+    for filename in sys.argv[1:]:
+        try:
+            trace = NCPTL_TraceFile(filename)
+            for record in trace.records():
+                sys.stdout.write(format_text_record(record) + "\n")
+            trace.close()
+        except (IOError, ValueError), errmsg:
+            sys.stderr.write("%s: %s\n" % (sys.argv[0], errmsg))
+            sys.exit(1)
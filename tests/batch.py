@@ -0,0 +1,241 @@
+#! /usr/bin/env python
+
+########################################################################
+#
+# Ensure that ncptl --batch and --serve report every job's output and
+# exit status, even for jobs that die without returning to Python
+#
+# By Scott Pakin <pakin@lanl.gov>
+#
+# ----------------------------------------------------------------------
+# 
+# Copyright (C) 2003, Triad National Security, LLC
+# All rights reserved.
+# 
+# Copyright (2003).  Triad National Security, LLC.  This software
+# was produced under U.S. Government contract 89233218CNA000001 for
+# Los Alamos National Laboratory (LANL), which is operated by Los
+# Alamos National Security, LLC (Triad) for the U.S. Department
+# of Energy. The U.S. Government has rights to use, reproduce,
+# and distribute this software.  NEITHER THE GOVERNMENT NOR TRIAD
+# MAKES ANY WARRANTY, EXPRESS OR IMPLIED, OR ASSUMES ANY LIABILITY
+# FOR THE USE OF THIS SOFTWARE. If software is modified to produce
+# derivative works, such modified software should be clearly marked,
+# so as not to confuse it with the version available from LANL.
+# 
+# Additionally, redistribution and use in source and binary forms,
+# with or without modification, are permitted provided that the
+# following conditions are met:
+# 
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+# 
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer
+#     in the documentation and/or other materials provided with the
+#     distribution.
+# 
+#   * Neither the name of Triad National Security, LLC, Los Alamos
+#     National Laboratory, the U.S. Government, nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY TRIAD AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL TRIAD OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY,
+# OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT
+# OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE
+# OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# 
+#
+########################################################################
+
+import sys
+import os
+import string
+import re
+import time
+import signal
+import tempfile
+import shutil
+import threading
+import socket
+import select
+
+# Define some global variables
+progname = os.path.basename(sys.argv[0]) # This program's name
+srcdir = os.path.dirname(os.path.dirname(os.path.abspath(sys.argv[0])))
+ncptl = os.path.join(srcdir, "ncptl.py") # coNCePTuaL compiler front end
+sys.path.insert(1, srcdir)
+from ncptl_batch import NCPTL_Batch, submit_job
+
+# Lines that legitimately differ from one ncptl run to the next
+volatile_re = re.compile(r'generated by coNCePTuaL on|--seed')
+
+def fail(message):
+    "Report a failed test and exit."
+    sys.stderr.write("%s: %s\n" % (progname, message))
+    sys.exit(1)
+
+def fake_compile(argv):
+    """
+         Stand in for ncptl's compile_program().  The first argument
+         says how the job should end.  Output is written directly to
+         the file descriptors because that's all a job that dies
+         abruptly leaves behind.
+    """
+    action, jobnum = argv
+    os.write(1, "stdout %s\n" % jobnum)
+    os.write(2, "stderr %s\n" % jobnum)
+    if action == "ok":
+        return
+    elif action == "exit":
+        # Bypass Python entirely, as the C library's exit() does.
+        os._exit(3)
+    elif action == "kill":
+        os.kill(os.getpid(), signal.SIGKILL)
+    elif action == "fail":
+        sys.exit("job %s failed" % jobnum)
+    raise ValueError, action
+
+def run_ncptl(arglist):
+    "Run ncptl.py and return its exit status and normalized output."
+    outfile = tempfile.TemporaryFile()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            devnull = os.open(os.devnull, os.O_WRONLY)
+            os.dup2(outfile.fileno(), 1)
+            os.dup2(devnull, 2)
+            os.execv(sys.executable, [sys.executable, ncptl, "--quiet"] + arglist)
+        finally:
+            os._exit(127)
+    status = os.waitpid(pid, 0)[1]
+    outfile.seek(0)
+    output = filter(lambda oneline: not volatile_re.search(oneline), outfile.readlines())
+    outfile.close()
+    return (os.WEXITSTATUS(status), string.join(output, ""))
+
+# Turn a hang into a failure.
+signal.alarm(600)
+
+# Run a mix of good jobs and jobs that die in different ways.  Their
+# output must appear in job order, and the exit status must be the
+# worst of theirs.
+jobactions = ["ok", "exit", "ok", "kill", "ok", "fail", "ok", "ok"]
+joblist = []
+expected = []
+for jobnum in range(len(jobactions)):
+    action = jobactions[jobnum]
+    joblist.append((os.getcwd(), [action, str(jobnum)]))
+    stderr_text = "stderr %d\n" % jobnum
+    exitcode = {"ok": 0, "exit": 3, "kill": 128 + signal.SIGKILL, "fail": 1}[action]
+    if action == "kill":
+        stderr_text = stderr_text + "ncptl: job terminated by signal %d\n" % signal.SIGKILL
+    elif action == "fail":
+        stderr_text = stderr_text + "job %d failed\n" % jobnum
+    expected.append((exitcode, "stdout %d\n" % jobnum, stderr_text))
+batch = NCPTL_Batch(fake_compile, 3)
+orig_stdout, orig_stderr = sys.stdout, sys.stderr
+captures = [tempfile.TemporaryFile(), tempfile.TemporaryFile()]
+sys.stdout, sys.stderr = captures
+try:
+    exitcode = batch.run_jobs(joblist)
+finally:
+    sys.stdout, sys.stderr = orig_stdout, orig_stderr
+output = []
+for capture in captures:
+    capture.seek(0)
+    output.append(capture.read())
+    capture.close()
+if exitcode != max(map(lambda result: result[0], expected)):
+    fail("run_jobs() returned %d" % exitcode)
+if output[0] != string.join(map(lambda result: result[1], expected), ""):
+    fail("run_jobs() wrote %s to standard output" % repr(output[0]))
+if output[1] != string.join(map(lambda result: result[2], expected), ""):
+    fail("run_jobs() wrote %s to standard error" % repr(output[1]))
+
+# Submit the same jobs concurrently to a server.  Every client must
+# receive its own job's result, and the server must survive all of
+# them.  A client that never finishes sending its job must not hold
+# up the others and must be disconnected once its time runs out.
+stalled_timeout = 5
+tempdir = tempfile.mkdtemp()
+try:
+    socketname = os.path.join(tempdir, "ncptl.sock")
+    serverpid = os.fork()
+    if serverpid == 0:
+        exitcode = 1
+        try:
+            try:
+                batch.serve(socketname, stalled_timeout)
+            except SystemExit, exitinfo:
+                exitcode = exitinfo.code
+        finally:
+            os._exit(exitcode)
+    while not os.path.exists(socketname):
+        time.sleep(0.1)
+    stalled = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stalled.connect(socketname)
+    stalled.sendall(os.getcwd())
+    stalled_start = time.time()
+    results = [None] * len(joblist)
+    def client(jobnum):
+        results[jobnum] = submit_job(socketname, joblist[jobnum][0], joblist[jobnum][1])
+    clients = map(lambda jobnum: threading.Thread(target=client, args=(jobnum,)),
+                  range(len(joblist)))
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    for jobnum in range(len(joblist)):
+        if results[jobnum] != expected[jobnum]:
+            fail("job %d sent to the server returned %s instead of %s" %
+                 (jobnum, repr(results[jobnum]), repr(expected[jobnum])))
+    if select.select([stalled], [], [], 0)[0]:
+        fail("the server disconnected a stalled client before finishing the other jobs")
+    if stalled.recv(1) != "":
+        fail("the server replied to an incomplete job")
+    if time.time() - stalled_start < stalled_timeout - 1:
+        fail("the server disconnected a stalled client too soon")
+    stalled.close()
+    os.kill(serverpid, signal.SIGTERM)
+    status = os.waitpid(serverpid, 0)[1]
+    if os.WIFSIGNALED(status) or os.WEXITSTATUS(status) != 0:
+        fail("the server terminated abnormally (status %d)" % status)
+    if os.path.exists(socketname):
+        fail("the server did not remove %s" % socketname)
+
+    # Compile real programs with ncptl --batch, including ones that
+    # fail.  The output must be that of the separate ncptl runs.
+    jobs = [["--backend=c_seq", "--no-compile", "--output=-", "--program=Task 0 outputs 1."],
+            ["--backend=c_seq", "--no-compile", "--output=-", "--program=Task 0 outputs"],
+            ["--backend=c_seq", "--no-compile", "--output=-", "--program=Task 0 outputs 2."]]
+    if os.system('"%s" -c "import pyncptl" > %s 2>&1' % (sys.executable, os.devnull)) == 0:
+        # The run-time library rejects a bad option by calling exit().
+        jobs.insert(2, ["--backend=stats", "--program=Task 0 outputs 3.", "--bogus"])
+    manifestname = os.path.join(tempdir, "manifest")
+    manifest = open(manifestname, "w")
+    jobexits = []
+    expected_output = ""
+    for arglist in jobs:
+        manifest.write("%s\n" % string.join(map(lambda arg: "'%s'" % arg, arglist)))
+        jobexit, joboutput = run_ncptl(arglist)
+        jobexits.append(jobexit)
+        expected_output = expected_output + joboutput
+    manifest.close()
+    if jobexits[0] != 0 or min(jobexits) != 0 or max(jobexits) == 0:
+        fail("ncptl jobs exited with statuses %s" % repr(jobexits))
+    expected_exitcode = max(jobexits)
+    exitcode, output = run_ncptl(["--jobs=2", "--batch=%s" % manifestname])
+    if exitcode != expected_exitcode:
+        fail("ncptl --batch exited with status %d instead of %d" % (exitcode, expected_exitcode))
+    if output != expected_output:
+        fail("ncptl --batch produced different output from separate ncptl runs")
+finally:
+    shutil.rmtree(tempdir, 1)
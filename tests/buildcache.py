@@ -0,0 +1,153 @@
+#! /usr/bin/env python
+
+########################################################################
+#
+# Ensure that a cached object file or executable is reused only while
+# the installed run-time header and library are unchanged
+#
+# By Scott Pakin <pakin@lanl.gov>
+#
+# ----------------------------------------------------------------------
+# 
+# Copyright (C) 2003, Triad National Security, LLC
+# All rights reserved.
+# 
+# Copyright (2003).  Triad National Security, LLC.  This software
+# was produced under U.S. Government contract 89233218CNA000001 for
+# Los Alamos National Laboratory (LANL), which is operated by Los
+# Alamos National Security, LLC (Triad) for the U.S. Department
+# of Energy. The U.S. Government has rights to use, reproduce,
+# and distribute this software.  NEITHER THE GOVERNMENT NOR TRIAD
+# MAKES ANY WARRANTY, EXPRESS OR IMPLIED, OR ASSUMES ANY LIABILITY
+# FOR THE USE OF THIS SOFTWARE. If software is modified to produce
+# derivative works, such modified software should be clearly marked,
+# so as not to confuse it with the version available from LANL.
+# 
+# Additionally, redistribution and use in source and binary forms,
+# with or without modification, are permitted provided that the
+# following conditions are met:
+# 
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+# 
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer
+#     in the documentation and/or other materials provided with the
+#     distribution.
+# 
+#   * Neither the name of Triad National Security, LLC, Los Alamos
+#     National Laboratory, the U.S. Government, nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY TRIAD AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL TRIAD OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY,
+# OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT
+# OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE
+# OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# 
+#
+########################################################################
+
+import sys
+import os
+import glob
+import tempfile
+import shutil
+import time
+from testutil import progname, srcdir, builddir, fail, skip
+
+# Define some global variables
+ncptl = os.path.join(srcdir, "ncptl.py") # coNCePTuaL compiler front end
+reuse_message = "Reusing the cached build"
+
+# Define a trivial program to compile.
+program = 'Task 0 outputs "Hello, world!".\n'
+
+def run(command):
+    "Run a command and return its exit status and combined output."
+    outfile = tempfile.TemporaryFile()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.dup2(outfile.fileno(), 1)
+            os.dup2(outfile.fileno(), 2)
+            os.execv(command[0], command)
+        finally:
+            os._exit(127)
+    status = os.waitpid(pid, 0)[1]
+    outfile.seek(0)
+    output = outfile.read()
+    outfile.close()
+    if os.WIFSIGNALED(status):
+        return (128 + os.WTERMSIG(status), output)
+    return (os.WEXITSTATUS(status), output)
+
+def build(expect_reuse, why):
+    "Compile the program and check whether the cached build was reused."
+    exitcode, output = run([sys.executable, ncptl, "--backend=c_seq",
+                            "--output=%s" % exename, programname])
+    if exitcode != 0:
+        fail("ncptl failed:\n%s" % output)
+    reused = output.find(reuse_message) != -1
+    if reused and not expect_reuse:
+        fail("ncptl reused a cached build %s" % why)
+    if expect_reuse and not reused:
+        fail("ncptl failed to reuse a cached build %s" % why)
+    exitcode, output = run([exename, "--logfile="])
+    if exitcode != 0:
+        fail("the compiled program failed:\n%s" % output)
+
+# Skip the test if the run-time library wasn't built.
+libfiles = glob.glob(os.path.join(builddir, ".libs", "libncptl.*"))
+if not libfiles:
+    skip("the run-time library is not in %s" % builddir)
+
+# Install private copies of the header and library so we can modify
+# them.  The generated code includes <ncptl/ncptl.h>.
+tempdir = tempfile.mkdtemp()
+try:
+    includedir = os.path.join(tempdir, "include")
+    libdir = os.path.join(tempdir, "lib")
+    os.makedirs(os.path.join(includedir, "ncptl"))
+    os.mkdir(libdir)
+    headername = os.path.join(includedir, "ncptl", "ncptl.h")
+    shutil.copy(os.path.join(builddir, "ncptl.h"), headername)
+    for libfile in libfiles:
+        shutil.copy(libfile, libdir)
+    os.environ["includedir"] = includedir
+    os.environ["libdir"] = libdir
+    os.environ["LD_LIBRARY_PATH"] = libdir + os.pathsep + \
+                                    os.environ.get("LD_LIBRARY_PATH", "")
+    os.environ["NCPTL_CACHE_DIR"] = os.path.join(tempdir, "cache")
+    programname = os.path.join(tempdir, "buildcache.ncptl")
+    exename = os.path.join(tempdir, "buildcache")
+    progfile = open(programname, "w")
+    progfile.write(program)
+    progfile.close()
+
+    # An unchanged run-time installation should yield a cache hit.
+    build(0, "with an empty cache")
+    build(1, "with an unchanged header and library")
+
+    # Rebuilding the header should invalidate the cached build.
+    headerfile = open(headername, "a")
+    headerfile.write("\n/* Reinstalled */\n")
+    headerfile.close()
+    build(0, "after the header changed")
+    build(1, "after rebuilding with the new header")
+
+    # Reinstalling the library should invalidate the cached build.
+    newtime = time.time() + 60
+    for libfile in glob.glob(os.path.join(libdir, "libncptl.*")):
+        os.utime(libfile, (newtime, newtime))
+    build(0, "after the library changed")
+    build(1, "after rebuilding with the new library")
+finally:
+    shutil.rmtree(tempdir, 1)
@@ -0,0 +1,201 @@
+#! /usr/bin/env python
+
+########################################################################
+#
+# Ensure that the interpreter's peak memory usage does not grow with
+# the number of events a program generates and (with --benchmark)
+# measure the peak memory consumed by the interpreter-family backends
+# when processing a set of coNCePTuaL programs with various numbers
+# of tasks
+#
+# By Scott Pakin <pakin@lanl.gov>
+#
+# ----------------------------------------------------------------------
+# 
+# Copyright (C) 2003, Triad National Security, LLC
+# All rights reserved.
+# 
+# Copyright (2003).  Triad National Security, LLC.  This software
+# was produced under U.S. Government contract 89233218CNA000001 for
+# Los Alamos National Laboratory (LANL), which is operated by Los
+# Alamos National Security, LLC (Triad) for the U.S. Department
+# of Energy. The U.S. Government has rights to use, reproduce,
+# and distribute this software.  NEITHER THE GOVERNMENT NOR TRIAD
+# MAKES ANY WARRANTY, EXPRESS OR IMPLIED, OR ASSUMES ANY LIABILITY
+# FOR THE USE OF THIS SOFTWARE. If software is modified to produce
+# derivative works, such modified software should be clearly marked,
+# so as not to confuse it with the version available from LANL.
+# 
+# Additionally, redistribution and use in source and binary forms,
+# with or without modification, are permitted provided that the
+# following conditions are met:
+# 
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+# 
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer
+#     in the documentation and/or other materials provided with the
+#     distribution.
+# 
+#   * Neither the name of Triad National Security, LLC, Los Alamos
+#     National Laboratory, the U.S. Government, nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY TRIAD AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL TRIAD OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY,
+# OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT
+# OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE
+# OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# 
+#
+########################################################################
+
+import sys
+import os
+import time
+import glob
+import tempfile
+import shutil
+from testutil import srcdir, fail, skip, Options, TimingTable
+
+# Program whose number of events grows with its --reps option
+synthetic_program = """\
+reps is "Number of repetitions" and comes from "--reps" or "-r" with default 200.
+
+For reps repetitions {
+  all tasks t asynchronously send a 64 byte message to task (t+1) mod num_tasks then
+  all tasks await completion
+}
+
+Task 0 outputs "Received " and msgs_received and " messages".
+"""
+
+def measure(command):
+    """
+         Run a command and return its exit status, peak resident-set
+         size in kilobytes, wall-clock time in seconds, and standard
+         output.  Kill the command if it runs for longer than the
+         timeout.
+    """
+    starttime = time.time()
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    outfile = tempfile.TemporaryFile()
+    pid = os.fork()
+    if pid == 0:
+        os.dup2(outfile.fileno(), 1)
+        os.dup2(devnull, 2)
+        try:
+            os.execv(command[0], command)
+        finally:
+            os._exit(127)
+    os.close(devnull)
+    while 1:
+        waitpid, status, rusage = os.wait4(pid, os.WNOHANG)
+        if waitpid == pid:
+            break
+        if time.time() - starttime > options.timeout:
+            os.kill(pid, 9)
+            waitpid, status, rusage = os.wait4(pid, 0)
+            return (None, rusage.ru_maxrss, time.time() - starttime, "")
+        time.sleep(0.1)
+    outfile.seek(0)
+    output = outfile.read()
+    outfile.close()
+    return (os.WEXITSTATUS(status), rusage.ru_maxrss, time.time() - starttime, output)
+
+def run_program(program, numtasks, extra_options=[]):
+    """
+         Run a program with a given number of tasks and a list of
+         extra options, add its measurements to the table, and return
+         its exit status, peak resident-set size, and standard output.
+    """
+    command = [sys.executable, options.ncptl, "--quiet", "--backend=%s" % options.backend,
+               program, "--tasks=%d" % numtasks] + extra_options
+    if options.backend == "interpret":
+        command.extend(["--logfile", ""])
+    exitcode, maxrss, seconds, output = measure(command)
+    if exitcode == None:
+        status = "timed out"
+    elif exitcode == 0:
+        status = "ok"
+    else:
+        status = "failed (%d)" % exitcode
+    progbase = os.path.splitext(os.path.basename(program))[0]
+    for option in extra_options:
+        progbase = progbase + " " + option
+    table.row(progbase, numtasks, maxrss/1024.0, seconds, status)
+    return (exitcode, maxrss, output)
+
+# Parse the command line.
+options = Options([
+    # Long name, short name, kind, default, benchmark default
+    ("backend", "b", "string", "interpret", "interpret"),
+    ("tasks", "T", "ints", [64], [256, 4096]),
+    ("reps", "r", "int", 200, 200),
+    ("timeout", "t", "int", 600, 600),
+    ("ncptl", "n", "string", os.path.join(srcdir, "ncptl.py"), os.path.join(srcdir, "ncptl.py"))],
+                  "[<program.ncptl>...] [-- <backend option>...]")
+try:
+    programs = options.args[:options.args.index("--")]
+    backend_options = options.args[options.args.index("--")+1:]
+except ValueError:
+    programs = options.args
+    backend_options = []
+if programs == [] and options.benchmark:
+    programs = glob.glob(os.path.join(srcdir, "examples", "*.ncptl"))
+    programs.sort()
+if options.backend == "interpret":
+    sys.path.insert(0, srcdir)
+    try:
+        import pyncptl
+    except ImportError:
+        skip("the interpreter requires the pyncptl module")
+
+# Run a synthetic program with a small and a large number of
+# repetitions.  Events are retired as they complete, so the peak
+# memory usage should be about the same for both.  Log files are
+# suppressed so as not to measure thousands of open files.
+table = TimingTable(options.benchmark, [("Program", "%-24s"),
+                                        ("Tasks", "%6d"),
+                                        ("Peak (MB)", "%10.1f"),
+                                        ("Seconds", "%8.1f"),
+                                        ("Status", "%s")])
+tempdir = tempfile.mkdtemp()
+try:
+    synthetic = os.path.join(tempdir, "synthetic.ncptl")
+    progfile = open(synthetic, "w")
+    progfile.write(synthetic_program)
+    progfile.close()
+    for numtasks in options.tasks:
+        peaks = []
+        for reps in [options.reps, 5*options.reps]:
+            exitcode, maxrss, output = run_program(synthetic, numtasks, ["--reps=%d" % reps])
+            if exitcode != 0:
+                fail("the synthetic program failed with %d tasks and %d repetitions" %
+                     (numtasks, reps))
+            if output != "Received %d messages\n" % reps:
+                fail('the synthetic program output "%s" instead of "Received %d messages"' %
+                     (output.strip(), reps))
+            peaks.append(maxrss)
+        if peaks[1] > 2*peaks[0]:
+            fail("peak memory usage grew from %.1f MB to %.1f MB with five times as many events" %
+                 (peaks[0]/1024.0, peaks[1]/1024.0))
+finally:
+    shutil.rmtree(tempdir)
+
+# Run each remaining program with each number of tasks and report the
+# peak memory usage.  Failures are reported only when benchmarking
+# because some programs can't run with every number of tasks.
+for program in programs:
+    for numtasks in options.tasks:
+        exitcode, maxrss, output = run_program(program, numtasks, backend_options)
+        if exitcode != 0 and not options.benchmark:
+            fail("%s failed with %d tasks" % (program, numtasks))
@@ -0,0 +1,132 @@
+#! /usr/bin/env python
+
+########################################################################
+#
+# Ensure that ncptl --filter applies each substitution to the
+# generated code as a whole
+#
+# By Scott Pakin <pakin@lanl.gov>
+#
+# ----------------------------------------------------------------------
+# 
+# Copyright (C) 2003, Triad National Security, LLC
+# All rights reserved.
+# 
+# Copyright (2003).  Triad National Security, LLC.  This software
+# was produced under U.S. Government contract 89233218CNA000001 for
+# Los Alamos National Laboratory (LANL), which is operated by Los
+# Alamos National Security, LLC (Triad) for the U.S. Department
+# of Energy. The U.S. Government has rights to use, reproduce,
+# and distribute this software.  NEITHER THE GOVERNMENT NOR TRIAD
+# MAKES ANY WARRANTY, EXPRESS OR IMPLIED, OR ASSUMES ANY LIABILITY
+# FOR THE USE OF THIS SOFTWARE. If software is modified to produce
+# derivative works, such modified software should be clearly marked,
+# so as not to confuse it with the version available from LANL.
+# 
+# Additionally, redistribution and use in source and binary forms,
+# with or without modification, are permitted provided that the
+# following conditions are met:
+# 
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+# 
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer
+#     in the documentation and/or other materials provided with the
+#     distribution.
+# 
+#   * Neither the name of Triad National Security, LLC, Los Alamos
+#     National Laboratory, the U.S. Government, nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY TRIAD AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL TRIAD OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY,
+# OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT
+# OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE
+# OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# 
+#
+########################################################################
+
+import sys
+import os
+import string
+import re
+import tempfile
+
+# Define some global variables
+progname = os.path.basename(sys.argv[0]) # This program's name
+srcdir = os.path.dirname(os.path.dirname(os.path.abspath(sys.argv[0])))
+ncptl = os.path.join(srcdir, "ncptl.py") # coNCePTuaL compiler front end
+program = 'For 3 repetitions task 0 computes for 1 microsecond then task 0 outputs "a;b".'
+
+# Remove the timestamp so the code is the same from run to run.
+normalize = r's/generated by coNCePTuaL on [^\n]*/generated by coNCePTuaL/'
+
+# Map each filter to the substitution it must make on the complete
+# code.  These include patterns that span lines and anchors that
+# match only at the start or end of the code.
+filters = [
+    ("s/^/X/g",          lambda code: re.sub(r'^', "X", code)),
+    ("s/$/X/",           lambda code: re.sub(r'$', "X", code, 1)),
+    ("s/;\\n/;~/g",      lambda code: re.sub(r';\n', ";~", code)),
+    ("s/int/INT/",       lambda code: re.sub(r'int', "INT", code, 1)),
+    ("s/^#/%/gm",        lambda code: re.compile(r'^#', re.MULTILINE).sub("%", code)),
+    ("s|\\{\\s*\\n|{ |g", lambda code: re.sub(r'\{\s*\n', "{ ", code))]
+
+def fail(message):
+    "Report a failed test and exit."
+    sys.stderr.write("%s: %s\n" % (progname, message))
+    sys.exit(1)
+
+def generate(filter_list):
+    "Return the code ncptl generates when given a list of filters."
+    outfile = tempfile.TemporaryFile()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.dup2(outfile.fileno(), 1)
+            arglist = [sys.executable, ncptl, "--quiet", "--backend=c_seq",
+                       "--no-compile", "--output=-"]
+            for sedexpr in filter_list:
+                arglist.append("--filter=%s" % sedexpr)
+            arglist.append("--program=%s" % program)
+            os.execv(sys.executable, arglist)
+        finally:
+            os._exit(127)
+    status = os.waitpid(pid, 0)[1]
+    if os.WIFSIGNALED(status) or os.WEXITSTATUS(status) != 0:
+        fail("ncptl failed with filters %s (status %d)" % (repr(filter_list), status))
+    outfile.seek(0)
+    code = outfile.read()
+    outfile.close()
+    return code
+
+# Apply each filter to the unfiltered code ourselves and compare the
+# result to what ncptl produces.  ncptl writes each line followed by
+# a newline so we strip the final newline before filtering.
+unfiltered = generate([normalize])
+if unfiltered[-1:] != "\n" or string.find(unfiltered, "main") == -1:
+    fail("ncptl generated unexpected code")
+unfiltered = unfiltered[:-1]
+for sedexpr, substitute in filters:
+    expected = substitute(unfiltered) + "\n"
+    if expected == unfiltered + "\n":
+        fail('"%s" should change the code' % sedexpr)
+    if generate([normalize, sedexpr]) != expected:
+        fail('"%s" did not filter the code as a whole' % sedexpr)
+
+# Multiple filters apply in turn.
+sedexprs = map(lambda onefilter: onefilter[0], filters)
+expected = unfiltered
+for sedexpr, substitute in filters:
+    expected = substitute(expected)
+if generate([normalize] + sedexprs) != expected + "\n":
+    fail("multiple filters were not applied in order")
@@ -0,0 +1,178 @@
+#! /usr/bin/env python
+
+########################################################################
+#
+# Ensure that ncptl_logmerge and ncptl-logmerge produce identical
+# output at every simplification level and (with --benchmark) compare
+# the time each takes to merge a set of log files
+#
+# By Scott Pakin <pakin@lanl.gov>
+#
+# ----------------------------------------------------------------------
+# 
+# Copyright (C) 2003, Triad National Security, LLC
+# All rights reserved.
+# 
+# Copyright (2003).  Triad National Security, LLC.  This software
+# was produced under U.S. Government contract 89233218CNA000001 for
+# Los Alamos National Laboratory (LANL), which is operated by Los
+# Alamos National Security, LLC (Triad) for the U.S. Department
+# of Energy. The U.S. Government has rights to use, reproduce,
+# and distribute this software.  NEITHER THE GOVERNMENT NOR TRIAD
+# MAKES ANY WARRANTY, EXPRESS OR IMPLIED, OR ASSUMES ANY LIABILITY
+# FOR THE USE OF THIS SOFTWARE. If software is modified to produce
+# derivative works, such modified software should be clearly marked,
+# so as not to confuse it with the version available from LANL.
+# 
+# Additionally, redistribution and use in source and binary forms,
+# with or without modification, are permitted provided that the
+# following conditions are met:
+# 
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+# 
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer
+#     in the documentation and/or other materials provided with the
+#     distribution.
+# 
+#   * Neither the name of Triad National Security, LLC, Los Alamos
+#     National Laboratory, the U.S. Government, nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY TRIAD AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL TRIAD OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY,
+# OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT
+# OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE
+# OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# 
+#
+########################################################################
+
+import sys
+import os
+import string
+import time
+import random
+import tempfile
+import shutil
+from testutil import srcdir, fail, find_perl_tool, Options, TimingTable
+
+def write_log(logfilename, rank, numranks):
+    """
+         Write a synthetic log file for process RANK of NUMRANKS.
+         Some comments are the same in every file, some differ in a
+         few files, and some differ in every file.  Every tenth file
+         contains an extra warning, and only rank 0 logs data.
+    """
+    logfile = open(logfilename, "w")
+    separator = "#" * 75 + "\n"
+    logfile.write(separator)
+    logfile.write("# ===================\n# coNCePTuaL log file\n# ===================\n")
+    logfile.write("# coNCePTuaL version: 1.5.1b\n")
+    logfile.write("# coNCePTuaL backend: c_mpi (C + MPI)\n")
+    logfile.write("# Executable name: /home/user/bench\n")
+    logfile.write("# Unique execution identifier: 1F2E3D4C-5B6A-7988-A7B6-C5D4E3F2A1B0\n")
+    logfile.write("# Working directory: /home/user\n")
+    logfile.write("# Number of tasks: %d\n" % numranks)
+    logfile.write("# Rank (0<=P<tasks): %d\n" % rank)
+    logfile.write("# Host name: node%04d\n" % (rank/4))
+    logfile.write("# Process ID: %d\n" % random.randint(1000, 32767))
+    if rank % 10 == 3:
+        logfile.write("# WARNING: Unable to determine the CPU frequency\n")
+    logfile.write("# CPU frequency: %d Hz\n" % random.choice([2400000000L, 2400000000L, 2399999000L]))
+    for i in range(0, 40):
+        logfile.write("# Synthetic parameter %d: %d\n" % (i, i*1000))
+    logfile.write("# Microsecond timer overhead: %.3g usecs\n" % random.uniform(0.01, 0.05))
+    logfile.write("# Log-file creation time: Mon Jan  1 00:00:%02d 2024\n" % random.randint(0, 2))
+    logfile.write("#\n# Environment variables\n# ---------------------\n")
+    for i in range(0, 40):
+        logfile.write("# VARIABLE_%d: value %d\n" % (i, i))
+    logfile.write("# HOSTNAME: node%04d\n" % (rank/4))
+    logfile.write("#\n# coNCePTuaL source code\n# ----------------------\n")
+    logfile.write("#     For 100 repetitions task 0 sends a 1 byte message to task 1.\n#\n")
+    logfile.write(separator)
+    if rank == 0:
+        logfile.write('"Bytes","1/2 RTT (usecs)"\n')
+        logfile.write('"(all data)","(mean)"\n')
+        for rownum in xrange(0, options.rows):
+            logfile.write("%d,%.10g\n" % (rownum+1, random.uniform(1, 1000)))
+    logfile.write(separator)
+    logfile.write("# Program exited normally.\n")
+    logfile.write("# Log-file completion time: Mon Jan  1 00:01:%02d 2024\n" % random.randint(0, 2))
+    logfile.write("# Elapsed time: %d seconds\n" % random.randint(59, 61))
+    logfile.write(separator)
+    logfile.close()
+
+def time_logmerge(logfilenames, simplification):
+    "Return the output of ncptl-logmerge and the time it took."
+    starttime = time.time()
+    simplify = string.join(["--simplify"] * simplification)
+    merger = os.popen("%s %s %s" % (logmerge, simplify, string.join(logfilenames)))
+    output = merger.read()
+    if merger.close() != None:
+        fail("%s failed" % logmerge)
+    return (output, time.time() - starttime)
+
+def time_ncptl_logmerge(logfilenames, simplification):
+    "Return the output of ncptl_logmerge and the time it took."
+    starttime = time.time()
+    logs = ncptl_logmerge.read_logs(logfilenames, simplification, 0, options.jobs)
+    output = string.join(list(ncptl_logmerge.merge_logs(logs, simplification)) + [""], "\n")
+    return (output, time.time() - starttime)
+
+# Parse the command line.
+options = Options([
+    # Long name, short name, kind, default, benchmark default
+    ("ranks", "R", "ints", [16, 64], [16, 256, 1024]),
+    ("rows", "r", "int", 100, 100),
+    ("trials", "t", "int", 1, 3),
+    ("jobs", "j", "int", None, None),
+    ("logmerge", "l", "string", None, None)])
+if options.args != []:
+    options.usage(1)
+logmerge = options.logmerge
+if logmerge == None:
+    logmerge = find_perl_tool("ncptl-logmerge")
+
+# Import the log merger from the source directory.
+sys.path.insert(0, srcdir)
+import ncptl_logmerge
+
+# For each number of log files, time ncptl-logmerge and ncptl_logmerge
+# at every simplification level.  The outputs must agree.
+tempdir = tempfile.mkdtemp()
+try:
+    table = TimingTable(options.benchmark, [("Ranks", "%8d"),
+                                            ("Simplify", "%8d"),
+                                            ("Perl", "%12.4f"),
+                                            ("Python", "%12.4f")])
+    for numranks in options.ranks:
+        logfilenames = []
+        for rank in range(0, numranks):
+            logfilename = os.path.join(tempdir, "bench-%d.log" % rank)
+            write_log(logfilename, rank, numranks)
+            logfilenames.append(logfilename)
+        for simplification in range(0, 5):
+            perl_secs = []
+            python_secs = []
+            for trial in range(0, options.trials):
+                expected, seconds = time_logmerge(logfilenames, simplification)
+                perl_secs.append(seconds)
+                output, seconds = time_ncptl_logmerge(logfilenames, simplification)
+                python_secs.append(seconds)
+                if output != expected:
+                    fail("ncptl_logmerge and ncptl-logmerge disagree for %d ranks at simplification level %d" %
+                         (numranks, simplification))
+            table.row(numranks, simplification, min(perl_secs), min(python_secs))
+        for logfilename in logfilenames:
+            os.remove(logfilename)
+finally:
+    shutil.rmtree(tempdir)
@@ -0,0 +1,200 @@
+#! /usr/bin/env python
+
+########################################################################
+#
+# Ensure that ncptl_logreader extracts the same data from a log file
+# as "ncptl-logextract --extract=data", both when parsing the text and
+# when reading back its columnar cache, and (with --benchmark) compare
+# the time each takes
+#
+# By Scott Pakin <pakin@lanl.gov>
+#
+# ----------------------------------------------------------------------
+# 
+# Copyright (C) 2003, Triad National Security, LLC
+# All rights reserved.
+# 
+# Copyright (2003).  Triad National Security, LLC.  This software
+# was produced under U.S. Government contract 89233218CNA000001 for
+# Los Alamos National Laboratory (LANL), which is operated by Los
+# Alamos National Security, LLC (Triad) for the U.S. Department
+# of Energy. The U.S. Government has rights to use, reproduce,
+# and distribute this software.  NEITHER THE GOVERNMENT NOR TRIAD
+# MAKES ANY WARRANTY, EXPRESS OR IMPLIED, OR ASSUMES ANY LIABILITY
+# FOR THE USE OF THIS SOFTWARE. If software is modified to produce
+# derivative works, such modified software should be clearly marked,
+# so as not to confuse it with the version available from LANL.
+# 
+# Additionally, redistribution and use in source and binary forms,
+# with or without modification, are permitted provided that the
+# following conditions are met:
+# 
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+# 
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer
+#     in the documentation and/or other materials provided with the
+#     distribution.
+# 
+#   * Neither the name of Triad National Security, LLC, Los Alamos
+#     National Laboratory, the U.S. Government, nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY TRIAD AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL TRIAD OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY,
+# OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT
+# OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE
+# OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# 
+#
+########################################################################
+
+import sys
+import os
+import string
+import time
+import random
+import tempfile
+import shutil
+from testutil import srcdir, fail, find_perl_tool, Options, TimingTable
+
+def write_log(logfilename, numrows):
+    """
+         Write a synthetic log file containing NUMTABLES tables of
+         NUMROWS rows each.  Each table's last column is half as long
+         as the others, as happens when a program logs different
+         numbers of values to different columns.
+    """
+    logfile = open(logfilename, "w")
+    separator = "#" * 75 + "\n"
+    logfile.write(separator)
+    logfile.write("# ===================\n# coNCePTuaL log file\n# ===================\n")
+    logfile.write("# coNCePTuaL version: 1.5.1b\n")
+    logfile.write("# coNCePTuaL backend: c_mpi (C + MPI)\n")
+    for i in range(0, 40):
+        logfile.write("# Synthetic parameter %d: %d\n" % (i, random.randint(0, 1000000)))
+    logfile.write("#\n# Environment variables\n# ---------------------\n")
+    for i in range(0, 40):
+        logfile.write("# VARIABLE_%d: value %d\n" % (i, i))
+    logfile.write("#\n# coNCePTuaL source code\n# ----------------------\n")
+    logfile.write("#     For 100 repetitions task 0 sends a 1 byte message to task 1.\n#\n")
+    logfile.write(separator)
+    for tablenum in range(0, options.tables):
+        if tablenum > 0:
+            logfile.write("\n")
+        logfile.write('"Bytes","1/2 RTT (usecs)","Bandwidth (\\"MB/s\\")","Tally"\n')
+        logfile.write('"(all data)","(mean)","(median)","(maximum)"\n')
+        for rownum in xrange(0, numrows):
+            cells = ["%d" % (rownum+1),
+                     "%.10g" % random.uniform(1, 1000),
+                     "%.10g" % random.lognormvariate(0, 5)]
+            if rownum < numrows/2:
+                cells.append("%.10g" % float(random.randint(0, 9999999999L)))
+            else:
+                cells.append("")
+            logfile.write(string.join(cells, ",") + "\n")
+    logfile.write(separator)
+    logfile.write("# Program exited normally.\n")
+    logfile.write("# Elapsed time: 1 second\n")
+    logfile.write(separator)
+    logfile.close()
+
+def time_logextract(logfilename):
+    "Return the output of ncptl-logextract and the time it took."
+    starttime = time.time()
+    extractor = os.popen("%s --quiet --extract=data %s" % (logextract, logfilename))
+    output = extractor.read()
+    if extractor.close() != None:
+        fail("%s failed" % logextract)
+    return (output, time.time() - starttime)
+
+def time_logreader(logfilename, use_cache):
+    "Return the output of ncptl_logreader and the time it took."
+    starttime = time.time()
+    logfile = ncptl_logreader.load_log(logfilename, use_cache)
+    output = string.join(list(ncptl_logreader.format_data(logfile)) + [""], "\n")
+    return (output, time.time() - starttime)
+
+def time_parse(logfilename, use_cache):
+    "Return the time taken to make a log file's data available."
+    starttime = time.time()
+    logfile = ncptl_logreader.load_log(logfilename, use_cache)
+    for table in logfile.tables:
+        for colnum in range(0, table.numcols):
+            table.column(colnum)
+    return time.time() - starttime
+
+# Parse the command line.
+options = Options([
+    # Long name, short name, kind, default, benchmark default
+    ("rows", "r", "ints", [1000, 10000], [1000, 10000, 100000]),
+    ("tables", "T", "int", 4, 4),
+    ("trials", "t", "int", 1, 3),
+    ("logextract", "l", "string", None, None)])
+if options.args != []:
+    options.usage(1)
+logextract = options.logextract
+if logextract == None:
+    logextract = find_perl_tool("ncptl-logextract")
+
+# Import the log reader from the source directory.
+sys.path.insert(0, srcdir)
+import ncptl_logreader
+
+# For each log-file size, time ncptl-logextract, ncptl_logreader
+# parsing the text, and ncptl_logreader reading its columnar cache.
+# The first two are timed both making the data available and
+# reformatting it as text; the outputs must agree.
+tempdir = tempfile.mkdtemp()
+cachedir = os.path.join(tempdir, "cache")
+os.environ["NCPTL_CACHE_DIR"] = cachedir
+try:
+    table = TimingTable(options.benchmark, [("Rows", "%8d"),
+                                            ("Extract", "%12.4f"),
+                                            ("Parse+fmt", "%12.4f"),
+                                            ("Cache+fmt", "%12.4f"),
+                                            ("Parse", "%12.4f"),
+                                            ("Cache", "%12.4f")])
+    for numrows in options.rows:
+        logfilename = os.path.join(tempdir, "bench-%d.log" % numrows)
+        write_log(logfilename, numrows)
+        extract_secs = []
+        parse_fmt_secs = []
+        cache_fmt_secs = []
+        parse_secs = []
+        cache_secs = []
+        for trial in range(0, options.trials):
+            expected, seconds = time_logextract(logfilename)
+            extract_secs.append(seconds)
+            output, seconds = time_logreader(logfilename, 0)
+            parse_fmt_secs.append(seconds)
+            if output != expected:
+                fail("ncptl_logreader's output differs from ncptl-logextract's")
+            parse_secs.append(time_parse(logfilename, 0))
+            if os.path.exists(cachedir):
+                shutil.rmtree(cachedir)
+            ncptl_logreader.load_log(logfilename, 1)
+            tempfiles = os.listdir(tempdir)
+            tempfiles.sort()
+            if tempfiles != [os.path.basename(logfilename), "cache"]:
+                fail("ncptl_logreader wrote files outside the cache directory")
+            if filter(lambda entry: entry[-4:] == ".map", os.listdir(cachedir)) == []:
+                fail("ncptl_logreader did not cache %s" % logfilename)
+            output, seconds = time_logreader(logfilename, 1)
+            cache_fmt_secs.append(seconds)
+            if output != expected:
+                fail("ncptl_logreader's cached output differs from ncptl-logextract's")
+            cache_secs.append(time_parse(logfilename, 1))
+        table.row(numrows, min(extract_secs), min(parse_fmt_secs), min(cache_fmt_secs),
+                  min(parse_secs), min(cache_secs))
+        os.remove(logfilename)
+finally:
+    shutil.rmtree(tempdir)
@@ -0,0 +1,289 @@
+#! /usr/bin/env python
+
+########################################################################
+#
+# Measure how the interpreter's message queues scale with the number
+# of messages awaiting receipt by a single task, and ensure that
+# WAIT_ALL blocks and completes exactly as it did when message queues
+# were lists that it popped and restored
+#
+# By Scott Pakin <pakin@lanl.gov>
+#
+# ----------------------------------------------------------------------
+# 
+# Copyright (C) 2003, Triad National Security, LLC
+# All rights reserved.
+# 
+# Copyright (2003).  Triad National Security, LLC.  This software
+# was produced under U.S. Government contract 89233218CNA000001 for
+# Los Alamos National Laboratory (LANL), which is operated by Los
+# Alamos National Security, LLC (Triad) for the U.S. Department
+# of Energy. The U.S. Government has rights to use, reproduce,
+# and distribute this software.  NEITHER THE GOVERNMENT NOR TRIAD
+# MAKES ANY WARRANTY, EXPRESS OR IMPLIED, OR ASSUMES ANY LIABILITY
+# FOR THE USE OF THIS SOFTWARE. If software is modified to produce
+# derivative works, such modified software should be clearly marked,
+# so as not to confuse it with the version available from LANL.
+# 
+# Additionally, redistribution and use in source and binary forms,
+# with or without modification, are permitted provided that the
+# following conditions are met:
+# 
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+# 
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer
+#     in the documentation and/or other materials provided with the
+#     distribution.
+# 
+#   * Neither the name of Triad National Security, LLC, Los Alamos
+#     National Laboratory, the U.S. Government, nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY TRIAD AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL TRIAD OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY,
+# OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT
+# OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE
+# OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# 
+#
+########################################################################
+
+import sys
+import time
+import random
+from testutil import srcdir, fail, skip, Options, TimingTable
+
+def new_interpreter(numtasks):
+    """
+         Return an interpreter ready to process events directly (i.e.,
+         without interpreting a program).
+    """
+    codegen = NCPTL_CodeGen([], numtasks=numtasks)
+    codegen.clear_events()
+    codegen.counters = []
+    for task in range(numtasks):
+        codegen.counters.append({})
+        for varname in Variables.variables.keys():
+            codegen.counters[task][varname] = 0L
+    return codegen
+
+def new_send(sender, receiver, tag, msgsize):
+    "Return a SEND event that has already been posted."
+    event = NCPTL_CodeGen.Event("SEND", sender, "1", peers=[receiver], msgsize=msgsize, tag=tag)
+    event.suppressed = 0
+    event.posttime = 0L
+    return event
+
+def new_receive(receiver, sender, tag, msgsize):
+    "Return an asynchronous RECEIVE event."
+    event = NCPTL_CodeGen.Event("RECEIVE", receiver, "1", peers=[sender],
+                                msgsize=msgsize, tag=tag, blocking=0)
+    event.suppressed = 0
+    return event
+
+class ListMessageQueue:
+    """
+       Reimplement the message queue the interpreter used before
+       message queues were deques: a list per (source, tag, size)
+       that WAIT_ALL pops and then restores.
+    """
+
+    def __init__(self):
+        self.queues = {}
+
+    def push(self, event):
+        self.queues.setdefault((event.task, event.tag, event.msgsize), []).append(event)
+
+    def pop_match(self, event):
+        try:
+            return self.queues[(event.peers[0], event.tag, event.msgsize)].pop(0)
+        except (KeyError, IndexError):
+            return None
+
+    def unpop_match(self, event, matched_event):
+        self.queues[(event.peers[0], event.tag, event.msgsize)].insert(0, matched_event)
+
+    def wait_all(self, pending):
+        """
+             Return the task on which a WAIT_ALL of a list of pending
+             receives blocks or, if it doesn't block, None and the
+             matching sends in completion order.
+        """
+        unpop_list = []
+        try:
+            for event in pending:
+                matched_event = self.pop_match(event)
+                if matched_event == None:
+                    return (event.peers[0], None)
+                unpop_list.insert(0, (event, matched_event))
+        finally:
+            for event, matched_event in unpop_list:
+                self.unpop_match(event, matched_event)
+        return (None, map(self.pop_match, pending))
+
+def queue_contents(queues, eventnum):
+    """
+         Return a map from each (source, tag, size) key with a
+         nonempty queue to the numbers of its queued events.
+    """
+    contents = {}
+    for key, queue in queues.items():
+        if len(queue) > 0:
+            contents[key] = map(lambda event: eventnum[id(event)], queue)
+    return contents
+
+def check_wait_all(numrounds):
+    """
+         Run NUMROUNDS randomized WAIT_ALLs of a set of asynchronous
+         receives through both the interpreter and ListMessageQueue,
+         delivering the matching messages one at a time in random
+         order.  Fail if the two ever disagree about which task
+         blocks a WAIT_ALL, which message each receive matches, or
+         which messages remain queued.
+    """
+    rng = random.Random(12345)
+    numtasks = 4
+    codegen = new_interpreter(numtasks)
+    eventlist = codegen.eventlist[0]
+    msgqueue = codegen.msgqueue[0]
+    completions = []
+    def recording_complete(peerlist=None, nolat_peerlist=None, peertime=None,
+                           real_complete=eventlist.complete, completions=completions):
+        completions.append(peerlist)
+        return real_complete(peerlist, nolat_peerlist, peertime)
+    eventlist.complete = recording_complete
+    refqueue = ListMessageQueue()
+    eventnum = {}      # Map from a SEND event's ID to its sequence number
+    sendlist = []      # Every SEND event ever created (keeps IDs unique)
+    randkey = lambda rng=rng, numtasks=numtasks: (rng.randint(1, numtasks-1),
+                                                  long(rng.randint(0, 1)),
+                                                  long(rng.choice([0, 8])))
+    for roundnum in xrange(numrounds):
+        # Post a WAIT_ALL for a random set of receives plus a message
+        # for each of them and a few unrelated messages.
+        receives = []
+        arrivals = []
+        for recvnum in range(rng.randint(1, 8)):
+            sender, tag, msgsize = randkey()
+            receives.append(new_receive(0L, sender, tag, msgsize))
+            arrivals.append((sender, tag, msgsize))
+        for extranum in range(rng.randint(0, 3)):
+            arrivals.append(randkey())
+        rng.shuffle(arrivals)
+        wait_event = NCPTL_CodeGen.Event("WAIT_ALL", 0L, "1")
+        wait_event.suppressed = 0
+        eventlist.push(wait_event)
+        codegen.pendingevents[0] = list(receives)
+        del completions[:]
+
+        # Deliver the messages one at a time until the WAIT_ALL completes.
+        while 1:
+            blocker = codegen.process_wait_all(wait_event)
+            ref_blocker, ref_senders = refqueue.wait_all(receives)
+            if blocker != ref_blocker:
+                fail("round %d: WAIT_ALL blocked on %s instead of %s" %
+                     (roundnum, repr(blocker), repr(ref_blocker)))
+            if blocker == None:
+                break
+            if arrivals == []:
+                fail("round %d: WAIT_ALL blocked after every message arrived" % roundnum)
+            sender, tag, msgsize = arrivals.pop()
+            for queue in [msgqueue, refqueue]:
+                event = new_send(sender, 0L, tag, msgsize)
+                eventnum[id(event)] = len(sendlist)/2
+                sendlist.append(event)
+                queue.push(event)
+
+        # Ensure that each receive matched the same message.
+        if len(completions) != 1 or wait_event.completetime == None:
+            fail("round %d: WAIT_ALL did not complete exactly once" % roundnum)
+        matched = map(lambda event: eventnum[id(event)], completions[0])
+        ref_matched = map(lambda event: eventnum[id(event)], ref_senders)
+        if matched != ref_matched:
+            fail("round %d: WAIT_ALL matched messages %s instead of %s" %
+                 (roundnum, matched, ref_matched))
+        if filter(lambda event: not event.found_match, completions[0]):
+            fail("round %d: a matched message was not marked as matched" % roundnum)
+        if codegen.pendingevents[0] != []:
+            fail("round %d: WAIT_ALL left receives pending" % roundnum)
+
+        # Ensure that the same messages remain queued.
+        contents = {}
+        for source, tag2size in msgqueue.queues.items():
+            for tag, size2queue in tag2size.items():
+                for msgsize, queue in size2queue.items():
+                    contents[(source, tag, msgsize)] = queue
+        if queue_contents(contents, eventnum) != queue_contents(refqueue.queues, eventnum):
+            fail("round %d: WAIT_ALL left different messages queued" % roundnum)
+
+def measure(depth):
+    """
+         Queue DEPTH messages for a single receiver then receive them
+         all with the interpreter's WAIT_ALL.  Return the elapsed time
+         in seconds.
+    """
+    codegen = new_interpreter(5)
+    sends = []
+    receives = []
+    for i in xrange(depth):
+        sender = long(i % 4) + 1L
+        sends.append(new_send(sender, 0L, 0L, 0L))
+        receives.append(new_receive(0L, sender, 0L, 0L))
+    wait_event = NCPTL_CodeGen.Event("WAIT_ALL", 0L, "1")
+    wait_event.suppressed = 0
+    codegen.eventlist[0].push(wait_event)
+    codegen.pendingevents[0] = receives
+    msgqueue = codegen.msgqueue[0]
+    starttime = time.time()
+    for event in sends:
+        msgqueue.push(event)
+    if codegen.process_wait_all(wait_event) != None:
+        fail("a receive was left unmatched")
+    elapsed = time.time() - starttime
+    if not msgqueue.is_empty():
+        fail("messages were left in the queue")
+    return elapsed
+
+# Parse the command line.
+options = Options([
+    # Long name, short name, kind, default, benchmark default
+    ("depths", "d", "ints", [1000, 16000], [1000, 2000, 4000, 8000, 16000, 32000, 64000]),
+    ("trials", "t", "int", 3, 3),
+    ("rounds", "r", "count", 1000, 1000)])
+if options.args != []:
+    options.usage(1)
+
+# Import the interpreter from the source directory.
+sys.path.insert(0, srcdir)
+from ncptl_variables import Variables
+try:
+    from codegen_interpret import NCPTL_CodeGen
+except ImportError:
+    skip("the interpreter requires the pyncptl module")
+
+# Ensure that WAIT_ALL behaves as it did with list-based queues.
+check_wait_all(options.rounds)
+
+# Measure each queue depth and report the time per message.  Linear
+# scaling shows up as a constant time per message; popping the front
+# of a list instead of a deque makes it grow with the depth.
+table = TimingTable(options.benchmark, [("Depth", "%8d"),
+                                        ("Seconds", "%10.4f"),
+                                        ("usecs/message", "%14.2f")])
+permessage = []
+for depth in options.depths:
+    seconds = min(map(lambda t, depth=depth: measure(depth), range(options.trials)))
+    table.row(depth, seconds, seconds*1e6/depth)
+    permessage.append(seconds/depth)
+if len(permessage) > 1 and permessage[-1] > 4*permessage[0]:
+    fail("the time per message grew from %.2f to %.2f microseconds" %
+         (permessage[0]*1e6, permessage[-1]*1e6))
@@ -0,0 +1,168 @@
+#! /usr/bin/env python
+
+########################################################################
+#
+# Ensure that the c_profile backend writes a latency profile for every
+# combination of event type and source lines to the log file
+#
+# By Scott Pakin <pakin@lanl.gov>
+#
+# ----------------------------------------------------------------------
+# 
+# Copyright (C) 2003, Triad National Security, LLC
+# All rights reserved.
+# 
+# Copyright (2003).  Triad National Security, LLC.  This software
+# was produced under U.S. Government contract 89233218CNA000001 for
+# Los Alamos National Laboratory (LANL), which is operated by Los
+# Alamos National Security, LLC (Triad) for the U.S. Department
+# of Energy. The U.S. Government has rights to use, reproduce,
+# and distribute this software.  NEITHER THE GOVERNMENT NOR TRIAD
+# MAKES ANY WARRANTY, EXPRESS OR IMPLIED, OR ASSUMES ANY LIABILITY
+# FOR THE USE OF THIS SOFTWARE. If software is modified to produce
+# derivative works, such modified software should be clearly marked,
+# so as not to confuse it with the version available from LANL.
+# 
+# Additionally, redistribution and use in source and binary forms,
+# with or without modification, are permitted provided that the
+# following conditions are met:
+# 
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+# 
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer
+#     in the documentation and/or other materials provided with the
+#     distribution.
+# 
+#   * Neither the name of Triad National Security, LLC, Los Alamos
+#     National Laboratory, the U.S. Government, nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY TRIAD AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL TRIAD OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY,
+# OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT
+# OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE
+# OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# 
+#
+########################################################################
+
+import sys
+import os
+import string
+import re
+import glob
+import tempfile
+import shutil
+from testutil import progname, srcdir, builddir, fail, skip
+
+# Define some global variables
+ncptl = os.path.join(srcdir, "ncptl.py") # coNCePTuaL compiler front end
+
+# Define a program with repeated and one-time events on various lines.
+program = """For 10 repetitions
+  task 0 sleeps for 1000 microseconds.
+
+Task 0 computes for 10 microseconds then
+task 0 logs 1 as "One".
+"""
+
+# Define the {event type, source lines, count} of every latency
+# profile c_profile must log.
+expected_profiles = [("DELAY", "2", 10),
+                     ("REPEAT", "1-2", 1),
+                     ("DELAY", "4", 1),
+                     ("CODE", "5", 1),
+                     ("NEWSTMT", "4-5", 1)]
+
+def run(command):
+    "Run a command and return its exit status and combined output."
+    outfile = tempfile.TemporaryFile()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.dup2(outfile.fileno(), 1)
+            os.dup2(outfile.fileno(), 2)
+            os.execv(command[0], command)
+        finally:
+            os._exit(127)
+    status = os.waitpid(pid, 0)[1]
+    outfile.seek(0)
+    output = outfile.read()
+    outfile.close()
+    if os.WIFSIGNALED(status):
+        return (128 + os.WTERMSIG(status), output)
+    return (os.WEXITSTATUS(status), output)
+
+# Skip the test if the run-time library wasn't built.
+if not glob.glob(os.path.join(builddir, ".libs", "libncptl.*")):
+    skip("the run-time library is not in %s" % builddir)
+
+# Build and run the program with c_profile atop c_seq.  The generated
+# code includes <ncptl/ncptl.h> so we make the header from the build
+# directory look installed.
+tempdir = tempfile.mkdtemp()
+try:
+    os.mkdir(os.path.join(tempdir, "ncptl"))
+    shutil.copy(os.path.join(builddir, "ncptl.h"), os.path.join(tempdir, "ncptl"))
+    os.environ["includedir"] = tempdir
+    os.environ["libdir"] = os.path.join(builddir, ".libs")
+    os.environ["LD_LIBRARY_PATH"] = os.path.join(builddir, ".libs") + os.pathsep + \
+                                    os.environ.get("LD_LIBRARY_PATH", "")
+    programname = os.path.join(tempdir, "profile.ncptl")
+    progfile = open(programname, "w")
+    progfile.write(program)
+    progfile.close()
+    exename = os.path.join(tempdir, "profile")
+    exitcode, output = run([sys.executable, ncptl, "--quiet", "--no-cache",
+                            "--backend=c_profile", "--output=%s" % exename,
+                            programname, "--profile=c_seq"])
+    if exitcode != 0:
+        fail("ncptl --backend=c_profile failed:\n%s" % output)
+    logtmpl = os.path.join(tempdir, "profile-%p.log")
+    exitcode, output = run([exename, "--logfile=%s" % logtmpl])
+    if exitcode != 0:
+        fail("the c_profile program failed:\n%s" % output)
+    logfile = open(string.replace(logtmpl, "%p", "0"))
+    loglines = logfile.readlines()
+    logfile.close()
+finally:
+    shutil.rmtree(tempdir, 1)
+
+# Extract the profiles from the log file's comments.
+latency_re = re.compile(r'^# Profile of (\w+) latency at line ([-\d]+) \(p50, p99, p99\.9 microseconds, count\): (\d+) (\d+) (\d+) (\d+)$')
+total_re = re.compile(r'^# Profile of (\w+) \(microseconds, count, average\): \d+ (\d+) [\d.]+$')
+profiles = []
+latency_tallies = {}
+total_tallies = {}
+for oneline in loglines:
+    latency_match = latency_re.match(oneline)
+    if latency_match:
+        evtype, lines = latency_match.group(1, 2)
+        p50, p99, p999, count = map(int, latency_match.group(3, 4, 5, 6))
+        if not p50 <= p99 <= p999:
+            fail("the percentiles of %s at line %s are out of order: %s" %
+                 (evtype, lines, repr(oneline)))
+        profiles.append((evtype, lines, count))
+        latency_tallies[evtype] = latency_tallies.get(evtype, 0) + count
+        continue
+    total_match = total_re.match(oneline)
+    if total_match:
+        total_tallies[total_match.group(1)] = int(total_match.group(2))
+
+# Every event must be profiled exactly once, both by source line and
+# by event type.
+if profiles != expected_profiles:
+    fail("c_profile logged latency profiles %s instead of %s" %
+         (repr(profiles), repr(expected_profiles)))
+if total_tallies != latency_tallies:
+    fail("c_profile logged per-type event counts %s but per-line counts %s" %
+         (repr(total_tallies), repr(latency_tallies)))
@@ -0,0 +1,231 @@
+#! /usr/bin/env python
+
+########################################################################
+#
+# Compare the time the semantic analyzer takes when it fuses its passes
+# into a few AST traversals with the time it takes when every pass
+# traverses the AST on its own, and ensure that both produce the same
+# annotated AST and the same generated code
+#
+# By Scott Pakin <pakin@lanl.gov>
+#
+# ----------------------------------------------------------------------
+# 
+# Copyright (C) 2003, Triad National Security, LLC
+# All rights reserved.
+# 
+# Copyright (2003).  Triad National Security, LLC.  This software
+# was produced under U.S. Government contract 89233218CNA000001 for
+# Los Alamos National Laboratory (LANL), which is operated by Los
+# Alamos National Security, LLC (Triad) for the U.S. Department
+# of Energy. The U.S. Government has rights to use, reproduce,
+# and distribute this software.  NEITHER THE GOVERNMENT NOR TRIAD
+# MAKES ANY WARRANTY, EXPRESS OR IMPLIED, OR ASSUMES ANY LIABILITY
+# FOR THE USE OF THIS SOFTWARE. If software is modified to produce
+# derivative works, such modified software should be clearly marked,
+# so as not to confuse it with the version available from LANL.
+# 
+# Additionally, redistribution and use in source and binary forms,
+# with or without modification, are permitted provided that the
+# following conditions are met:
+# 
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+# 
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer
+#     in the documentation and/or other materials provided with the
+#     distribution.
+# 
+#   * Neither the name of Triad National Security, LLC, Los Alamos
+#     National Laboratory, the U.S. Government, nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY TRIAD AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL TRIAD OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY,
+# OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT
+# OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE
+# OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# 
+#
+########################################################################
+
+import sys
+import os
+import string
+import time
+import glob
+import re
+import types
+try:
+    import cPickle
+    pickle = cPickle
+except ImportError:
+    import pickle
+from testutil import progname, srcdir, fail, Options, TimingTable
+
+# Define some global variables
+blocksize = 100                          # Statements per THEN-separated block
+
+def synthesize(numstmts):
+    """
+         Return a program containing NUMSTMTS simple statements.  The
+         statements are grouped into blocks so that building the
+         parser's statement lists doesn't dominate the run time.
+    """
+    stmtforms = ['task %d outputs "Hello"',
+                 'task 0 computes for %d microseconds',
+                 'all tasks t send a %d byte message to task t+1',
+                 'let x be %d while task x sleeps for x microseconds']
+    stmtlist = []
+    for stmtnum in xrange(numstmts):
+        stmtlist.append(stmtforms[stmtnum % len(stmtforms)] % stmtnum)
+    blocklist = []
+    for firststmt in xrange(0, numstmts, blocksize):
+        blocklist.append("{%s}" % string.join(stmtlist[firststmt:firststmt+blocksize], " then "))
+    return string.join(blocklist, ".\n") + ".\n"
+
+def parse(sourcecode, filesource):
+    "Lex and parse a program and return the AST in pickled form."
+    lexer = NCPTL_Lexer()
+    parser = NCPTL_Parser(lexer)
+    tokenlist = lexer.tokenize(sourcecode, filesource=filesource)
+    return pickle.dumps(parser.parsetokens(tokenlist, filesource=filesource), 2)
+
+def measure(pickled_ast, filesource, fuse_passes):
+    """
+         Analyze a fresh copy of a pickled AST either with or without
+         fusing the analysis passes.  Return the elapsed time in seconds
+         and the annotated AST.
+    """
+    syntree = pickle.loads(pickled_ast)
+    semantic = NCPTL_Semantic()
+    semantic.fuse_passes = fuse_passes
+    starttime = time.time()
+    syntree = semantic.analyze(syntree, filesource=filesource)
+    return (time.time() - starttime, syntree)
+
+def describe(syntree):
+    """
+         Return a comparable description of every node in an annotated
+         AST.  References to other nodes are described by the node's
+         position in a preorder traversal; the semantic analyzer
+         itself, which the AST references, is omitted.
+    """
+    nodenum = {}
+    nodelist = []
+    pending = [syntree]
+    while pending:
+        node = pending.pop()
+        if nodenum.has_key(id(node)):
+            continue
+        nodenum[id(node)] = len(nodelist)
+        nodelist.append(node)
+        kids = list(node.kids)
+        kids.reverse()
+        pending.extend(kids)
+    def canonicalize(obj, nodenum=nodenum):
+        if isinstance(obj, AST):
+            try:
+                return ("AST", nodenum[id(obj)])
+            except KeyError:
+                return ("AST", obj.type, obj.printable)
+        if isinstance(obj, NCPTL_Semantic):
+            return "NCPTL_Semantic"
+        if type(obj) == types.DictType:
+            items = map(lambda (key, value): (canonicalize(key), canonicalize(value)),
+                        obj.items())
+            items.sort()
+            return items
+        if type(obj) in (types.ListType, types.TupleType):
+            return map(canonicalize, obj)
+        if type(obj) == types.InstanceType:
+            return (obj.__class__.__name__, canonicalize(obj.__dict__))
+        return repr(obj)
+    return map(lambda node: canonicalize(node.__dict__), nodelist)
+
+def generate(syntree, filesource, sourcecode):
+    "Return the code the backend generates from an annotated AST."
+    codegen = NCPTL_CodeGen([])
+    codelines = codegen.generate(syntree, filesource=filesource, filetarget="-",
+                                 sourcecode=sourcecode)
+    return filter(lambda oneline: not timestamp_re.search(oneline), codelines)
+
+def compare(pickled_ast, filesource, label, sourcecode=None):
+    """
+         Report the time to analyze an AST with and without pass
+         fusion.  Fail if the two analyses produce different ASTs or,
+         given the source code, different generated code.
+    """
+    separate = []
+    fused = []
+    for trial in range(options.trials):
+        separate.append(measure(pickled_ast, filesource, 0))
+        fused.append(measure(pickled_ast, filesource, 1))
+    separate_tree = separate[0][1]
+    fused_tree = fused[0][1]
+    if describe(separate_tree) != describe(fused_tree):
+        fail("%s: fusing passes changed the annotated AST" % label)
+    if sourcecode != None:
+        if generate(separate_tree, filesource, sourcecode) != generate(fused_tree, filesource, sourcecode):
+            fail("%s: fusing passes changed the code generated by the %s backend" %
+                 (label, options.backend))
+    separate = min(map(lambda result: result[0], separate))
+    fused = min(map(lambda result: result[0], fused))
+    table.row(label, separate, fused, separate/fused)
+    return (separate, fused)
+
+# Parse the command line.
+options = Options([
+    # Long name, short name, kind, default, benchmark default
+    ("statements", "s", "count", 500, 100000),
+    ("trials", "t", "int", 1, 3),
+    ("backend", "b", "string", "c_mpi", "c_mpi")],
+                  "[<file.ncptl>...]")
+args = options.args
+if args == []:
+    args = glob.glob(os.path.join(srcdir, "examples", "*.ncptl"))
+    args.sort()
+
+# Import the compiler front end from the source directory.
+sys.path.insert(0, srcdir)
+from ncptl_lexer import NCPTL_Lexer
+from ncptl_parser import NCPTL_Parser
+from ncptl_semantic import NCPTL_Semantic
+from ncptl_ast import AST
+NCPTL_CodeGen = __import__("codegen_" + options.backend).NCPTL_CodeGen
+timestamp_re = re.compile(r'generated by coNCePTuaL on')
+
+# Analyze each program with and without pass fusion.
+table = TimingTable(options.benchmark, [("Program", "%-24s"),
+                                        ("Separate", "%10.4f"),
+                                        ("Fused", "%10.4f"),
+                                        ("Speedup", "%8.2fx")])
+total_separate = 0.0
+total_fused = 0.0
+for filename in args:
+    infile = open(filename)
+    sourcecode = infile.read()
+    infile.close()
+    label = os.path.basename(filename)
+    separate, fused = compare(parse(sourcecode, filename), filename, label, sourcecode)
+    total_separate = total_separate + separate
+    total_fused = total_fused + fused
+if len(args) > 1:
+    table.row("[all of the above]", total_separate, total_fused,
+              total_separate/total_fused)
+
+# Analyze a large, synthetic program.
+if options.statements > 0:
+    if options.benchmark:
+        sys.stderr.write("%s: parsing a synthetic %d-statement program ...\n" %
+                         (progname, options.statements))
+    compare(parse(synthesize(options.statements), "<synthetic>"), "<synthetic>",
+            "[%d statements]" % options.statements)
@@ -0,0 +1,226 @@
+########################################################################
+#
+# Helper functions and classes shared by the Python scripts that test
+# and benchmark the coNCePTuaL compiler and its tools
+#
+# By Scott Pakin <pakin@lanl.gov>
+#
+# ----------------------------------------------------------------------
+# 
+# Copyright (C) 2003, Triad National Security, LLC
+# All rights reserved.
+# 
+# Copyright (2003).  Triad National Security, LLC.  This software
+# was produced under U.S. Government contract 89233218CNA000001 for
+# Los Alamos National Laboratory (LANL), which is operated by Los
+# Alamos National Security, LLC (Triad) for the U.S. Department
+# of Energy. The U.S. Government has rights to use, reproduce,
+# and distribute this software.  NEITHER THE GOVERNMENT NOR TRIAD
+# MAKES ANY WARRANTY, EXPRESS OR IMPLIED, OR ASSUMES ANY LIABILITY
+# FOR THE USE OF THIS SOFTWARE. If software is modified to produce
+# derivative works, such modified software should be clearly marked,
+# so as not to confuse it with the version available from LANL.
+# 
+# Additionally, redistribution and use in source and binary forms,
+# with or without modification, are permitted provided that the
+# following conditions are met:
+# 
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+# 
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer
+#     in the documentation and/or other materials provided with the
+#     distribution.
+# 
+#   * Neither the name of Triad National Security, LLC, Los Alamos
+#     National Laboratory, the U.S. Government, nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY TRIAD AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL TRIAD OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY,
+# OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT
+# OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE
+# OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# 
+#
+########################################################################
+
+
+import sys
+import os
+import string
+import re
+import getopt
+
+# Define some global variables
+progname = os.path.basename(sys.argv[0]) # Test script's name
+srcdir = os.path.dirname(os.path.dirname(os.path.abspath(sys.argv[0])))
+try:
+    builddir = os.path.abspath(os.environ["top_builddir"])
+except KeyError:
+    builddir = srcdir
+
+
+def fail(message):
+    "Report a failed test and exit."
+    sys.stderr.write("%s: %s\n" % (progname, message))
+    sys.exit(1)
+
+def skip(message):
+    "Report that a test cannot be run here and exit."
+    sys.stderr.write("%s: skipping: %s\n" % (progname, message))
+    sys.exit(77)
+
+def find_perl_tool(toolname):
+    """
+         Return the name of one of coNCePTuaL's Perl tools, looking
+         first in the build directory and then in the source
+         directory.  Skip the test if the tool doesn't exist or if
+         Perl can't compile it (e.g., for lack of a required module).
+    """
+    for dirname in [builddir, srcdir]:
+        toolfile = os.path.join(dirname, toolname)
+        if os.access(toolfile, os.X_OK):
+            break
+    else:
+        skip("%s has not been built" % toolname)
+    if os.system("perl -c %s >%s 2>&1" % (toolfile, os.devnull)) != 0:
+        skip("perl cannot run %s" % toolfile)
+    return toolfile
+
+
+###########################################################################
+
+class Options:
+    """
+       Command-line options for a test script.  Every script accepts
+       --help and --benchmark.  A script runs quickly and silently by
+       default, as "make check" expects.  --benchmark selects larger
+       problem sizes, more trials, and a table of timings.  The value
+       of each option is available as an attribute named after its
+       long form, with dashes replaced by underscores.
+    """
+
+    def __init__(self, optionlist, argsusage=""):
+        """
+             Parse the command line.  OPTIONLIST is a list of {long
+             name, short name, kind, default, benchmark default}
+             tuples.  KIND is "int" for a positive integer, "count"
+             for a nonnegative integer, "ints" for a comma-separated
+             list of positive integers, or "string".  ARGSUSAGE
+             describes any non-option arguments, which are returned
+             in ARGS.
+        """
+        self.optionlist = optionlist
+        self.argsusage = argsusage
+        self.benchmark = 0
+        longopts = ["help", "benchmark"]
+        shortopts = "hB"
+        for longname, shortname, kind, default, bench_default in optionlist:
+            longopts.append(longname + "=")
+            shortopts = shortopts + shortname + ":"
+        try:
+            opts, self.args = getopt.getopt(sys.argv[1:], shortopts, longopts)
+        except getopt.error, errmsg:
+            sys.stderr.write("%s: %s\n" % (progname, errmsg))
+            sys.exit(1)
+
+        # Set the defaults then override them with the user's values.
+        for opt, optarg in opts:
+            if opt in ("-h", "--help"):
+                self.usage(0)
+            elif opt in ("-B", "--benchmark"):
+                self.benchmark = 1
+        for longname, shortname, kind, default, bench_default in optionlist:
+            if self.benchmark:
+                default = bench_default
+            setattr(self, string.replace(longname, "-", "_"), default)
+        for opt, optarg in opts:
+            for longname, shortname, kind, default, bench_default in optionlist:
+                if opt in ("-" + shortname, "--" + longname):
+                    setattr(self, string.replace(longname, "-", "_"),
+                            self._convert(opt, optarg, kind))
+
+    def _convert(self, opt, optarg, kind):
+        "Convert an option's argument to the given kind of value."
+        if kind == "string":
+            return optarg
+        try:
+            values = map(int, string.split(optarg, ","))
+            if kind != "ints" and len(values) != 1:
+                raise ValueError
+            if kind == "count":
+                minimum = 0
+            else:
+                minimum = 1
+            if min(values) < minimum:
+                raise ValueError
+        except ValueError:
+            if kind == "count":
+                expected = "a nonnegative integer"
+            elif kind == "ints":
+                expected = "positive integers"
+            else:
+                expected = "a positive integer"
+            sys.stderr.write('%s: %s expects %s but was given "%s"\n' %
+                             (progname, opt, expected, optarg))
+            sys.exit(1)
+        if kind == "ints":
+            return values
+        return values[0]
+
+    def usage(self, exitcode):
+        "Provide a usage message."
+        metavars = {"int"    : "<num>",
+                    "count"  : "<num>",
+                    "ints"   : "<num>[,<num>...]",
+                    "string" : "<string>"}
+        usagelist = ["[--help]", "[--benchmark]"]
+        for longname, shortname, kind, default, bench_default in self.optionlist:
+            usagelist.append("[--%s=%s]" % (longname, metavars[kind]))
+        if self.argsusage:
+            usagelist.append(self.argsusage)
+        print "Usage: %s %s" % (progname, string.join(usagelist))
+        sys.exit(exitcode)
+
+
+###########################################################################
+
+class TimingTable:
+    """
+       A table of measurements that is printed only when a script is
+       run with --benchmark.
+    """
+
+    def __init__(self, benchmark, columns):
+        """
+             Print the table's header row if BENCHMARK is true.
+             COLUMNS is a list of {heading, format} pairs, where each
+             format is the printf-style conversion used for that
+             column's values (e.g., "%8d" or "%-24s").
+        """
+        self.benchmark = benchmark
+        self.rowformat = string.join(map(lambda (heading, format): format, columns))
+        headings = []
+        for heading, format in columns:
+            width = re.match(r'%(-?\d*)', format).group(1)
+            headings.append(("%" + width + "s") % heading)
+        self._write(string.join(headings))
+
+    def row(self, *values):
+        "Print one row of the table if benchmarking."
+        self._write(self.rowformat % values)
+
+    def _write(self, oneline):
+        "Output a line if benchmarking."
+        if self.benchmark:
+            print oneline
+            sys.stdout.flush()
@@ -0,0 +1,208 @@
+#! /usr/bin/env python
+
+########################################################################
+#
+# Ensure that the c_trace backend traces every event a program
+# allocates, that event-list compaction doesn't change a program's
+# output, and that a binary trace decodes to the same records as a
+# text trace
+#
+# By Scott Pakin <pakin@lanl.gov>
+#
+# ----------------------------------------------------------------------
+# 
+# Copyright (C) 2003, Triad National Security, LLC
+# All rights reserved.
+# 
+# Copyright (2003).  Triad National Security, LLC.  This software
+# was produced under U.S. Government contract 89233218CNA000001 for
+# Los Alamos National Laboratory (LANL), which is operated by Los
+# Alamos National Security, LLC (Triad) for the U.S. Department
+# of Energy. The U.S. Government has rights to use, reproduce,
+# and distribute this software.  NEITHER THE GOVERNMENT NOR TRIAD
+# MAKES ANY WARRANTY, EXPRESS OR IMPLIED, OR ASSUMES ANY LIABILITY
+# FOR THE USE OF THIS SOFTWARE. If software is modified to produce
+# derivative works, such modified software should be clearly marked,
+# so as not to confuse it with the version available from LANL.
+# 
+# Additionally, redistribution and use in source and binary forms,
+# with or without modification, are permitted provided that the
+# following conditions are met:
+# 
+#   * Redistributions of source code must retain the above copyright
+#     notice, this list of conditions and the following disclaimer.
+# 
+#   * Redistributions in binary form must reproduce the above copyright
+#     notice, this list of conditions and the following disclaimer
+#     in the documentation and/or other materials provided with the
+#     distribution.
+# 
+#   * Neither the name of Triad National Security, LLC, Los Alamos
+#     National Laboratory, the U.S. Government, nor the names of its
+#     contributors may be used to endorse or promote products derived
+#     from this software without specific prior written permission.
+# 
+# THIS SOFTWARE IS PROVIDED BY TRIAD AND CONTRIBUTORS "AS IS" AND ANY
+# EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR
+# PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL TRIAD OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY,
+# OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT
+# OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR
+# BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY,
+# WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE
+# OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE,
+# EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+# 
+#
+########################################################################
+
+import sys
+import os
+import string
+import re
+import glob
+import tempfile
+import shutil
+
+# Define some global variables
+progname = os.path.basename(sys.argv[0]) # This program's name
+srcdir = os.path.dirname(os.path.dirname(os.path.abspath(sys.argv[0])))
+ncptl = os.path.join(srcdir, "ncptl.py") # coNCePTuaL compiler front end
+tracedecoder = os.path.join(srcdir, "ncptl_tracefile.py") # Binary trace decoder
+builddir = os.path.abspath(os.environ.get("top_builddir", srcdir))
+
+# Define a program whose event list compaction would shrink because
+# compaction deletes zero-length delays.
+program = """For each i in {1, ..., 8}
+  task 0 computes for 0 microseconds then
+task 0 sleeps for 0 microseconds.
+
+Task 0 resets its counters.
+
+For 3 repetitions
+  task 0 outputs "done".
+"""
+
+# Define the trace c_trace must produce: one line per event allocated.
+expected_trace = [("DELAY", 2)] * 8 + [("DELAY", 3), ("RESET", 5)] + [("CODE", 8)] * 3
+
+def fail(message):
+    "Report a failed test and exit."
+    sys.stderr.write("%s: %s\n" % (progname, message))
+    sys.exit(1)
+
+def run(command):
+    "Run a command and return its exit status and combined output."
+    outfile = tempfile.TemporaryFile()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.dup2(outfile.fileno(), 1)
+            os.dup2(outfile.fileno(), 2)
+            os.execv(command[0], command)
+        finally:
+            os._exit(127)
+    status = os.waitpid(pid, 0)[1]
+    outfile.seek(0)
+    output = outfile.read()
+    outfile.close()
+    if os.WIFSIGNALED(status):
+        return (128 + os.WTERMSIG(status), output)
+    return (os.WEXITSTATUS(status), output)
+
+# Skip the test if the run-time library wasn't built.
+if not glob.glob(os.path.join(builddir, ".libs", "libncptl.*")):
+    sys.stderr.write("%s: the run-time library is not in %s\n" % (progname, builddir))
+    sys.exit(77)
+
+# The generated code includes <ncptl/ncptl.h> so we make the header
+# from the build directory look installed.
+tempdir = tempfile.mkdtemp()
+try:
+    os.mkdir(os.path.join(tempdir, "ncptl"))
+    shutil.copy(os.path.join(builddir, "ncptl.h"), os.path.join(tempdir, "ncptl"))
+    os.environ["includedir"] = tempdir
+    os.environ["libdir"] = os.path.join(builddir, ".libs")
+    os.environ["LD_LIBRARY_PATH"] = os.path.join(builddir, ".libs") + os.pathsep + \
+                                    os.environ.get("LD_LIBRARY_PATH", "")
+    programname = os.path.join(tempdir, "trace.ncptl")
+    progfile = open(programname, "w")
+    progfile.write(program)
+    progfile.close()
+
+    # Build and run the program with c_seq and with c_trace atop c_seq
+    # in both trace formats.
+    outputs = {}
+    for backend, exename, backend_args in [
+        ("c_seq", "c_seq", []),
+        ("c_trace", "c_trace", ["--trace=c_seq"]),
+        ("c_trace", "c_trace_binary", ["--trace=c_seq", "--trace-format=binary"])]:
+        exename = os.path.join(tempdir, exename)
+        command = [sys.executable, ncptl, "--quiet", "--no-cache",
+                   "--backend=%s" % backend, "--output=%s" % exename,
+                   programname] + backend_args
+        exitcode, output = run(command)
+        if exitcode != 0:
+            fail("ncptl --backend=%s %s failed:\n%s" %
+                 (backend, string.join(backend_args), output))
+        outputs[os.path.basename(exename)] = exename
+
+    # Run the c_seq and text-trace programs.
+    for exename in ["c_seq", "c_trace"]:
+        exitcode, output = run([outputs[exename], "--logfile="])
+        if exitcode != 0:
+            fail("the %s program failed:\n%s" % (exename, output))
+        outputs[exename] = output
+
+    # Run the binary-trace program once with the default buffer size
+    # and once with a buffer small enough to force flushes mid-run.
+    # The trace-file template repeats "%p" to ensure that every
+    # occurrence is expanded.
+    binary_traces = []
+    for tracebuffer in [None, 3]:
+        tracetmpl = os.path.join(tempdir, "trace-%p-%p-%p-%p.trace")
+        tracename = os.path.join(tempdir, "trace-0-0-0-0.trace")
+        command = [outputs["c_trace_binary"], "--logfile=", "--tracefile=%s" % tracetmpl]
+        if tracebuffer != None:
+            command.append("--tracebuffer=%d" % tracebuffer)
+        exitcode, output = run(command)
+        if exitcode != 0:
+            fail("the c_trace program failed with %s:\n%s" % (string.join(command[1:]), output))
+        if output != outputs["c_seq"]:
+            fail("the binary-trace program output %s instead of %s" %
+                 (repr(output), repr(outputs["c_seq"])))
+        exitcode, output = run([sys.executable, tracedecoder, tracename])
+        if exitcode != 0:
+            fail("%s failed:\n%s" % (tracedecoder, output))
+        binary_traces.append((tracebuffer, output))
+        os.remove(tracename)
+finally:
+    shutil.rmtree(tempdir, 1)
+
+# Separate the trace from the program's own output.
+trace_re = re.compile(r'^\[TRACE\] .*action: (\w+) \| event: (\d+) / (\d+) \| lines: (\d+) - \d+$')
+trace = []
+program_output = []
+for oneline in string.split(outputs["c_trace"], "\n"):
+    trace_match = trace_re.match(oneline)
+    if trace_match:
+        action, eventnum, numevents, lineno = trace_match.groups()
+        trace.append((action, int(lineno)))
+        if int(eventnum) != len(trace) or int(numevents) != len(expected_trace):
+            fail("c_trace reported event %s of %s; expected event %d of %d" %
+                 (eventnum, numevents, len(trace), len(expected_trace)))
+    else:
+        program_output.append(oneline)
+if trace != expected_trace:
+    fail("c_trace traced %s instead of %s" % (repr(trace), repr(expected_trace)))
+if string.join(program_output, "\n") != outputs["c_seq"]:
+    fail("compaction changed the program's output from %s to %s" %
+         (repr(string.join(program_output, "\n")), repr(outputs["c_seq"])))
+
+# A decoded binary trace must match the text trace line for line.
+text_trace = filter(trace_re.match, string.split(outputs["c_trace"], "\n"))
+for tracebuffer, output in binary_traces:
+    if string.split(output, "\n")[:-1] != text_trace:
+        fail("the binary trace (--tracebuffer=%s) decoded to %s instead of %s" %
+             (tracebuffer, repr(output), repr(string.join(text_trace, "\n"))))